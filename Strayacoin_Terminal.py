@@ -1,5 +1,3 @@
-import tkinter as tk
-from tkinter import ttk, scrolledtext
 import os
 import json
 import subprocess
@@ -8,78 +6,4430 @@ from datetime import datetime
 import platform
 import threading
 import math
-import requests
-
-class ThemedStyle(ttk.Style):
-    def __init__(self, root, theme_data):
-        super().__init__(root)
-        self.theme_data = theme_data
-        self.configure_theme()
-
-    def configure_theme(self):
-        # Only create theme if it doesn't exist
-        if "straya" not in self.theme_names():
-            self.theme_create("straya", parent="alt", settings={
-                ".": {
-                    "configure": {
-                        "background": self.theme_data["background"],
-                        "foreground": self.theme_data["foreground"],
-                        "troughcolor": self.theme_data["background"],
-                        "selectbackground": self.theme_data["statusbar"],
-                        "selectforeground": self.theme_data["foreground"],
-                        "fieldbackground": self.theme_data["background"],
-                        "insertbackground": self.theme_data["foreground"],
-                        "highlightcolor": self.theme_data["background"]
-                    }
-                },
-                "TFrame": {
-                    "configure": {
-                        "background": self.theme_data["background"],
-                        "borderwidth": 0
-                    }
-                },
-                "TLabel": {
-                    "configure": {
-                        "background": self.theme_data["background"],
-                        "foreground": self.theme_data["foreground"],
-                        "font": ('Consolas', 12)
-                    }
-                },
-                "TEntry": {
-                    "configure": {
-                        "fieldbackground": self.theme_data["background"],
-                        "foreground": self.theme_data["foreground"],
-                        "insertcolor": self.theme_data["foreground"],
-                        "font": ('Consolas', 12),
-                        "borderwidth": 1,
-                        "relief": "flat"
-                    }
-                },
-                "TButton": {
-                    "configure": {
-                        "background": self.theme_data["statusbar"],
-                        "foreground": self.theme_data["foreground"],
-                        "font": ('Consolas', 10)
-                    }
-                },
-                "TMenubutton": {
-                    "configure": {
-                        "background": self.theme_data["background"],
-                        "foreground": self.theme_data["foreground"]
-                    }
-                }
+import time
+import socket
+import ssl
+import asyncio
+import urllib.parse
+import base64
+import queue
+import http.client
+import http.server
+import functools
+import csv
+import sqlite3
+import hashlib
+import signal
+import codecs
+import locale
+import tempfile
+import importlib.util
+import re
+import fnmatch
+from decimal import Decimal, InvalidOperation
+import concurrent.futures
+import struct
+import mmap
+import bisect
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+
+# Tkinter and requests are imported on first use, so headless runs never load them
+tk = ttk = scrolledtext = None
+
+# Compiled themes are cached in this file inside the themes folder
+THEME_CACHE = ".themes.cache"
+THEME_CACHE_VERSION = 1
+
+# Default daemon RPC port, override with rpcport= in Strayacoin.conf
+DEFAULT_RPC_PORT = 9882
+# generate blocks until a block is found, so keep this generous
+RPC_TIMEOUT = 300
+# Calls with side effects; these are never sent a second time automatically
+UNREPEATABLE_RPC_PREFIXES = ("send", "generate", "move")
+
+EXPLORER_PEERS_URL = "https://explorer.strayacoin.com/api/getconnectioncount"
+EXPLORER_SUPPLY_URL = "https://explorer.strayacoin.com/ext/getmoneysupply"
+EXPLORER_TIMEOUT = 5
+# Overall wait for one fan-out of explorer/exchange requests
+FETCH_DEADLINE = 8
+# Idle keep-alive connections kept per host between polls
+FETCH_IDLE_PER_HOST = 4
+TRADEOGRE_TICKER_URL = "https://tradeogre.com/api/v1/ticker/NAH-BTC"
+# Seconds a fetched ticker is served before it is refreshed
+TICKER_TTL = 30
+TICKER_TIMEOUT = 5
+# Seconds between background network stats polls while mining
+STATS_POLL_INTERVAL = 15
+# Local UDP port the --notify helper reports new blocks and transactions to,
+# the fallback poll period while notifications arrive and the least time
+# between refreshes caused by transactions
+NOTIFY_PORT = 9898
+NOTIFY_FALLBACK_INTERVAL = 300
+NOTIFY_TX_REFRESH = 5
+# Output queue drain period and the most chunks merged into one frame
+OUTPUT_FLUSH_MS = 30
+OUTPUT_MAX_CHUNKS = 2000
+# Lines kept in the output widget; older lines are trimmed in bulk
+SCROLLBACK_LINES = 5000
+SCROLLBACK_LOG = "scrollback.log"
+SCROLLBACK_SEARCH_LIMIT = 200
+# Hashing attempts per generate call, None to use the daemon default
+MINING_MAX_TRIES = None
+# Latency samples kept per metric and the window rolling rates are taken over
+METRICS_SAMPLES = 1000
+METRICS_RATE_WINDOW = 60
+# Status bar refresh period while the terminal is open
+STATUS_REFRESH_MS = 1000
+
+# Wallet calls run on this many worker threads and are cancelled after the timeout
+WALLET_WORKERS = 4
+WALLET_TIMEOUT = 60
+
+# 'ls' entries shown per page and the line width its columns are packed into
+LS_PAGE_SIZE = 500
+LS_WIDTH = 100
+
+# Typed commands, shared by every window; the file is compacted to the newest
+# COMMAND_HISTORY_LIMIT lines once it grows a quarter past it. Tab completion
+# indexes the newest COMPLETION_HISTORY of them
+COMMAND_HISTORY_FILE = "command_history.txt"
+COMMAND_HISTORY_LIMIT = 100000
+COMPLETION_HISTORY = 20000
+# Trigram line lists reverse search keeps before starting afresh
+COMMAND_HISTORY_GRAMS = 512
+
+# Folder of plugin modules, each adding commands when first used, and the most
+# candidates Tab completion offers
+PLUGINS_DIR = "plugins"
+COMPLETION_LIMIT = 50
+
+# System commands: bytes read per chunk, output shown per job before the rest is
+# written to a spill file, and seconds 'kill' waits before forcing a job down
+SHELL_CHUNK = 4096
+SHELL_OUTPUT_LIMIT = 256 * 1024
+SHELL_KILL_GRACE = 3
+
+# Outputs per sendmany call for 'wallet payout' and addresses per validateaddress batch
+PAYOUT_BATCH_SIZE = 100
+PAYOUT_VALIDATE_CHUNK = 500
+# Recent wallet transactions searched when resuming an interrupted payout batch
+PAYOUT_RECOVERY_SCAN = 1000
+
+# Local wallet transaction index and how many rows 'wallet tx' shows by default
+TX_INDEX_FILE = "wallet_index.sqlite"
+TX_QUERY_LIMIT = 20
+
+# Block and transaction lookups: entries kept in memory, confirmations after which
+# an object is cached for good on disk, and how long anything nearer the tip lives
+CHAIN_CACHE_FILE = "chain_cache.sqlite"
+CHAIN_CACHE_SIZE = 512
+CHAIN_DEEP_CONFIRMATIONS = 100
+CHAIN_TIP_TTL = 15
+# Outputs listed by the 'tx' command
+TX_SHOW_OUTPUTS = 10
+
+# Per-block snapshot history and the rows 'history last' shows by default
+HISTORY_FILE = "history.bin"
+HISTORY_LAST_ROWS = 10
+# Samples per rolling window and EWMA span used by 'analyze' unless given
+ANALYZE_WINDOW = 60
+
+# Prometheus exporter, off unless started with 'exporter on' or --exporter
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9899
+
+# Adaptive mining ('mine -a'): coins per block for the expected-value model,
+# default thresholds, batch bounds and the pause before re-checking stats
+SCHEDULE_BLOCK_REWARD = 1.0
+SCHEDULE_MIN_EV = 0.0
+SCHEDULE_MAX_DIFFICULTY = float('inf')
+SCHEDULE_MIN_PRICE = 0.0
+SCHEDULE_MIN_BATCH = 1
+SCHEDULE_MAX_BATCH = 10
+SCHEDULE_PAUSE = 60
+# Block target used to turn a hashrate share into blocks per hour
+BLOCK_TIME = 60
+
+# Extra node endpoints for multi-node mining
+NODES_FILE = "nodes.json"
+
+def load_tk():
+    """Import Tkinter into the module globals the GUI classes use"""
+    global tk, ttk, scrolledtext
+    if tk is None:
+        import tkinter
+        from tkinter import ttk as tk_ttk, scrolledtext as tk_scrolledtext
+        tk, ttk, scrolledtext = tkinter, tk_ttk, tk_scrolledtext
+    return tk
+
+THEME_COLORS = ("background", "foreground", "prompt", "output", "error", "warning", "success", "statusbar")
+THEME_COLOR_PATTERN = re.compile(r"#(?:[0-9a-fA-F]{3}){1,4}|[A-Za-z][A-Za-z0-9 ]*")
+
+def compile_theme(colors):
+    """Validate a theme's colours and precompute the ttk, menu and tag settings made from them"""
+    missing = [key for key in THEME_COLORS if key not in colors]
+    if missing:
+        raise ValueError(f"missing colours: {', '.join(missing)}")
+    bad = [key for key in THEME_COLORS if not isinstance(colors[key], str) or not THEME_COLOR_PATTERN.fullmatch(colors[key])]
+    if bad:
+        raise ValueError(f"invalid colours: {', '.join(bad)}")
+    colors = {key: colors[key] for key in THEME_COLORS}
+    return {
+        "colors": colors,
+        "ttk": {
+            ".": {
+                "background": colors["background"],
+                "foreground": colors["foreground"],
+                "troughcolor": colors["background"],
+                "selectbackground": colors["statusbar"],
+                "selectforeground": colors["foreground"],
+                "fieldbackground": colors["background"],
+                "insertbackground": colors["foreground"],
+                "highlightcolor": colors["background"]
+            },
+            "TFrame": {
+                "background": colors["background"],
+                "borderwidth": 0
+            },
+            "TLabel": {
+                "background": colors["background"],
+                "foreground": colors["foreground"],
+                "font": ('Consolas', 12)
+            },
+            "TEntry": {
+                "fieldbackground": colors["background"],
+                "foreground": colors["foreground"],
+                "insertcolor": colors["foreground"],
+                "font": ('Consolas', 12),
+                "borderwidth": 1,
+                "relief": "flat"
+            },
+            "TButton": {
+                "background": colors["statusbar"],
+                "foreground": colors["foreground"],
+                "font": ('Consolas', 10)
+            },
+            "TMenubutton": {
+                "background": colors["background"],
+                "foreground": colors["foreground"]
+            }
+        },
+        "menu": {
+            "bg": colors["background"],
+            "fg": colors["foreground"],
+            "activebackground": colors["statusbar"],
+            "activeforeground": colors["foreground"]
+        },
+        "text": {
+            "bg": colors["background"],
+            "fg": colors["foreground"],
+            "insertbackground": colors["foreground"]
+        },
+        "tags": {tag: colors[tag] for tag in ("error", "warning", "success", "output")}
+    }
+
+def load_theme_registry(themes_dir="themes", cache_name=THEME_CACHE):
+    """Compiled themes from the JSON files in themes_dir, as ({name: theme}, [errors]).
+
+    Compiled files are stored as JSON in cache_name next to them and reused
+    while a file's mtime and size are unchanged, so only new or edited files are
+    parsed. The cache is plain data, so a shared themes folder cannot run code.
+    """
+    cache_path = os.path.join(themes_dir, cache_name)
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached.get("version") != THEME_CACHE_VERSION:
+            cached = {}
+    except (OSError, ValueError, AttributeError):
+        # Missing or corrupt
+        cached = {}
+    cached_files = cached.get("files", {})
+    if not isinstance(cached_files, dict):
+        cached_files = {}
+    files = {}
+    with os.scandir(themes_dir) as it:
+        for entry in it:
+            if not entry.name.endswith(".json"):
+                continue
+            info = entry.stat()
+            signature = [info.st_mtime_ns, info.st_size]
+            previous = cached_files.get(entry.name)
+            if isinstance(previous, list) and len(previous) == 3 and previous[0] == signature:
+                files[entry.name] = previous
+                continue
+            try:
+                with open(entry.path, "r", encoding='utf-8') as f:
+                    theme = json.load(f)
+                files[entry.name] = [signature, theme["name"], compile_theme(theme["colors"])]
+            except Exception as e:
+                files[entry.name] = [signature, None, str(e)]
+    if files != cached_files:
+        try:
+            with open(cache_path, "w", encoding="utf-8") as f:
+                json.dump({"version": THEME_CACHE_VERSION, "files": files}, f)
+        except OSError:
+            pass
+    themes, errors = {}, []
+    for file_name, (_, name, compiled) in sorted(files.items()):
+        if name is None:
+            errors.append(f"Error loading theme {file_name}: {compiled}")
+        else:
+            themes[name] = compiled
+    return themes, errors
+
+class ThemedStyle:
+    """ttk style for the terminal; call load_tk() before creating one"""
+    def __init__(self, root, theme):
+        self.style = ttk.Style(root)
+        self.configure_theme(theme)
+
+    def configure_theme(self, theme):
+        """Create the straya ttk theme, or restyle it in place with a compiled theme"""
+        if "straya" not in self.style.theme_names():
+            self.style.theme_create("straya", parent="alt", settings={
+                element: {"configure": settings} for element, settings in theme["ttk"].items()
             })
-        self.theme_use("straya")
+            self.style.theme_use("straya")
+            return
+        for element, settings in theme["ttk"].items():
+            self.style.configure(element, **settings)
+
+class RPCError(Exception):
+    """Error returned by the Strayacoin daemon or CLI"""
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
+class RPCCancelled(RPCError):
+    """An in-flight call was aborted through its CancelToken"""
+
+class RPCUnreachable(RPCError):
+    """No connection to the daemon could be made, so the request was never sent"""
+
+class RPCOutcomeUnknown(RPCError):
+    """The request may have reached the daemon but no reply arrived"""
+
+def is_unrepeatable(method):
+    """True for wallet and mining calls that must not run twice"""
+    return method.startswith(UNREPEATABLE_RPC_PREFIXES)
+
+class CancelToken:
+    """Cancels in-flight node calls by running their registered abort callbacks"""
+    def __init__(self):
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.callbacks = []
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def cancel(self):
+        with self.lock:
+            self.event.set()
+            callbacks = list(self.callbacks)
+        for callback in callbacks:
+            try:
+                callback()
+            except OSError:
+                pass
+
+    def register(self, callback):
+        """Run callback on cancel, immediately if already cancelled"""
+        with self.lock:
+            if not self.event.is_set():
+                self.callbacks.append(callback)
+                return
+        callback()
+
+    def unregister(self, callback):
+        with self.lock:
+            if callback in self.callbacks:
+                self.callbacks.remove(callback)
+
+def default_data_dir():
+    """Return the platform default Strayacoin data directory"""
+    system = platform.system()
+    if system == "Windows":
+        return os.path.join(os.environ.get("APPDATA", ""), "Strayacoin")
+    if system == "Darwin":
+        return os.path.expanduser("~/Library/Application Support/Strayacoin")
+    return os.path.expanduser("~/.strayacoin")
+
+def read_rpc_credentials(data_dir=None):
+    """Read RPC host, port and credentials from the node config or cookie file.
+
+    Returns:
+        dict: host, port, user and password, or None if no credentials were found.
+    """
+    data_dir = data_dir or default_data_dir()
+    settings = {}
+    for name in ("Strayacoin.conf", "strayacoin.conf"):
+        conf_path = os.path.join(data_dir, name)
+        if os.path.exists(conf_path):
+            with open(conf_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.split("#", 1)[0].strip()
+                    if "=" in line:
+                        key, value = line.split("=", 1)
+                        settings[key.strip()] = value.strip()
+            break
+
+    user = settings.get("rpcuser")
+    password = settings.get("rpcpassword")
+    if not (user and password):
+        # Fall back to the cookie the daemon writes when no rpcuser is set
+        cookie_path = os.path.join(data_dir, ".cookie")
+        if not os.path.exists(cookie_path):
+            return None
+        with open(cookie_path, "r", encoding="utf-8") as f:
+            user, _, password = f.read().strip().partition(":")
+
+    host = settings.get("rpcconnect", "127.0.0.1")
+    port = int(settings.get("rpcport", DEFAULT_RPC_PORT))
+    return {"host": host, "port": port, "user": user, "password": password}
+
+class RPCBackend:
+    """JSON-RPC client talking to the daemon over pooled keep-alive connections"""
+    def __init__(self, host, port, user, password, pool_size=4, timeout=RPC_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        token = base64.b64encode(f"{user}:{password}".encode("utf-8")).decode("ascii")
+        self.headers = {
+            "Authorization": f"Basic {token}",
+            "Content-Type": "application/json",
+            "Connection": "keep-alive"
+        }
+        self.pool = queue.LifoQueue(maxsize=pool_size)
+        self.request_id = 0
+        self.id_lock = threading.Lock()
+
+    def _next_id(self):
+        with self.id_lock:
+            self.request_id += 1
+            return self.request_id
+
+    def _connection(self):
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _acquire(self):
+        try:
+            return self.pool.get_nowait(), True
+        except queue.Empty:
+            return self._connection(), False
+
+    def _release(self, conn):
+        try:
+            self.pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def _post(self, payload, cancel=None):
+        """POST a JSON payload and return the parsed reply.
+
+        Raises RPCUnreachable when the request was not fully written, so the
+        daemon cannot have run it. Once it has gone out, a lost reply raises
+        RPCOutcomeUnknown; only a stale pooled connection is retried, once, and
+        never for wallet or mining calls. Those always get a fresh connection,
+        because the daemon drops idle pooled ones (rpcservertimeout) and that
+        only shows once the reply is awaited.
+        """
+        body = json.dumps(payload).encode("utf-8")
+        requests = payload if isinstance(payload, list) else [payload]
+        repeatable = not any(is_unrepeatable(request["method"]) for request in requests)
+        for attempt in range(2):
+            # Retries get a fresh connection too: the rest of the pool idled as long
+            conn, reused = self._acquire() if repeatable and attempt == 0 else (self._connection(), False)
+            if conn.sock is None:
+                try:
+                    conn.connect()
+                except OSError as e:
+                    conn.close()
+                    raise RPCUnreachable(f"Cannot reach daemon at {self.host}:{self.port}: {e}") from e
+            abort = None
+            try:
+                if cancel is not None:
+                    # Shutting the socket down wakes the thread blocked reading the reply
+                    sock = conn.sock
+                    abort = lambda: sock.shutdown(socket.SHUT_RDWR)
+                    cancel.register(abort)
+                try:
+                    conn.request("POST", "/", body, self.headers)
+                except (http.client.HTTPException, OSError) as e:
+                    # Not fully written, so the daemon cannot have run it
+                    conn.close()
+                    if cancel is not None and cancel.cancelled:
+                        raise RPCCancelled("Call cancelled")
+                    if reused and attempt == 0:
+                        continue
+                    raise RPCUnreachable(f"Request to daemon at {self.host}:{self.port} not sent: {e}") from e
+                response = conn.getresponse()
+                data = response.read()
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()
+                if cancel is not None and cancel.cancelled:
+                    raise RPCCancelled("Call cancelled")
+                if reused and attempt == 0 and repeatable and isinstance(e, (http.client.HTTPException, ConnectionError)):
+                    continue
+                raise RPCOutcomeUnknown(
+                    f"No reply from daemon ({e or type(e).__name__}); outcome unknown, "
+                    "check the node before repeating the call"
+                ) from e
+            finally:
+                if abort is not None:
+                    cancel.unregister(abort)
+
+            if response.will_close:
+                conn.close()
+            else:
+                self._release(conn)
+
+            if response.status == 401:
+                raise RPCError("RPC authentication failed", code=401)
+            try:
+                return json.loads(data)
+            except ValueError:
+                raise RPCError(f"Invalid RPC response (HTTP {response.status})", code=response.status)
+
+    @staticmethod
+    def _unwrap(reply):
+        error = reply.get("error")
+        if error:
+            raise RPCError(error.get("message", str(error)), code=error.get("code"))
+        return reply.get("result")
+
+    def call(self, method, *params, cancel=None):
+        """Call a single RPC method and return its result"""
+        reply = self._post(
+            {"jsonrpc": "1.0", "id": self._next_id(), "method": method, "params": list(params)},
+            cancel
+        )
+        return self._unwrap(reply)
+
+    def batch(self, calls):
+        """Send several calls as one JSON-RPC batch array.
+
+        Args:
+            calls (list): Tuples of (method, *params).
+
+        Returns:
+            list: (result, error) tuples in the same order as calls.
+        """
+        ids = [self._next_id() for _ in calls]
+        payload = [
+            {"jsonrpc": "1.0", "id": request_id, "method": call[0], "params": list(call[1:])}
+            for request_id, call in zip(ids, calls)
+        ]
+        replies = self._post(payload)
+        if isinstance(replies, dict):
+            # The daemon rejected the whole batch
+            self._unwrap(replies)
+            raise RPCError("Batch request not supported by daemon")
+
+        by_id = {reply.get("id"): reply for reply in replies}
+        results = []
+        for request_id, call in zip(ids, calls):
+            reply = by_id.get(request_id)
+            if reply is None:
+                results.append((None, RPCError(f"No reply for {call[0]}")))
+                continue
+            try:
+                results.append((self._unwrap(reply), None))
+            except RPCError as e:
+                results.append((None, e))
+        return results
+
+    def close(self):
+        """Close all idle pooled connections"""
+        while True:
+            try:
+                self.pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+class CLIBackend:
+    """Fallback backend that runs one Strayacoin-cli process per call"""
+    def __init__(self, cli_path, extra_args=()):
+        self.cli_path = cli_path
+        self.extra_args = list(extra_args)
+
+    def call(self, method, *params, cancel=None):
+        """Run a CLI call and return its output parsed like an RPC result"""
+        args = [p if isinstance(p, str) else json.dumps(p) for p in params]
+        try:
+            process = subprocess.Popen(
+                [self.cli_path, *self.extra_args, method, *args],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                encoding='utf-8'
+            )
+        except OSError as e:
+            raise RPCError(str(e))
+
+        if cancel is not None:
+            cancel.register(process.kill)
+        try:
+            stdout, stderr = process.communicate()
+        finally:
+            if cancel is not None:
+                cancel.unregister(process.kill)
+        if cancel is not None and cancel.cancelled:
+            raise RPCCancelled("Call cancelled")
+        if process.returncode != 0:
+            raise RPCError((stderr or f"{self.cli_path} exited with {process.returncode}").strip(), code=process.returncode)
+
+        output = stdout.strip()
+        try:
+            return json.loads(output)
+        except ValueError:
+            return output
+
+    def batch(self, calls):
+        """Run calls one by one, returning (result, error) tuples like RPCBackend.batch"""
+        results = []
+        for call in calls:
+            try:
+                results.append((self.call(*call), None))
+            except RPCError as e:
+                results.append((None, e))
+        return results
+
+    def close(self):
+        pass
+
+def timed(name):
+    """Record every call of a method under name in self.metrics, when it has one"""
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self.metrics is None:
+                return method(self, *args, **kwargs)
+            with self.metrics.timer(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorate
+
+class NodeClient:
+    """Single interface for node calls, preferring JSON-RPC with CLI fallback"""
+    def __init__(self, cli_path, data_dir=None, rpc=None, cli_args=(), metrics=None):
+        self.metrics = metrics
+        cli_args = list(cli_args)
+        if data_dir:
+            cli_args.insert(0, f"-datadir={data_dir}")
+        self.cli = CLIBackend(cli_path, cli_args)
+        self.rpc = rpc
+        if self.rpc is None:
+            try:
+                credentials = read_rpc_credentials(data_dir)
+            except (OSError, ValueError):
+                credentials = None
+            if credentials:
+                self.rpc = RPCBackend(**credentials)
+
+    @property
+    def transport(self):
+        return "rpc" if self.rpc else "cli"
+
+    @timed("node.call")
+    def call(self, method, *params, cancel=None):
+        """Call a node method, falling back to the CLI only if the request never left.
+
+        A call that may have reached the daemon is not sent again; its lost
+        reply surfaces as RPCOutcomeUnknown.
+        """
+        if self.rpc:
+            try:
+                return self.rpc.call(method, *params, cancel=cancel)
+            except RPCUnreachable:
+                pass
+        return self.cli.call(method, *params, cancel=cancel)
+
+    @timed("node.batch")
+    def batch(self, calls):
+        """Send calls as one batch, falling back to serial CLI calls if the daemon is unreachable"""
+        if self.rpc:
+            try:
+                return self.rpc.batch(calls)
+            except RPCUnreachable:
+                pass
+        return self.cli.batch(calls)
+
+    def network_snapshot(self):
+        """Collect daemon network statistics in a single batch round-trip"""
+        snapshot = NetworkSnapshot()
+        try:
+            results = self.batch(SNAPSHOT_CALLS)
+        except RPCError as e:
+            for name in ("difficulty", "hashrate", "conpeers", "block_count", "mining_info"):
+                snapshot.errors[name] = str(e)
+            return snapshot
+
+        (difficulty, hashrate, peers, block_count, mining_info) = results
+        if difficulty[1] is None:
+            try:
+                snapshot.difficulty = float(difficulty[0])
+            except (TypeError, ValueError) as e:
+                snapshot.errors["difficulty"] = str(e)
+        else:
+            snapshot.errors["difficulty"] = str(difficulty[1])
+
+        if hashrate[1] is None:
+            try:
+                snapshot.hashrate = float(hashrate[0])
+            except (TypeError, ValueError) as e:
+                snapshot.errors["hashrate"] = str(e)
+        else:
+            snapshot.errors["hashrate"] = str(hashrate[1])
+
+        if not math.isnan(snapshot.difficulty):
+            # Estimate from difficulty when the daemon has no hashrate figure
+            if "hashrate" in snapshot.errors:
+                snapshot.hashrate = snapshot.difficulty * (2**32) / 60
+            elif snapshot.hashrate <= 0:
+                inversion_factor = 2.5
+                snapshot.hashrate = snapshot.difficulty * (2**32) / (60 * inversion_factor)
+
+        if peers[1] is None and isinstance(peers[0], list):
+            snapshot.conpeers = len(peers[0])
+        else:
+            snapshot.errors["conpeers"] = str(peers[1] or "Unexpected getpeerinfo reply")
+
+        if block_count[1] is None:
+            snapshot.block_count = block_count[0]
+        else:
+            snapshot.errors["block_count"] = str(block_count[1])
+
+        if mining_info[1] is None and isinstance(mining_info[0], dict):
+            snapshot.mining_info = mining_info[0]
+        else:
+            snapshot.errors["mining_info"] = str(mining_info[1] or "Unexpected getmininginfo reply")
+        return snapshot
+
+    def close(self):
+        if self.rpc:
+            self.rpc.close()
+
+def load_node_endpoints(path=NODES_FILE, cli_path="Strayacoin-cli.exe", metrics=None):
+    """Build a NodeClient for every entry in the nodes file.
+
+    Entries have a name plus either host/port/user/password for direct RPC or a
+    datadir whose config or cookie supplies them; cli and cli_args set the fallback.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+
+    nodes = {}
+    for entry in config.get("nodes", []):
+        rpc = None
+        if "host" in entry or "port" in entry:
+            rpc = RPCBackend(
+                entry.get("host", "127.0.0.1"),
+                int(entry.get("port", DEFAULT_RPC_PORT)),
+                entry.get("user", ""),
+                entry.get("password", "")
+            )
+        nodes[entry["name"].lower()] = NodeClient(
+            entry.get("cli", cli_path),
+            data_dir=entry.get("datadir"),
+            rpc=rpc,
+            cli_args=entry.get("cli_args", []),
+            metrics=metrics
+        )
+    return nodes
+
+# Daemon queries that make up one network snapshot, sent as a single batch
+SNAPSHOT_CALLS = [
+    ("getdifficulty",),
+    ("getnetworkhashps",),
+    ("getpeerinfo",),
+    ("getblockcount",),
+    ("getmininginfo",),
+]
+
+@dataclass
+class NetworkSnapshot:
+    """Network statistics from one snapshot, with per-field errors"""
+    difficulty: float = float('nan')
+    hashrate: float = float('nan')
+    conpeers: float = float('nan')
+    netpeers: float = float('nan')
+    block_count: int = None
+    mining_info: dict = field(default_factory=dict)
+    money_supply: str = "N/A"
+    supply: float = float('nan')
+    market: dict = field(default_factory=dict)
+    prices: dict = field(default_factory=dict)
+    errors: dict = field(default_factory=dict)
+    timestamp: float = field(default_factory=time.time)
+
+    @property
+    def rms(self):
+        if self.difficulty > 0 and self.conpeers > 0 and self.netpeers > 0:
+            return 1 / (self.difficulty * self.conpeers)
+        return float('nan')
+
+    @property
+    def emc(self):
+        if self.difficulty > 0 and self.netpeers > 0 and not math.isnan(self.hashrate):
+            return self.hashrate / (self.difficulty * self.netpeers)
+        return float('nan')
+
+def format_rpc_result(value):
+    """Format an RPC result the way Strayacoin-cli prints it"""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, indent=2)
+    if value is None:
+        return ""
+    return str(value)
+
+class StubRPCDaemon:
+    """Minimal local JSON-RPC daemon for exercising the terminal offline"""
+    def __init__(self, port=0, user="stub", password="stub", handlers=None, notify_port=None, server_timeout=None):
+        self.user = user
+        self.password = password
+        self.block_count = 0
+        # Seconds an idle keep-alive connection is kept open, like rpcservertimeout
+        self.server_timeout = server_timeout
+        # Stand-in for -blocknotify/-walletnotify when set
+        self.notify_port = notify_port
+        self.handlers = {
+            "getdifficulty": lambda: 0.00024414,
+            "getnetworkhashps": lambda: 17476.27,
+            "getpeerinfo": lambda: [{"id": 0, "addr": "127.0.0.1:9881"}],
+            "getblockcount": lambda: self.block_count,
+            "getmininginfo": lambda: {"blocks": self.block_count, "difficulty": 0.00024414, "networkhashps": 17476.27},
+            "getbalance": lambda: 0.0,
+            "getwalletinfo": lambda: {"walletversion": 60000, "balance": 0.0, "txcount": 0},
+            "generate": self._generate,
+            "sendtoaddress": lambda address, amount: self._notify("tx", "00" * 32),
+            "sendmany": lambda account, amounts, minconf=1, comment="": self._notify("tx", "11" * 32),
+            "validateaddress": lambda address: {"isvalid": True, "address": address},
+            "listtransactions": lambda account="*", count=10: [],
+            "listsinceblock": lambda blockhash="", target=1: {"transactions": [], "lastblock": f"{self.block_count:064x}"},
+            "getblockhash": lambda height: f"{int(height):064x}",
+            "getblock": self._block,
+            "getrawtransaction": lambda txid, verbose=0: {
+                "txid": txid, "blockhash": f"{self.block_count:064x}", "confirmations": 1, "vin": [], "vout": []
+            },
+        }
+        self.handlers.update(handlers or {})
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", port), self._make_handler())
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    @property
+    def credentials(self):
+        return {"host": "127.0.0.1", "port": self.port, "user": self.user, "password": self.password}
+
+    def _generate(self, blocks=1):
+        hashes = []
+        for _ in range(int(blocks)):
+            self.block_count += 1
+            hashes.append(self._notify("block", f"{self.block_count:064x}"))
+        return hashes
+
+    def _notify(self, topic, value):
+        if self.notify_port is not None:
+            send_notification(topic, value, self.notify_port)
+        return value
+
+    def _block(self, block_hash):
+        height = int(block_hash, 16)
+        if height > self.block_count:
+            raise ValueError("Block not found")
+        return {
+            "hash": block_hash, "height": height, "confirmations": self.block_count - height + 1,
+            "time": int(time.time()), "tx": [], "difficulty": 0.00024414, "size": 81,
+            "previousblockhash": f"{height - 1:064x}"
+        }
+
+    def dispatch(self, request):
+        """Run one JSON-RPC request object and build its reply"""
+        reply = {"id": request.get("id"), "result": None, "error": None}
+        handler = self.handlers.get(request.get("method"))
+        if handler is None:
+            reply["error"] = {"code": -32601, "message": "Method not found"}
+            return reply
+        try:
+            reply["result"] = handler(*request.get("params", []))
+        except Exception as e:
+            reply["error"] = {"code": -1, "message": str(e)}
+        return reply
+
+    def _make_handler(self):
+        daemon = self
+        token = base64.b64encode(f"{self.user}:{self.password}".encode("utf-8")).decode("ascii")
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            timeout = daemon.server_timeout
+
+            def do_POST(self):
+                if self.headers.get("Authorization") != f"Basic {token}":
+                    self._send(401, b"")
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length))
+                if isinstance(request, list):
+                    reply = [daemon.dispatch(r) for r in request]
+                else:
+                    reply = daemon.dispatch(request)
+                self._send(200, json.dumps(reply).encode("utf-8"))
+
+            def _send(self, status, body):
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class MarketDataCache:
+    """TTL cache for a JSON market-data document.
+
+    The cache does no I/O itself: the stats collector fetches the document
+    with conditional_headers() when it has expired and hands the response to
+    accept(). Between fetches readers get the last document, marked as stale
+    once it is older than the TTL.
+    """
+    def __init__(self, url, ttl=TICKER_TTL, timeout=TICKER_TIMEOUT):
+        self.url = url
+        self.ttl = ttl
+        self.timeout = timeout
+        self.data = None
+        self.fetched_at = 0.0
+        self.etag = None
+        self.last_modified = None
+        self.last_error = None
+
+    @property
+    def age(self):
+        """Seconds since the cached document was last confirmed fresh"""
+        if self.data is None:
+            return None
+        return time.monotonic() - self.fetched_at
+
+    @property
+    def expired(self):
+        return self.data is None or self.age >= self.ttl
+
+    def peek(self):
+        """Return (data, stale) without fetching"""
+        return self.data, self.data is not None and self.expired
+
+    def conditional_headers(self):
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def accept(self, status, body, headers):
+        """Store a response fetched for this cache; headers use lowercase names"""
+        if status == 304 and self.data is not None:
+            self.fetched_at = time.monotonic()
+        elif status == 200:
+            try:
+                self.data = json.loads(body)
+            except ValueError as e:
+                self.last_error = str(e)
+                return
+            self.fetched_at = time.monotonic()
+            self.etag = headers.get("etag")
+            self.last_modified = headers.get("last-modified")
+        else:
+            self.last_error = f"HTTP {status}"
+            return
+        self.last_error = None
+
+    def field(self, name):
+        """Return a ticker field formatted in BTC, with an age marker if stale"""
+        data, stale = self.peek()
+        if not isinstance(data, dict):
+            return "N/A"
+        try:
+            value = float(data.get(name, 0))
+        except (TypeError, ValueError):
+            return "N/A"
+        text = f"{value:.8f} BTC"
+        if stale:
+            text += f" (stale {self.age:.0f}s)"
+        return text
+
+@dataclass
+class FetchRequest:
+    """One HTTP GET for the AsyncFetcher"""
+    url: str
+    headers: dict = field(default_factory=dict)
+    timeout: float = EXPLORER_TIMEOUT
+
+@dataclass
+class FetchResult:
+    """Outcome of one AsyncFetcher request"""
+    name: str
+    status: int = None
+    body: bytes = b""
+    headers: dict = field(default_factory=dict)
+    error: str = None
+    elapsed: float = 0.0
+
+    @property
+    def ok(self):
+        return self.error is None and self.status == 200
+
+    @property
+    def text(self):
+        return self.body.decode("utf-8", errors="replace")
+
+class FetchBatch:
+    """Handle for a submitted fan-out: wait for it, or cancel single requests"""
+    def __init__(self, fetcher, future, tasks):
+        self.fetcher = fetcher
+        self.future = future
+        self.tasks = tasks
+
+    def cancel(self, name):
+        task = self.tasks.get(name)
+        if task:
+            self.fetcher.loop.call_soon_threadsafe(task.cancel)
+
+    def cancel_all(self):
+        for name in list(self.tasks):
+            self.cancel(name)
+
+    def result(self, timeout=None):
+        """Block until every request finished, failed, or hit the deadline"""
+        return self.future.result(timeout)
+
+class AsyncFetcher:
+    """Fans out HTTP GETs concurrently on a private asyncio loop.
+
+    The loop runs on its own daemon thread so Tk and worker threads can submit
+    requests and either wait for the batch or carry on. Connections are kept
+    alive and reused per host, so a poll does not pay a TCP and TLS handshake
+    for every request.
+    """
+    def __init__(self):
+        self.loop = None
+        self.thread = None
+        self.lock = threading.Lock()
+        self.ssl_context = ssl.create_default_context()
+        # (scheme, host, port) -> idle (reader, writer) pairs; only touched on the loop
+        self.idle = {}
+
+    def _ensure_loop(self):
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+                self.thread.start()
+        return self.loop
+
+    def submit(self, fetches, deadline=FETCH_DEADLINE):
+        """Start fetching a {name: url or FetchRequest} mapping and return a FetchBatch"""
+        loop = self._ensure_loop()
+        fetches = {
+            name: request if isinstance(request, FetchRequest) else FetchRequest(request)
+            for name, request in fetches.items()
+        }
+        tasks = {}
+        started = threading.Event()
+
+        async def run():
+            for name, request in fetches.items():
+                tasks[name] = asyncio.ensure_future(self._fetch(name, request))
+            started.set()
+            return await self._gather(tasks, deadline)
+
+        future = asyncio.run_coroutine_threadsafe(run(), loop)
+        started.wait()
+        return FetchBatch(self, future, tasks)
+
+    def fetch_all_sync(self, fetches, deadline=FETCH_DEADLINE):
+        """Fetch everything concurrently and wait; the wait is the slowest request"""
+        return self.submit(fetches, deadline).result()
+
+    def close(self):
+        """Close the idle connections and stop the loop; a later submit starts a new one"""
+        with self.lock:
+            loop, self.loop = self.loop, None
+        if loop is None:
+            return
+
+        def shutdown():
+            for connections in self.idle.values():
+                for reader, writer in connections:
+                    writer.close()
+            self.idle.clear()
+            loop.stop()
+
+        loop.call_soon_threadsafe(shutdown)
+
+    async def _gather(self, tasks, deadline):
+        done, pending = await asyncio.wait(tasks.values(), timeout=deadline) if tasks else (set(), set())
+        for task in pending:
+            task.cancel()
+        results = {}
+        for name, task in tasks.items():
+            if task in pending:
+                results[name] = FetchResult(name, error="deadline exceeded")
+            elif task.cancelled():
+                results[name] = FetchResult(name, error="cancelled")
+            else:
+                results[name] = task.result()
+        return results
+
+    async def _fetch(self, name, request):
+        start = time.monotonic()
+        try:
+            status, headers, body = await asyncio.wait_for(self._http_get(request), request.timeout)
+            return FetchResult(name, status, body, headers, elapsed=time.monotonic() - start)
+        except asyncio.TimeoutError:
+            return FetchResult(name, error="timed out", elapsed=time.monotonic() - start)
+        except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+            return FetchResult(name, error=str(e) or type(e).__name__, elapsed=time.monotonic() - start)
+
+    def _take_idle(self, key):
+        connections = self.idle.get(key, [])
+        while connections:
+            reader, writer = connections.pop()
+            if not reader.at_eof() and not writer.is_closing():
+                return reader, writer
+            writer.close()
+        return None
+
+    async def _http_get(self, request):
+        parts = urllib.parse.urlsplit(request.url)
+        https = parts.scheme == "https"
+        port = parts.port or (443 if https else 80)
+        key = (parts.scheme, parts.hostname, port)
+        idle = self._take_idle(key)
+        if idle is not None:
+            try:
+                return await self._exchange(key, *idle, parts, request)
+            except (OSError, ValueError, asyncio.IncompleteReadError):
+                # The server may have dropped it while idle; a GET is safe to send again
+                pass
+        reader, writer = await asyncio.open_connection(
+            parts.hostname, port,
+            ssl=self.ssl_context if https else None,
+            server_hostname=parts.hostname if https else None
+        )
+        return await self._exchange(key, reader, writer, parts, request)
+
+    async def _exchange(self, host_key, reader, writer, parts, request):
+        """Send one GET and read the reply, keeping the connection when its framing allows"""
+        keep = False
+        try:
+            path = parts.path or "/"
+            if parts.query:
+                path += "?" + parts.query
+            lines = [
+                f"GET {path} HTTP/1.1",
+                f"Host: {parts.netloc}",
+                "User-Agent: Strayacoin-Terminal",
+                "Accept-Encoding: identity"
+            ]
+            lines += [f"{key}: {value}" for key, value in request.headers.items()]
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+            await writer.drain()
+
+            status_line = (await reader.readline()).decode("latin-1").split(" ", 2)
+            if len(status_line) < 2:
+                raise ValueError("Malformed HTTP response")
+            status = int(status_line[1])
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            # Only a body whose end is known leaves the connection usable
+            keep = status_line[0] == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+            if status in (204, 304) or 100 <= status < 200:
+                body = b""
+            elif headers.get("transfer-encoding", "").lower() == "chunked":
+                body = await self._read_chunked(reader)
+            elif "content-length" in headers:
+                body = await reader.readexactly(int(headers["content-length"]))
+            else:
+                keep = False
+                body = await reader.read()
+            return status, headers, body
+        finally:
+            if keep:
+                connections = self.idle.setdefault(host_key, [])
+                connections.append((reader, writer))
+                if len(connections) > FETCH_IDLE_PER_HOST:
+                    connections.pop(0)[1].close()
+            else:
+                writer.close()
+
+    @staticmethod
+    async def _read_chunked(reader):
+        body = bytearray()
+        while True:
+            size = int((await reader.readline()).split(b";")[0].strip(), 16)
+            if size == 0:
+                # Skip trailers up to the blank line
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return bytes(body)
+            body += await reader.readexactly(size)
+            await reader.readexactly(2)
+
+class StatsPoller:
+    """Background worker that keeps the latest stats snapshot up to date.
+
+    The collect callable runs on the poller thread every interval seconds, or
+    sooner after poke(); readers only ever take the last published snapshot.
+    """
+    def __init__(self, collect, interval=STATS_POLL_INTERVAL):
+        self.collect = collect
+        self.interval = interval
+        self.snapshot = None
+        self.last_error = None
+        self.lock = threading.Lock()
+        self.wake_event = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread and self.thread.is_alive() and not self.stop_event.is_set():
+            return
+        # A stopping thread keeps its own event, so a restart never revives it
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(self.stop_event,), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.wake_event.set()
+
+    def poke(self):
+        """Ask for a fresh poll without waiting for it"""
+        self.wake_event.set()
+
+    def latest(self):
+        with self.lock:
+            return self.snapshot
+
+    def _run(self, stop_event):
+        while not stop_event.is_set():
+            self.wake_event.clear()
+            try:
+                snapshot = self.collect()
+                with self.lock:
+                    self.snapshot = snapshot
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+            self.wake_event.wait(self.interval)
+
+def send_notification(topic, value, port=NOTIFY_PORT):
+    """Report a block or tx hash to a listening terminal, used by -blocknotify and -walletnotify"""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.sendto(f"{topic} {value}".encode("ascii"), ("127.0.0.1", port))
+
+class ChainEvents:
+    """Push notifications of new blocks and transactions from the node.
+
+    Subscribes to the daemon's ZMQ hashblock/rawtx publishers when pyzmq is
+    installed and the node advertises them, otherwise listens on a local UDP
+    port fed by the --notify helper. Listeners get ("block" | "tx", hash) on
+    the listener thread.
+    """
+    def __init__(self, node, port=NOTIFY_PORT):
+        self.node = node
+        self.port = port
+        self.listeners = []
+        self.source = None
+        self.last_error = None
+        self.counts = {"block": 0, "tx": 0}
+        self.last_event = None
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    @property
+    def live(self):
+        return self.source is not None and self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return self
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(self.stop_event,), daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _zmq_endpoints(self):
+        try:
+            import zmq  # noqa: F401
+            notifications = self.node.call("getzmqnotifications")
+        except (ImportError, RPCError, OSError):
+            return {}
+        wanted = {"pubhashblock": "hashblock", "pubrawtx": "rawtx"}
+        return {wanted[item["type"]]: item["address"] for item in notifications if item.get("type") in wanted}
+
+    def _run(self, stop_event):
+        try:
+            endpoints = self._zmq_endpoints()
+            if "hashblock" in endpoints:
+                self._listen_zmq(endpoints, stop_event)
+            else:
+                self._listen_udp(stop_event)
+        except Exception as e:
+            self.last_error = str(e)
+        finally:
+            self.source = None
+
+    def _listen_zmq(self, endpoints, stop_event):
+        import zmq
+        context = zmq.Context.instance()
+        sub = context.socket(zmq.SUB)
+        try:
+            for topic, address in endpoints.items():
+                sub.connect(address)
+                sub.setsockopt(zmq.SUBSCRIBE, topic.encode("ascii"))
+            self.source = "zmq " + ", ".join(sorted(set(endpoints.values())))
+            while not stop_event.is_set():
+                if not sub.poll(500):
+                    continue
+                topic, body = sub.recv_multipart()[:2]
+                if topic == b"hashblock":
+                    self._emit("block", body.hex())
+                elif topic == b"rawtx":
+                    # txid is the reversed double SHA-256 of the serialised transaction
+                    self._emit("tx", hashlib.sha256(hashlib.sha256(body).digest()).digest()[::-1].hex())
+        finally:
+            sub.close(linger=0)
+
+    def _listen_udp(self, stop_event):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.bind(("127.0.0.1", self.port))
+            sock.settimeout(0.5)
+            self.source = f"udp 127.0.0.1:{self.port}"
+            while not stop_event.is_set():
+                try:
+                    data = sock.recv(512)
+                except socket.timeout:
+                    continue
+                topic, _, value = data.decode("ascii", "replace").partition(" ")
+                if topic in self.counts:
+                    self._emit(topic, value.strip())
+
+    def _emit(self, topic, value):
+        self.counts[topic] += 1
+        self.last_event = time.time()
+        for listener in self.listeners:
+            listener(topic, value)
+
+class StatsCollector:
+    """Builds full stats snapshots from the daemon, explorer and exchange.
+
+    Explorer and exchange requests are fanned out together and the daemon
+    batch runs while they are in flight, so the wait is the slowest source.
+    Each finished snapshot is handed to the listeners, e.g. the exporter.
+    """
+    def __init__(self, node, fetcher, ticker, metrics):
+        self.node = node
+        self.fetcher = fetcher
+        self.ticker = ticker
+        self.metrics = metrics
+        self.listeners = []
+
+    def collect(self):
+        stats = self._collect()
+        for listener in self.listeners:
+            listener(stats)
+        return stats
+
+    @timed("stats")
+    def _collect(self):
+        fetches = {"netpeers": EXPLORER_PEERS_URL, "money_supply": EXPLORER_SUPPLY_URL}
+        if self.ticker.expired:
+            fetches["ticker"] = FetchRequest(
+                self.ticker.url, headers=self.ticker.conditional_headers(), timeout=self.ticker.timeout
+            )
+        batch = self.fetcher.submit(fetches)
+
+        with self.metrics.timer("stats.daemon"):
+            stats = self.node.network_snapshot()
+        with self.metrics.timer("stats.fetch_wait"):
+            results = batch.result()
+        for name, result in results.items():
+            self.metrics.record(f"fetch.{name}", result.elapsed, error=result.error is not None)
+
+        stats.netpeers = self.parse_peer_count(results["netpeers"])
+        if math.isnan(stats.netpeers):
+            stats.errors["netpeers"] = results["netpeers"].error or "explorer unavailable"
+        stats.supply = self.parse_supply(results["money_supply"])
+        stats.money_supply = "N/A" if math.isnan(stats.supply) else "{:,.0f}".format(stats.supply)
+        if "ticker" in results:
+            ticker = results["ticker"]
+            if ticker.error:
+                self.ticker.last_error = ticker.error
+            else:
+                self.ticker.accept(ticker.status, ticker.body, ticker.headers)
+        stats.market = {name: self.ticker.field(name) for name in ("price", "bid", "ask")}
+        data, _ = self.ticker.peek()
+        if isinstance(data, dict):
+            for name in ("price", "bid", "ask"):
+                try:
+                    stats.prices[name] = float(data.get(name))
+                except (TypeError, ValueError):
+                    pass
+        return stats
+
+    @staticmethod
+    def parse_peer_count(result):
+        if not result.ok:
+            return float('nan')
+        try:
+            return int(result.text)
+        except ValueError:
+            return float('nan')
+
+    @staticmethod
+    def parse_supply(result):
+        if not result.ok:
+            return float('nan')
+        try:
+            return float(result.text)
+        except ValueError:
+            return float('nan')
+
+# Gauges published from each stats snapshot: metric name, help, snapshot getter
+SNAPSHOT_GAUGES = [
+    ("strayacoin_network_difficulty", "Network difficulty", lambda s: s.difficulty),
+    ("strayacoin_network_hashrate_hps", "Network hashrate in hashes per second", lambda s: s.hashrate),
+    ("strayacoin_connected_peers", "Peers connected to the local node", lambda s: s.conpeers),
+    ("strayacoin_network_peers", "Peers reported by the explorer", lambda s: s.netpeers),
+    ("strayacoin_block_height", "Block count of the local node", lambda s: s.block_count),
+    ("strayacoin_rms", "Relative mining share", lambda s: s.rms),
+    ("strayacoin_emc", "Effective mining capacity", lambda s: s.emc),
+    ("strayacoin_money_supply", "Coins in circulation", lambda s: s.supply),
+    ("strayacoin_tradeogre_price_btc", "NAH-BTC last price on TradeOgre", lambda s: s.prices.get("price")),
+    ("strayacoin_tradeogre_bid_btc", "NAH-BTC best bid on TradeOgre", lambda s: s.prices.get("bid")),
+    ("strayacoin_tradeogre_ask_btc", "NAH-BTC best ask on TradeOgre", lambda s: s.prices.get("ask")),
+    ("strayacoin_stats_timestamp_seconds", "Unix time of the last stats snapshot", lambda s: s.timestamp),
+]
+
+def format_metric_value(value):
+    if value is None:
+        return "NaN"
+    value = float(value)
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value)
+
+class MetricsExporter:
+    """Serves mining and network values in the Prometheus text format.
+
+    Gauges are replaced as snapshots are published and counters are read from
+    Metrics, so a scrape only renders what is already in memory.
+    """
+    def __init__(self, metrics, host=METRICS_HOST, port=METRICS_PORT):
+        self.metrics = metrics
+        self.gauges = {}
+        self.lock = threading.Lock()
+        self.server = http.server.ThreadingHTTPServer((host, port), self._make_handler())
+        self.thread = None
+
+    @property
+    def address(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def publish(self, snapshot):
+        """Replace the snapshot gauges; called from the stats poller thread"""
+        values = {name: getter(snapshot) for name, _, getter in SNAPSHOT_GAUGES}
+        with self.lock:
+            self.gauges.update(values)
+
+    def set_gauge(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    def render(self):
+        """Build the exposition text for one scrape"""
+        lines = []
+        with self.lock:
+            gauges = dict(self.gauges)
+        helps = {name: text for name, text, _ in SNAPSHOT_GAUGES}
+        for name in sorted(gauges):
+            lines.append(f"# HELP {name} {helps.get(name, name)}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {format_metric_value(gauges[name])}")
+
+        with self.metrics.lock:
+            series = {name: (s.calls, s.errors, s.total, bool(s.samples)) for name, s in self.metrics.series.items()}
+        if "blocks" in series:
+            lines.append("# HELP strayacoin_blocks_mined_total Blocks mined by this terminal")
+            lines.append("# TYPE strayacoin_blocks_mined_total counter")
+            lines.append(f"strayacoin_blocks_mined_total {series['blocks'][0]}")
+        timed = sorted(name for name, value in series.items() if value[3])
+        if timed:
+            lines.append("# HELP strayacoin_phase_calls_total Timed calls per phase")
+            lines.append("# TYPE strayacoin_phase_calls_total counter")
+            for name in timed:
+                lines.append(f'strayacoin_phase_calls_total{{phase="{name}"}} {series[name][0]}')
+            lines.append("# HELP strayacoin_phase_errors_total Timed calls per phase that raised")
+            lines.append("# TYPE strayacoin_phase_errors_total counter")
+            for name in timed:
+                lines.append(f'strayacoin_phase_errors_total{{phase="{name}"}} {series[name][1]}')
+            lines.append("# HELP strayacoin_phase_seconds_total Time spent per phase")
+            lines.append("# TYPE strayacoin_phase_seconds_total counter")
+            for name in timed:
+                lines.append(f'strayacoin_phase_seconds_total{{phase="{name}"}} {series[name][2]!r}')
+            lines.append("# HELP strayacoin_phase_latency_seconds Recent latency quantiles per phase")
+            lines.append("# TYPE strayacoin_phase_latency_seconds gauge")
+            for name in timed:
+                for q, value in zip(("0.5", "0.95", "0.99"), self.metrics.percentiles(name)):
+                    lines.append(
+                        f'strayacoin_phase_latency_seconds{{phase="{name}",quantile="{q}"}} {format_metric_value(value)}'
+                    )
+        return "\n".join(lines) + "\n"
+
+    def _make_handler(self):
+        exporter = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+                    self._send(404, b"Not found\n", "text/plain")
+                    return
+                body = exporter.render().encode("utf-8")
+                self._send(200, body, "text/plain; version=0.0.4; charset=utf-8")
+
+            def _send(self, status, body, content_type):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class OutputQueue:
+    """Thread-safe queue of (text, tag) chunks waiting to be shown"""
+    def __init__(self):
+        self.queue = queue.SimpleQueue()
+
+    def put(self, text, tag="output"):
+        self.queue.put((text, tag))
+
+    def drain(self, max_chunks=OUTPUT_MAX_CHUNKS):
+        """Take up to max_chunks chunks, merging neighbours that share a tag"""
+        merged = []
+        for _ in range(max_chunks):
+            try:
+                text, tag = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if merged and merged[-1][1] == tag:
+                merged[-1][0].append(text)
+            else:
+                merged.append(([text], tag))
+        return [("".join(parts), tag) for parts, tag in merged]
+
+    def clear(self):
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+
+class ScrollbackLog:
+    """Append-only log file holding the full output history"""
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.file = None
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.file is not None
+
+    def enable(self):
+        with self.lock:
+            if self.file is None:
+                self.file = open(self.path, "a", encoding="utf-8")
+
+    def disable(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def write(self, text):
+        with self.lock:
+            if self.file is not None:
+                self.file.write(text)
+
+    def flush(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.flush()
+
+    def search(self, pattern, limit=SCROLLBACK_SEARCH_LIMIT):
+        """Yield (line_number, line) for lines containing pattern, case-insensitively"""
+        self.flush()
+        pattern = pattern.lower()
+        found = 0
+        with open(self.path, "r", encoding="utf-8", errors="replace") as f:
+            for number, line in enumerate(f, 1):
+                if pattern in line.lower():
+                    yield number, line.rstrip("\n")
+                    found += 1
+                    if found >= limit:
+                        return
+
+# Columns of one history record, each stored as a little-endian double
+HISTORY_FIELDS = ("timestamp", "height", "difficulty", "hashrate", "conpeers", "netpeers", "rms", "emc", "price")
+
+class SnapshotStore:
+    """Append-only file of fixed-width per-block snapshot records.
+
+    Records are packed doubles behind a magic header. Reads memory-map the file
+    and slice columns straight out of the mapping, so queries never parse text.
+    """
+    MAGIC = b"NAHHIST1"
+    record = struct.Struct("<" + "d" * len(HISTORY_FIELDS))
+
+    def __init__(self, path=HISTORY_FILE):
+        self.path = os.path.abspath(path)
+        self.file = None
+        self.lock = threading.Lock()
+        self.mapped_size = 0
+        self.view = None
+
+    def _open(self):
+        exists = os.path.exists(self.path)
+        self.file = open(self.path, "r+b" if exists else "w+b")
+        if not exists:
+            self.file.write(self.MAGIC)
+        elif self.file.read(len(self.MAGIC)) != self.MAGIC:
+            self.file.close()
+            self.file = None
+            raise ValueError(f"{self.path} is not a snapshot history file")
+        # Drop a record torn by a crash mid-write so the columns stay aligned
+        size = self.file.seek(0, os.SEEK_END)
+        torn = (size - len(self.MAGIC)) % self.record.size
+        if torn:
+            self.file.truncate(size - torn)
+            self.file.seek(0, os.SEEK_END)
+
+    def append(self, snapshot, timestamp=None):
+        """Write one record for snapshot, stamped now unless timestamp is given"""
+        height = snapshot.block_count if snapshot.block_count is not None else float('nan')
+        values = (
+            timestamp if timestamp is not None else time.time(),
+            height,
+            snapshot.difficulty,
+            snapshot.hashrate,
+            snapshot.conpeers,
+            snapshot.netpeers,
+            snapshot.rms,
+            snapshot.emc,
+            snapshot.prices.get("price", float('nan'))
+        )
+        data = self.record.pack(*(float(value) for value in values))
+        with self.lock:
+            if self.file is None:
+                self._open()
+            self.file.write(data)
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def _columns(self):
+        """Flat view of every stored double, remapped when the file has grown"""
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if size <= len(self.MAGIC):
+            return memoryview(b"").cast("d")
+        if self.view is None or size != self.mapped_size:
+            with open(self.path, "rb") as f:
+                if f.read(len(self.MAGIC)) != self.MAGIC:
+                    raise ValueError(f"{self.path} is not a snapshot history file")
+                # An old mapping stays alive until the last view into it is dropped
+                mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            count = (size - len(self.MAGIC)) // self.record.size
+            end = len(self.MAGIC) + count * self.record.size
+            self.view = memoryview(mapping)[len(self.MAGIC):end].cast("d")
+            self.mapped_size = size
+        return self.view
+
+    def __len__(self):
+        return len(self._columns()) // len(HISTORY_FIELDS)
+
+    def column(self, name, start=0, stop=None):
+        """Zero-copy view of one column for records start..stop"""
+        index = HISTORY_FIELDS.index(name)
+        width = len(HISTORY_FIELDS)
+        columns = self._columns()
+        count = len(columns) // width
+        start, stop, _ = slice(start, stop).indices(count)
+        return columns[start * width + index:stop * width:width]
+
+    def rows(self, start=0, stop=None):
+        """Contiguous view of records start..stop, ready for numpy.frombuffer"""
+        width = len(HISTORY_FIELDS)
+        columns = self._columns()
+        start, stop, _ = slice(start, stop).indices(len(columns) // width)
+        return columns[start * width:stop * width]
+
+    def record_at(self, index):
+        width = len(HISTORY_FIELDS)
+        return dict(zip(HISTORY_FIELDS, self._columns()[index * width:(index + 1) * width].tolist()))
+
+    def span(self, since=None, until=None):
+        """Record indices (start, stop) stamped in [since, until), by binary search"""
+        timestamps = self.column("timestamp")
+        start = 0 if since is None else bisect.bisect_left(timestamps, since)
+        stop = len(timestamps) if until is None else bisect.bisect_left(timestamps, until)
+        return start, stop
+
+    def aggregate(self, name, start=0, stop=None):
+        """count, min, max, mean, first and last of a column, skipping NaNs"""
+        values = [value for value in self.column(name, start, stop).tolist() if not math.isnan(value)]
+        if not values:
+            return {"count": 0, "min": float('nan'), "max": float('nan'), "mean": float('nan'),
+                    "first": float('nan'), "last": float('nan')}
+        return {
+            "count": len(values),
+            "min": min(values),
+            "max": max(values),
+            "mean": math.fsum(values) / len(values),
+            "first": values[0],
+            "last": values[-1]
+        }
+
+# History columns the analyze command reports on
+ANALYZE_FIELDS = ("difficulty", "hashrate", "emc", "price")
+
+# Analytics kernels over history columns. NumPy is optional and only imported
+# here; every kernel works on whole arrays, loops run over blocks at most.
+
+def forward_fill(values):
+    """Replace NaNs with the last finite value before them, leading NaNs with the first"""
+    import numpy as np
+    finite = np.isfinite(values)
+    if finite.all() or not finite.any():
+        return values
+    index = np.where(finite, np.arange(len(values)), 0)
+    np.maximum.accumulate(index, out=index)
+    filled = values[index]
+    first = int(np.argmax(finite))
+    filled[:first] = values[first]
+    return filled
+
+def rolling_mean(values, window):
+    """Mean of the finite values in the trailing window at each point"""
+    import numpy as np
+    finite = np.isfinite(values)
+    # Centre before the cumulative sums so long series keep their precision
+    offset = values[finite].mean() if finite.any() else 0.0
+    sums = np.cumsum(np.where(finite, values - offset, 0.0))
+    counts = np.cumsum(finite)
+    sums[window:] = sums[window:] - sums[:-window]
+    counts[window:] = counts[window:] - counts[:-window]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / counts + offset, np.nan)
+
+def rolling_std(values, window):
+    """Population standard deviation of the finite values in the trailing window"""
+    import numpy as np
+    finite = np.isfinite(values)
+    offset = values[finite].mean() if finite.any() else 0.0
+    centred = np.where(finite, values - offset, 0.0)
+    sums = np.cumsum(centred)
+    squares = np.cumsum(centred * centred)
+    counts = np.cumsum(finite)
+    sums[window:] = sums[window:] - sums[:-window]
+    squares[window:] = squares[window:] - squares[:-window]
+    counts[window:] = counts[window:] - counts[:-window]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = sums / counts
+        variance = np.maximum(squares / counts - mean * mean, 0.0)
+        return np.where(counts > 1, np.sqrt(variance), np.nan)
+
+def ewma(values, span):
+    """Exponentially weighted moving average with alpha = 2 / (span + 1), seeded with the first value"""
+    import numpy as np
+    values = forward_fill(np.asarray(values, dtype=float))
+    if span <= 1 or not len(values):
+        return values.copy()
+    alpha = 2.0 / (span + 1)
+    decay = 1.0 - alpha
+    # y[j] = decay**(j+1) * (y[-1] + alpha * sum(x[i] / decay**(i+1))) per block;
+    # blocks are short enough that decay**-k never overflows
+    block = max(1, int(50 / -math.log(decay)))
+    out = np.empty_like(values)
+    previous = values[0]
+    for start in range(0, len(values), block):
+        chunk = values[start:start + block]
+        powers = decay ** np.arange(1, len(chunk) + 1)
+        out[start:start + len(chunk)] = powers * (previous + alpha * np.cumsum(chunk / powers))
+        previous = out[start + len(chunk) - 1]
+    return out
+
+def log_returns(values):
+    """Per-sample log changes, NaN where either side is missing or not positive"""
+    import numpy as np
+    with np.errstate(invalid="ignore", divide="ignore"):
+        logs = np.where(values > 0, np.log(values), np.nan)
+    return np.concatenate(([np.nan], np.diff(logs)))
+
+def trend_per_day(timestamps, values):
+    """Least-squares slope of values against time, in units per day"""
+    import numpy as np
+    finite = np.isfinite(values) & np.isfinite(timestamps)
+    if finite.sum() < 2:
+        return float('nan')
+    days = (timestamps[finite] - timestamps[finite][0]) / 86400
+    days = days - days.mean()
+    if not days.any():
+        return float('nan')
+    centred = values[finite] - values[finite].mean()
+    return float((days * centred).sum() / (days * days).sum())
+
+def analyze_history(table, window=ANALYZE_WINDOW, fields=ANALYZE_FIELDS):
+    """Rolling statistics and correlations for history records.
+
+    Args:
+        table: 2-D float array with one row per record in HISTORY_FIELDS order.
+        window (int): Samples per rolling window, also the EWMA span.
+
+    Returns:
+        dict: per-field results plus "correlation" (matrix over fields) and "samples".
+    """
+    import numpy as np
+    timestamps = table[:, HISTORY_FIELDS.index("timestamp")]
+    report = {"samples": len(table), "fields": {}}
+    columns = []
+    for name in fields:
+        values = np.ascontiguousarray(table[:, HISTORY_FIELDS.index(name)])
+        columns.append(values)
+        finite = values[np.isfinite(values)]
+        report["fields"][name] = {
+            "last": float(finite[-1]) if len(finite) else float('nan'),
+            "mean": float(rolling_mean(values, window)[-1]),
+            "ewma": float(ewma(values, window)[-1]),
+            "volatility": float(rolling_std(log_returns(values), window)[-1]),
+            "trend": trend_per_day(timestamps, values)
+        }
+    data = np.vstack(columns)
+    complete = np.isfinite(data).all(axis=0)
+    if complete.sum() > 2:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            report["correlation"] = np.corrcoef(data[:, complete])
+    else:
+        report["correlation"] = np.full((len(fields), len(fields)), np.nan)
+    return report
+
+def parse_duration(text):
+    """Seconds in a span like 90s, 30m, 12h, 7d or 2w"""
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+    if len(text) < 2 or text[-1] not in units:
+        raise ValueError(f"Invalid duration: {text}")
+    return float(text[:-1]) * units[text[-1]]
+
+class MetricSeries:
+    """Latency samples and event times recorded under one metric name"""
+    def __init__(self, samples=METRICS_SAMPLES):
+        self.samples = deque(maxlen=samples)
+        self.events = deque()
+        self.calls = 0
+        self.errors = 0
+        self.total = 0.0
+
+    def prune(self, now, window):
+        while self.events and self.events[0] < now - window:
+            self.events.popleft()
+
+    def percentile(self, q):
+        if not self.samples:
+            return float('nan')
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class Metrics:
+    """Thread-safe per-phase timers, event counters and rolling rates.
+
+    Timed phases keep their last samples for p50/p95/p99 and their total time;
+    every timing or count also lands in a rolling window used for per-second rates.
+    """
+    def __init__(self, window=METRICS_RATE_WINDOW):
+        self.window = window
+        self.series = {}
+        self.lock = threading.Lock()
+        self.started_at = time.monotonic()
+
+    def _series(self, name):
+        series = self.series.get(name)
+        if series is None:
+            series = self.series[name] = MetricSeries()
+        return series
+
+    def record(self, name, seconds, error=False):
+        """Add one timed call of seconds to the named phase"""
+        now = time.monotonic()
+        with self.lock:
+            series = self._series(name)
+            series.calls += 1
+            series.total += seconds
+            series.samples.append(seconds)
+            series.events.append(now)
+            if error:
+                series.errors += 1
+            series.prune(now, self.window)
+
+    def count(self, name, n=1):
+        """Count n untimed events, such as mined blocks"""
+        now = time.monotonic()
+        with self.lock:
+            series = self._series(name)
+            series.calls += n
+            series.events.extend([now] * n)
+            series.prune(now, self.window)
+
+    @contextmanager
+    def timer(self, name):
+        """Time the enclosed block as one call of the named phase"""
+        start = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.record(name, time.perf_counter() - start, error)
+
+    def rate(self, name):
+        """Events per second over the rolling window"""
+        now = time.monotonic()
+        with self.lock:
+            series = self.series.get(name)
+            if series is None:
+                return 0.0
+            series.prune(now, self.window)
+            span = min(self.window, now - self.started_at)
+            return len(series.events) / span if span > 0 else 0.0
+
+    def percentiles(self, name):
+        """Return (p50, p95, p99) latency in seconds, nan if nothing was timed"""
+        with self.lock:
+            series = self.series.get(name)
+            if series is None:
+                return (float('nan'),) * 3
+            return tuple(series.percentile(q) for q in (0.50, 0.95, 0.99))
+
+    def reset(self):
+        with self.lock:
+            self.series.clear()
+            self.started_at = time.monotonic()
+
+    def summary(self):
+        """Per-phase table of calls, errors, total time, rate and latency percentiles"""
+        with self.lock:
+            names = sorted(self.series)
+        if not names:
+            return "No metrics recorded yet\n"
+        lines = [
+            f"{'Metric':<22}{'Calls':>7}{'Errors':>7}{'Total s':>9}{'Rate/s':>8}"
+            f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+        ]
+        for name in names:
+            rate = self.rate(name)
+            p50, p95, p99 = self.percentiles(name)
+            with self.lock:
+                series = self.series[name]
+                calls, errors, total = series.calls, series.errors, series.total
+            latency = "".join(
+                f"{'-':>9}" if math.isnan(value) else f"{value * 1000:>9.1f}" for value in (p50, p95, p99)
+            )
+            lines.append(f"{name:<22}{calls:>7}{errors:>7}{total:>9.2f}{rate:>8.3f}{latency}")
+        return "\n".join(lines) + "\n"
+
+    def status_line(self):
+        """Short live summary for the status bar, empty until a block was mined"""
+        with self.lock:
+            if "blocks" not in self.series:
+                return ""
+        text = f"{self.rate('blocks') * 60:.2f} blk/min"
+        for name in ("generate", "stats"):
+            p50, p95, _ = self.percentiles(name)
+            if not math.isnan(p50):
+                text += f" | {name} p50 {p50:.2f}s p95 {p95:.2f}s"
+        return text
+
+@dataclass
+class MiningResult:
+    """Exact block counts for one or more mining runs"""
+    requested: int = 0
+    attempted: int = 0
+    mined: int = 0
+    cancelled: int = 0
+    hashes: list = field(default_factory=list)
+
+    def add(self, other):
+        self.requested += other.requested
+        self.attempted += other.attempted
+        self.mined += other.mined
+        self.cancelled += other.cancelled
+        self.hashes.extend(other.hashes)
+
+class MiningScheduler:
+    """Mines exactly the requested number of blocks with one generate call per block.
+
+    Each call asks for a single block, so cancelling aborts at most one in-flight
+    call; max_tries additionally bounds how long the daemon hashes per call.
+    """
+    def __init__(self, node, address=None, max_tries=MINING_MAX_TRIES, metrics=None):
+        self.node = node
+        self.address = address
+        self.max_tries = max_tries
+        self.metrics = metrics
+
+    def _generate(self, cancel):
+        params = [1]
+        method = "generate"
+        if self.address:
+            method = "generatetoaddress"
+            params.append(self.address)
+        if self.max_tries is not None:
+            params.append(self.max_tries)
+        if self.metrics is None:
+            return self.node.call(method, *params, cancel=cancel)
+        with self.metrics.timer("generate"):
+            return self.node.call(method, *params, cancel=cancel)
+
+    def run(self, blocks, cancel, on_block=None):
+        """Mine until blocks are found or cancel fires; RPC errors propagate"""
+        result = MiningResult(requested=blocks)
+        try:
+            while result.mined < blocks and not cancel.cancelled:
+                result.attempted += 1
+                hashes = self._generate(cancel)
+                # An empty list means max_tries ran out without a block
+                for block_hash in hashes if isinstance(hashes, list) else []:
+                    result.mined += 1
+                    result.hashes.append(block_hash)
+                    if self.metrics is not None:
+                        self.metrics.count("blocks")
+                    if on_block:
+                        on_block(block_hash, result)
+        except RPCCancelled:
+            pass
+        if cancel.cancelled:
+            result.cancelled = blocks - result.mined
+        return result
+
+class MiningWorker:
+    """Mines on one node in its own thread and keeps per-node counters"""
+    def __init__(self, name, node, report, metrics=None):
+        self.name = name
+        self.node = node
+        self.report = report
+        self.metrics = metrics
+        self.thread = None
+        self.cancel = CancelToken()
+        self.mined = 0
+        self.errors = 0
+        self.last_hash = None
+        self.last_error = None
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    @property
+    def blocks_per_minute(self):
+        if self.started_at is None:
+            return 0.0
+        elapsed = (self.finished_at or time.monotonic()) - self.started_at
+        return self.mined * 60 / elapsed if elapsed > 0 else 0.0
+
+    def start(self, blocks, repeating):
+        """Start mining unless this node is already busy"""
+        if self.running:
+            return False
+        self.cancel = CancelToken()
+        self.mined = 0
+        self.errors = 0
+        self.last_error = None
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self.thread = threading.Thread(
+            target=self._run,
+            args=(blocks, repeating, self.cancel),
+            daemon=True
+        )
+        self.thread.start()
+        return True
+
+    def stop(self):
+        self.cancel.cancel()
+
+    def _on_block(self, block_hash, progress):
+        self.mined += 1
+        self.last_hash = block_hash
+        self.report(f"[{self.name}] Mined block {block_hash}\n", "output")
+
+    def _run(self, blocks, repeating, cancel):
+        scheduler = MiningScheduler(self.node, metrics=self.metrics)
+        try:
+            while not cancel.cancelled:
+                scheduler.run(blocks, cancel, on_block=self._on_block)
+                if not repeating:
+                    break
+        except RPCError as e:
+            self.errors += 1
+            self.last_error = str(e)
+            self.report(f"[{self.name}] Mining error: {e}\n", "error")
+        finally:
+            self.finished_at = time.monotonic()
+            tag = "warning" if cancel.cancelled or self.errors else "success"
+            self.report(f"[{self.name}] Finished: {self.mined} mined, {self.errors} errors\n", tag)
+
+class MiningOrchestrator:
+    """Runs one MiningWorker per node endpoint"""
+    def __init__(self, nodes, report, metrics=None):
+        self.workers = {name: MiningWorker(name, node, report, metrics) for name, node in nodes.items()}
+
+    @property
+    def active(self):
+        return [name for name, worker in self.workers.items() if worker.running]
+
+    def resolve(self, spec):
+        """Turn 'all' or a comma separated list into node names"""
+        if spec == "all":
+            return list(self.workers)
+        names = [name for name in spec.split(",") if name]
+        unknown = [name for name in names if name not in self.workers]
+        if unknown:
+            raise KeyError(", ".join(unknown))
+        return names
+
+    def start(self, names, blocks, repeating):
+        """Start the named workers; returns (started, busy) name lists"""
+        started, busy = [], []
+        for name in names:
+            if self.workers[name].start(blocks, repeating):
+                started.append(name)
+            else:
+                busy.append(name)
+        return started, busy
+
+    def stop(self, names=None):
+        """Stop the named workers, or all running ones; returns the names stopped"""
+        stopped = []
+        for name in names or self.active:
+            worker = self.workers[name]
+            if worker.running:
+                worker.stop()
+                stopped.append(name)
+        return stopped
+
+    def summary(self):
+        """Combined per-node view as text"""
+        lines = [f"{'Node':<12}{'Link':<6}{'State':<9}{'Mined':>7}{'Errors':>8}{'Blocks/min':>12}"]
+        total_mined = 0
+        total_rate = 0.0
+        for name, worker in self.workers.items():
+            state = "mining" if worker.running else "idle"
+            lines.append(
+                f"{name:<12}{worker.node.transport:<6}{state:<9}{worker.mined:>7}{worker.errors:>8}"
+                f"{worker.blocks_per_minute:>12.2f}"
+            )
+            total_mined += worker.mined
+            if worker.running:
+                total_rate += worker.blocks_per_minute
+        lines.append(f"{'Total':<27}{total_mined:>7}{'':>8}{total_rate:>12.2f}")
+        return "\n".join(lines) + "\n"
+
+@dataclass
+class WalletJob:
+    """One wallet call running on the worker pool"""
+    job_id: int
+    description: str
+    cancel: CancelToken = field(default_factory=CancelToken)
+    started: float = field(default_factory=time.monotonic)
+    timed_out: bool = False
+    # Shown when the call may have reached the node but its result never arrived
+    outcome_hint: str = None
+
+    @property
+    def name(self):
+        return f"w{self.job_id}"
+
+class WalletJobs:
+    """Runs wallet calls on a small thread pool so no front end waits on the node.
+
+    Every job gets a CancelToken that aborts its node call, fired by cancel() or
+    by a timer after timeout seconds; results and errors go through report.
+    Abandoning the wait does not undo a call the node already received, so a
+    job's outcome_hint is reported whenever its outcome is unknown.
+    """
+    def __init__(self, report, workers=WALLET_WORKERS, timeout=WALLET_TIMEOUT):
+        self.report = report
+        self.timeout = timeout
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="wallet")
+        self.jobs = {}
+        self.next_id = 1
+        self.lock = threading.Lock()
+
+    def pending(self):
+        with self.lock:
+            return list(self.jobs.values())
+
+    def submit(self, description, call, on_result, timeout=None, outcome_hint=None):
+        """Run call(cancel) on the pool and pass its result to on_result(job, result).
+
+        timeout defaults to the pool's; 0 lets long jobs such as payouts run until cancelled.
+        """
+        with self.lock:
+            job = WalletJob(self.next_id, description, outcome_hint=outcome_hint)
+            self.next_id += 1
+            self.jobs[job.job_id] = job
+        timeout = self.timeout if timeout is None else timeout
+        timer = threading.Timer(timeout, self._expire, args=(job,))
+        timer.daemon = True
+        if timeout:
+            timer.start()
+        self.executor.submit(self._run, job, call, on_result, timer)
+        return job
+
+    def cancel(self, job_id=None):
+        """Cancel one job, or all when job_id is None; returns the jobs cancelled"""
+        with self.lock:
+            jobs = list(self.jobs.values()) if job_id is None else [self.jobs[job_id]] if job_id in self.jobs else []
+        for job in jobs:
+            job.cancel.cancel()
+        return jobs
+
+    def _expire(self, job):
+        job.timed_out = True
+        job.cancel.cancel()
+
+    def _outcome_unknown(self, job):
+        if job.outcome_hint:
+            self.report(f"[{job.name}] {job.outcome_hint}\n", "warning")
+
+    def _run(self, job, call, on_result, timer):
+        started = False
+        try:
+            if job.cancel.cancelled:
+                raise RPCCancelled("Call cancelled")
+            started = True
+            on_result(job, call(job.cancel))
+        except RPCCancelled:
+            if job.timed_out:
+                self.report(f"[{job.name}] {job.description} timed out after {timer.interval}s\n", "error")
+            else:
+                self.report(f"[{job.name}] {job.description} cancelled\n", "warning")
+            if started:
+                self._outcome_unknown(job)
+        except RPCOutcomeUnknown as e:
+            self.report(f"[{job.name}] Wallet error: {str(e)}\n", "error")
+            self._outcome_unknown(job)
+        except Exception as e:
+            self.report(f"[{job.name}] Wallet error: {str(e)}\n", "error")
+        finally:
+            timer.cancel()
+            with self.lock:
+                self.jobs.pop(job.job_id, None)
+
+    def shutdown(self):
+        self.cancel()
+        self.executor.shutdown(wait=False)
+
+@dataclass
+class ShellJob:
+    """One system command running in the background"""
+    job_id: int
+    command: str
+    process: subprocess.Popen
+    started: float = field(default_factory=time.monotonic)
+    shown: int = 0
+    spill_path: str = None
+    spill: object = None
+    killed: bool = False
+    # Started with & and left out of foreground()
+    background: bool = False
+
+    @property
+    def name(self):
+        return f"%{self.job_id}"
+
+class ShellJobs:
+    """Runs system commands without blocking, streaming their output in chunks.
+
+    Each job gets a reader thread per stream; text goes through report as it
+    arrives. Past output_limit bytes a job's output is written to a spill file
+    instead, kept after the job ends until clear() or shutdown() deletes it.
+    The newest job still running is the foreground one for interrupt().
+    """
+    def __init__(self, report, output_limit=SHELL_OUTPUT_LIMIT):
+        self.report = report
+        self.output_limit = output_limit
+        self.jobs = {}
+        # Spill files of finished jobs, by job name
+        self.spills = {}
+        self.closed = False
+        self.next_id = 1
+        self.lock = threading.Lock()
+
+    def running(self):
+        with self.lock:
+            return list(self.jobs.values())
+
+    def kept(self):
+        """(job name, path) of spill files left by finished jobs"""
+        with self.lock:
+            return list(self.spills.items())
+
+    def clear(self):
+        """Delete the spill files of finished jobs; returns how many were removed"""
+        with self.lock:
+            paths = list(self.spills.values())
+            self.spills.clear()
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return len(paths)
+
+    def run(self, command, background=False):
+        # Own process group, so signals reach the whole pipeline and not the terminal
+        if os.name == "nt":
+            options = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+        else:
+            options = {"start_new_session": True}
+        process = subprocess.Popen(
+            command, shell=True, cwd=os.getcwd(), stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, **options
+        )
+        with self.lock:
+            job = ShellJob(self.next_id, command, process, background=background)
+            self.next_id += 1
+            self.jobs[job.job_id] = job
+        readers = [
+            threading.Thread(target=self._read, args=(job, stream, tag), daemon=True)
+            for stream, tag in ((process.stdout, "output"), (process.stderr, "error"))
+        ]
+        for reader in readers:
+            reader.start()
+        threading.Thread(target=self._wait, args=(job, readers), daemon=True).start()
+        return job
+
+    def _read(self, job, stream, tag):
+        decoder = codecs.getincrementaldecoder(locale.getpreferredencoding(False))(errors="replace")
+        while True:
+            data = stream.read1(SHELL_CHUNK)
+            if not data:
+                break
+            text = decoder.decode(data)
+            with self.lock:
+                if job.spill is None and job.shown + len(data) > self.output_limit:
+                    spill = tempfile.NamedTemporaryFile(
+                        "w", encoding="utf-8", prefix=f"job{job.job_id}_", suffix=".log", delete=False
+                    )
+                    job.spill, job.spill_path = spill, spill.name
+                    self.report(
+                        f"[{job.name}] more than {self.output_limit // 1024} KB of output, "
+                        f"the rest goes to {job.spill_path}\n", "warning"
+                    )
+                if job.spill is None:
+                    job.shown += len(data)
+                else:
+                    job.spill.write(text)
+                    continue
+            self.report(text, tag)
+        stream.close()
+
+    def _wait(self, job, readers):
+        for reader in readers:
+            reader.join()
+        code = job.process.wait()
+        with self.lock:
+            self.jobs.pop(job.job_id, None)
+            if job.spill is not None:
+                job.spill.close()
+                if self.closed:
+                    os.remove(job.spill_path)
+                else:
+                    self.spills[job.name] = job.spill_path
+        if job.killed:
+            self.report(f"[{job.name}] Stopped  {job.command}\n", "warning")
+        elif code:
+            self.report(f"[{job.name}] Exit {code}  {job.command}\n", "error")
+
+    def foreground(self):
+        """Newest running job not started with &, or None"""
+        with self.lock:
+            return next((job for job in reversed(self.jobs.values()) if not job.background), None)
+
+    def interrupt(self, job):
+        """Send Ctrl+C to the job's process group"""
+        job.killed = True
+        if os.name == "nt":
+            job.process.send_signal(signal.CTRL_BREAK_EVENT)
+        else:
+            os.killpg(job.process.pid, signal.SIGINT)
+
+    def kill(self, job):
+        """Terminate the job, forcing it down if it is still alive after SHELL_KILL_GRACE seconds"""
+        job.killed = True
+        if os.name == "nt":
+            job.process.kill()
+            return
+        os.killpg(job.process.pid, signal.SIGTERM)
+
+        def force():
+            if job.process.poll() is None:
+                os.killpg(job.process.pid, signal.SIGKILL)
+
+        timer = threading.Timer(SHELL_KILL_GRACE, force)
+        timer.daemon = True
+        timer.start()
+
+    def shutdown(self):
+        """Stop every job and delete the spill files; running jobs delete theirs as they exit"""
+        with self.lock:
+            self.closed = True
+        for job in self.running():
+            try:
+                self.kill(job)
+            except OSError:
+                pass
+        self.clear()
+
+BASE58_ALPHABET = set("123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz")
+
+def read_payout_file(path):
+    """Stream (line_number, address, Decimal amount) rows from an address,amount CSV.
+
+    Blank lines and lines starting with # are skipped, as is a header row.
+    Malformed rows raise ValueError naming their line.
+    """
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for line_number, row in enumerate(csv.reader(f), 1):
+            if not row or not row[0].strip() or row[0].lstrip().startswith("#"):
+                continue
+            if len(row) < 2:
+                raise ValueError(f"line {line_number}: expected address,amount")
+            address, amount = row[0].strip(), row[1].strip()
+            try:
+                amount = Decimal(amount)
+            except InvalidOperation:
+                if line_number == 1:
+                    continue
+                raise ValueError(f"line {line_number}: invalid amount {amount!r}")
+            yield line_number, address, amount
+
+class PayoutJournal:
+    """Append-only JSON lines journal of payout batches.
+
+    A batch is written as "sending" before its sendmany and "sent" with the txid
+    after, each synced to disk, so a rerun skips paid batches and can tell which
+    one was in flight when it stopped. A sendmany whose reply was lost is
+    written as "unknown" and is never resent automatically.
+    """
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+
+    def load(self):
+        """Return (header, {batch: last entry}) from an existing journal"""
+        header, batches = None, {}
+        if not os.path.exists(self.path):
+            return header, batches
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A torn last line from a crash carries no decision
+                    continue
+                if entry.get("type") == "start":
+                    header = entry
+                elif "batch" in entry:
+                    batches[entry["batch"]] = entry
+        return header, batches
+
+    def record(self, entry):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+class PayoutRun:
+    """Validates a payout file and pays it through batched sendmany calls"""
+    def __init__(self, node, path, report, batch_size=PAYOUT_BATCH_SIZE):
+        self.node = node
+        self.path = os.path.abspath(path)
+        self.report = report
+        self.batch_size = batch_size
+        self.journal = PayoutJournal(self.path + ".journal")
+
+    def file_digest(self):
+        digest = hashlib.sha256()
+        with open(self.path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def validate(self, cancel):
+        """Read every row, check amounts locally and addresses with batched validateaddress.
+
+        Returns:
+            tuple: (rows, errors) where rows are (line, address, amount).
+        """
+        rows, errors, pending = [], [], {}
+        for line_number, address, amount in read_payout_file(self.path):
+            if not amount.is_finite():
+                errors.append(f"line {line_number}: amount {amount} is not a finite number")
+            elif amount <= 0 or amount.as_tuple().exponent < -8:
+                errors.append(f"line {line_number}: amount {amount} must be positive with at most 8 decimals")
+            elif not (25 <= len(address) <= 36 and set(address) <= BASE58_ALPHABET):
+                errors.append(f"line {line_number}: malformed address {address}")
+            else:
+                rows.append((line_number, address, amount))
+                pending.setdefault(address, []).append(line_number)
+
+        addresses = list(pending)
+        rejected = set()
+        for start in range(0, len(addresses), PAYOUT_VALIDATE_CHUNK):
+            if cancel.cancelled:
+                raise RPCCancelled("Call cancelled")
+            chunk = addresses[start:start + PAYOUT_VALIDATE_CHUNK]
+            for address, (result, error) in zip(chunk, self.node.batch([("validateaddress", a) for a in chunk])):
+                if error is not None or not (isinstance(result, dict) and result.get("isvalid")):
+                    rejected.add(address)
+                    lines = ", ".join(str(n) for n in pending[address])
+                    errors.append(f"line {lines}: {address} rejected by node ({error or 'invalid'})")
+        return [row for row in rows if row[1] not in rejected], errors
+
+    def batches(self, rows):
+        """Group rows into sendmany batches, moving repeat addresses to a later batch"""
+        batches, current, seen = [], [], set()
+        for row in rows:
+            if len(current) == self.batch_size or row[1] in seen:
+                batches.append(current)
+                current, seen = [], set()
+            current.append(row)
+            seen.add(row[1])
+        if current:
+            batches.append(current)
+        return batches
+
+    def _comment(self, digest, number):
+        return f"payout {digest[:16]} batch {number}"
+
+    def _find_sent(self, comment):
+        """txid of a wallet send carrying comment, or None"""
+        for tx in self.node.call("listtransactions", "*", PAYOUT_RECOVERY_SCAN) or []:
+            if tx.get("category") == "send" and tx.get("comment") == comment:
+                return tx.get("txid")
+        return None
+
+    def _send_batch(self, amounts, comment):
+        """One sendmany on the node's own transport: never retried, never moved to the CLI"""
+        backend = self.node.rpc or self.node.cli
+        return backend.call("sendmany", "", amounts, 1, comment)
+
+    def run(self, cancel, check_only=False):
+        """Validate, then pay every batch not already sent; returns a summary line"""
+        rows, errors = self.validate(cancel)
+        for error in errors[:20]:
+            self.report(f"  {error}\n", "error")
+        if errors:
+            raise ValueError(f"{len(errors)} invalid rows in {os.path.basename(self.path)}, nothing sent")
+        total = sum((row[2] for row in rows), Decimal(0))
+        batches = self.batches(rows)
+        if check_only:
+            return f"{len(rows)} payments totalling {total} in {len(batches)} batches, all valid"
+
+        digest = self.file_digest()
+        header, done = self.journal.load()
+        if header is None:
+            self.journal.record({"type": "start", "sha256": digest, "batch_size": self.batch_size,
+                                 "rows": len(rows), "total": str(total)})
+        elif header.get("sha256") != digest or header.get("batch_size") != self.batch_size:
+            raise ValueError(f"{self.journal.path} belongs to a different file or batch size; move it aside to start over")
+
+        sent = skipped = 0
+        for number, batch in enumerate(batches, 1):
+            if cancel.cancelled:
+                raise RPCCancelled("Call cancelled")
+            comment = self._comment(digest, number)
+            entry = done.get(number)
+            if entry and entry["state"] == "sent":
+                skipped += 1
+                continue
+            if entry and entry["state"] in ("sending", "unknown"):
+                # Stopped mid-call last time: only resend if the wallet has no such send
+                txid = self._find_sent(comment)
+                if txid:
+                    self.journal.record({"batch": number, "state": "sent", "txid": txid, "recovered": True})
+                    self.report(f"  batch {number}: already sent as {txid}\n", "warning")
+                    skipped += 1
+                    continue
+                if entry["state"] == "unknown":
+                    raise ValueError(
+                        f"batch {number} outcome unknown and no wallet send has comment '{comment}' yet; "
+                        f"check the node, then delete its 'unknown' line from {self.journal.path} to resend it"
+                    )
+            amounts = {address: float(amount) for _, address, amount in batch}
+            self.journal.record({"batch": number, "state": "sending", "lines": [batch[0][0], batch[-1][0]]})
+            # The send itself is not cancellable; cancelling stops before the next batch
+            try:
+                txid = self._send_batch(amounts, comment)
+            except RPCOutcomeUnknown as e:
+                self.journal.record({"batch": number, "state": "unknown", "error": str(e)})
+                raise RPCOutcomeUnknown(
+                    f"batch {number} may have been paid ({e}); look for a send with comment '{comment}', "
+                    f"a rerun marks the batch paid once the wallet lists it"
+                ) from e
+            self.journal.record({"batch": number, "state": "sent", "txid": txid})
+            sent += 1
+            self.report(f"  batch {number}/{len(batches)}: {len(batch)} outputs, txid {txid}\n", "output")
+        return f"Payout complete: {sent} batches sent, {skipped} already paid, {len(rows)} payments totalling {total}"
+
+class TransactionIndex:
+    """SQLite index of wallet transactions, caught up with listsinceblock.
+
+    The block hash reached by the last sync is stored with the rows, so each
+    sync only asks the node for transactions after it. Rows keep the height of
+    their block and confirmations are counted from the tip height at query
+    time, so old rows never show the count from when they were synced.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS transactions (
+            txid TEXT NOT NULL,
+            vout INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            address TEXT NOT NULL,
+            amount REAL NOT NULL,
+            fee REAL,
+            blockheight INTEGER,
+            blockhash TEXT,
+            time INTEGER,
+            comment TEXT,
+            PRIMARY KEY (txid, vout, category, address)
+        );
+        CREATE INDEX IF NOT EXISTS tx_address ON transactions (address);
+        CREATE INDEX IF NOT EXISTS tx_time ON transactions (time);
+        CREATE INDEX IF NOT EXISTS tx_amount ON transactions (amount);
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+    """
+
+    def __init__(self, path=TX_INDEX_FILE):
+        self.path = os.path.abspath(path)
+        self.db = None
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        if self.db is None:
+            self.db = sqlite3.connect(self.path, check_same_thread=False)
+            self.db.executescript(self.SCHEMA)
+        return self.db
+
+    def _meta(self, key):
+        with self.lock:
+            row = self._connect().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    @property
+    def last_block(self):
+        return self._meta("lastblock")
+
+    @property
+    def tip_height(self):
+        """Chain height at the last sync"""
+        value = self._meta("tipheight")
+        return int(value) if value is not None else None
+
+    @staticmethod
+    def _block_height(tx, tip):
+        if tx.get("blockheight") is not None:
+            return tx["blockheight"]
+        # Older daemons only report confirmations, relative to the current tip
+        confirmations = tx.get("confirmations") or 0
+        return tip - confirmations + 1 if confirmations > 0 else None
+
+    def sync(self, node, cancel=None):
+        """Fetch transactions since the last synced block; returns how many rows changed"""
+        last_block = self.last_block
+        params = (last_block,) if last_block else ()
+        result = node.call("listsinceblock", *params, cancel=cancel)
+        tip = int(node.call("getblockcount", cancel=cancel))
+        rows = [
+            (
+                tx["txid"], tx.get("vout", -1), tx.get("category", ""), tx.get("address", ""),
+                tx.get("amount", 0.0), tx.get("fee"), self._block_height(tx, tip), tx.get("blockhash"),
+                tx.get("blocktime") or tx.get("time"), tx.get("comment")
+            )
+            for tx in result.get("transactions", [])
+        ]
+        with self.lock:
+            db = self._connect()
+            with db:
+                db.executemany("INSERT OR REPLACE INTO transactions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                # Transactions a reorg dropped, reported by newer daemons
+                db.executemany(
+                    "DELETE FROM transactions WHERE txid = ?",
+                    [(tx["txid"],) for tx in result.get("removed", [])]
+                )
+                db.execute("INSERT OR REPLACE INTO meta VALUES ('lastblock', ?)", (result.get("lastblock"),))
+                db.execute("INSERT OR REPLACE INTO meta VALUES ('tipheight', ?)", (tip,))
+        return len(rows)
+
+    def query(self, txid=None, address=None, since=None, min_amount=None, max_amount=None,
+              limit=TX_QUERY_LIMIT, tip=None):
+        """Newest-first rows matching every given filter; txid matches as a prefix.
+
+        Amount bounds apply to the absolute amount, written as ranges on the
+        signed column so they can use its index. Confirmations are counted
+        from tip, the height at the last sync by default.
+        """
+        if tip is None:
+            tip = self.tip_height
+        clauses, params = [], []
+        if txid:
+            clauses.append("txid >= ? AND txid < ?")
+            params += [txid, txid + "g"]
+        if address:
+            clauses.append("address = ?")
+            params.append(address)
+        if since is not None:
+            clauses.append("time >= ?")
+            params.append(int(since))
+        if min_amount is not None:
+            clauses.append("(amount >= ? OR amount <= ?)")
+            params += [min_amount, -min_amount]
+        if max_amount is not None:
+            clauses.append("amount BETWEEN ? AND ?")
+            params += [-max_amount, max_amount]
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql = (f"SELECT txid, category, address, amount, "
+               f"CASE WHEN blockheight IS NULL THEN 0 ELSE ? - blockheight + 1 END, time "
+               f"FROM transactions {where} ORDER BY time DESC LIMIT ?")
+        with self.lock:
+            return self._connect().execute(sql, [tip or 0] + params + [limit]).fetchall()
+
+    def count(self):
+        with self.lock:
+            return self._connect().execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+
+    def addresses(self):
+        """Every distinct address in the index, for completion"""
+        with self.lock:
+            return [row[0] for row in self._connect().execute(
+                "SELECT DISTINCT address FROM transactions WHERE address != ''"
+            )]
+
+    def close(self):
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+class ChainCache:
+    """Block and transaction lookups behind an LRU cache that knows about confirmations.
+
+    Objects buried deep enough cannot change, so they stay in memory and in a
+    SQLite file for later sessions; anything nearer the tip expires after
+    tip_ttl seconds because a reorg may still replace it. Transactions are
+    stored with the height of their block, and confirmation counts of cached
+    objects are recomputed from the tip height, which is held in memory only.
+    """
+    def __init__(self, node, path=CHAIN_CACHE_FILE, capacity=CHAIN_CACHE_SIZE,
+                 deep=CHAIN_DEEP_CONFIRMATIONS, tip_ttl=CHAIN_TIP_TTL):
+        self.node = node
+        self.path = os.path.abspath(path)
+        self.capacity = capacity
+        self.deep = deep
+        self.tip_ttl = tip_ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.db = None
+        # (height, expires) of the chain tip
+        self.tip = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _connect(self):
+        if self.db is None:
+            self.db = sqlite3.connect(self.path, check_same_thread=False)
+            self.db.execute("CREATE TABLE IF NOT EXISTS objects (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        return self.db
+
+    def _get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires is None or expires > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.entries[key]
+            row = self._connect().execute("SELECT value FROM objects WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            value = json.loads(row[0])
+            self._remember(key, value, None)
+            return value
+
+    def _remember(self, key, value, expires):
+        self.entries[key] = (value, expires)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def _put(self, key, value, permanent):
+        with self.lock:
+            self._remember(key, value, None if permanent else time.monotonic() + self.tip_ttl)
+            if permanent:
+                db = self._connect()
+                with db:
+                    db.execute("INSERT OR REPLACE INTO objects VALUES (?, ?)", (key, json.dumps(value)))
+
+    def tip_height(self):
+        with self.lock:
+            if self.tip is not None and self.tip[1] > time.monotonic():
+                return self.tip[0]
+        height = int(self.node.call("getblockcount"))
+        with self.lock:
+            self.tip = (height, time.monotonic() + self.tip_ttl)
+        return height
+
+    def confirmations(self, height):
+        return max(self.tip_height() - height + 1, 0)
+
+    def block_hash(self, height):
+        key = f"height:{height}"
+        block_hash = self._get(key)
+        if block_hash is None:
+            block_hash = self.node.call("getblockhash", height)
+            self._put(key, block_hash, self.confirmations(height) >= self.deep)
+        return block_hash
+
+    def block(self, ref):
+        """Block by height or hash, as (block, cached) with current confirmations"""
+        block_hash = self.block_hash(int(ref)) if len(ref) < 64 and ref.isdigit() else ref
+        key = f"block:{block_hash}"
+        block = self._get(key)
+        cached = block is not None
+        if not cached:
+            block = self.node.call("getblock", block_hash)
+            # Orphaned blocks report -1 and must not be kept
+            self._put(key, block, block.get("confirmations", 0) >= self.deep)
+        elif "height" in block:
+            block = dict(block, confirmations=self.confirmations(block["height"]))
+        return block, cached
+
+    def transaction(self, txid):
+        """Transaction by txid, as (tx, cached) with current confirmations"""
+        key = f"tx:{txid}"
+        tx = self._get(key)
+        cached = tx is not None
+        if not cached:
+            try:
+                tx = self.node.call("getrawtransaction", txid, 1)
+            except RPCError:
+                # Without -txindex only wallet transactions can be looked up
+                tx = self.node.call("gettransaction", txid)
+            confirmations = tx.get("confirmations") or 0
+            if tx.get("blockhash") and tx.get("blockheight") is None and confirmations > 0:
+                tx = dict(tx, blockheight=self.tip_height() - confirmations + 1)
+            self._put(key, tx, confirmations >= self.deep)
+        elif tx.get("blockheight") is not None:
+            tx = dict(tx, confirmations=self.confirmations(tx["blockheight"]))
+        return tx, cached
+
+    def stats(self):
+        with self.lock:
+            stored = self._connect().execute("SELECT COUNT(*) FROM objects").fetchone()[0]
+            return {"memory": len(self.entries), "disk": stored, "hits": self.hits,
+                    "disk_hits": self.disk_hits, "misses": self.misses}
+
+    def forget_tip(self):
+        """Drop the cached height so confirmations follow a new block at once"""
+        with self.lock:
+            self.tip = None
+
+    def close(self):
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+def parse_tx_filters(words):
+    """Turn 'wallet tx' arguments into TransactionIndex.query keyword arguments.
+
+    Hex text is a txid prefix, >N / <N bound the absolute amount, spans like 7d
+    set a start time, 'limit N' caps the rows and anything else is an address.
+    """
+    filters = {}
+    words = list(words)
+    while words:
+        word = words.pop(0)
+        if word == "limit" and words:
+            filters["limit"] = int(words.pop(0))
+        elif word[:1] in "<>" and len(word) > 1:
+            filters["min_amount" if word[0] == ">" else "max_amount"] = float(word[1:])
+        elif len(word) >= 2 and word[-1] in "smhdw" and word[:-1].replace(".", "", 1).isdigit():
+            filters["since"] = time.time() - parse_duration(word)
+        elif len(word) >= 8 and all(c in "0123456789abcdef" for c in word.lower()) and len(word) <= 64:
+            filters["txid"] = word.lower()
+        else:
+            filters["address"] = word
+    return filters
+
+@dataclass
+class SchedulePolicy:
+    """Settings for adaptive mining; mode is "ev" (expected value) or "threshold" """
+    mode: str = "ev"
+    min_ev: float = SCHEDULE_MIN_EV
+    max_difficulty: float = SCHEDULE_MAX_DIFFICULTY
+    min_price: float = SCHEDULE_MIN_PRICE
+    block_reward: float = SCHEDULE_BLOCK_REWARD
+    hashrate: float = float('nan')
+    min_batch: int = SCHEDULE_MIN_BATCH
+    max_batch: int = SCHEDULE_MAX_BATCH
+    pause: float = SCHEDULE_PAUSE
+
+    def set(self, name, value):
+        """Set a field from command text, converted to the field's type.
+
+        The new value is checked on a copy, so an invalid one leaves the policy unchanged.
+        """
+        if name not in self.__dataclass_fields__:
+            raise KeyError(name)
+        current = getattr(self, name)
+        if name == "mode" and value not in ("ev", "threshold"):
+            raise ValueError("mode is ev or threshold")
+        candidate = replace(self, **{name: value if isinstance(current, str) else type(current)(value)})
+        if candidate.min_batch < 1 or candidate.max_batch < candidate.min_batch:
+            raise ValueError("need 1 <= min_batch <= max_batch")
+        if not candidate.pause >= 0:
+            raise ValueError("pause must be zero or more seconds")
+        setattr(self, name, getattr(candidate, name))
+
+@dataclass
+class MiningDecision:
+    """What the adaptive scheduler wants next: a batch to mine or a pause"""
+    mine: bool
+    batch: int = 0
+    delay: float = 0.0
+    reason: str = ""
+    ev: float = float('nan')
+
+class AdaptiveScheduler:
+    """Turns the latest cached stats into batch sizes, pacing and pauses.
+
+    decide() only does arithmetic on a NetworkSnapshot, so it can run before
+    every batch and be replayed against recorded history.
+    """
+    def __init__(self, policy=None):
+        self.policy = policy or SchedulePolicy()
+
+    def expected_value(self, stats, hashrate):
+        """Expected BTC per hour at our hashrate: share of blocks x reward x price"""
+        price = stats.prices.get("price", float('nan'))
+        if not (hashrate > 0 and stats.hashrate > 0 and price > 0):
+            return float('nan')
+        blocks_per_hour = hashrate / (stats.hashrate + hashrate) * 3600 / BLOCK_TIME
+        return blocks_per_hour * self.policy.block_reward * price
+
+    def _scaled_batch(self, ratio):
+        """Batch between min and max growing with ratio, min_batch at 1 and max at 2+"""
+        policy = self.policy
+        span = policy.max_batch - policy.min_batch
+        return policy.min_batch + int(round(span * min(max(ratio - 1, 0.0), 1.0)))
+
+    def decide(self, stats, hashrate=float('nan')):
+        policy = self.policy
+        if stats is None:
+            return MiningDecision(True, policy.min_batch, reason="no stats yet, mining minimum batch")
+        if policy.hashrate > 0:
+            hashrate = policy.hashrate
+        ev = self.expected_value(stats, hashrate)
+
+        if policy.mode == "threshold":
+            if stats.difficulty > policy.max_difficulty:
+                return MiningDecision(False, delay=policy.pause, ev=ev,
+                                      reason=f"difficulty {stats.difficulty:.6f} above {policy.max_difficulty:g}")
+            price = stats.prices.get("price", float('nan'))
+            if price < policy.min_price:
+                return MiningDecision(False, delay=policy.pause, ev=ev,
+                                      reason=f"price {price:.8f} below {policy.min_price:g}")
+            if math.isinf(policy.max_difficulty) or math.isnan(stats.difficulty):
+                return MiningDecision(True, policy.max_batch, ev=ev, reason="within thresholds")
+            # Mine harder the further difficulty sits below its ceiling
+            ratio = 2 * policy.max_difficulty / max(stats.difficulty, 1e-12) - 1
+            return MiningDecision(True, self._scaled_batch(ratio), ev=ev, reason="within thresholds")
+
+        if math.isnan(ev):
+            return MiningDecision(True, policy.min_batch, ev=ev, reason="no price or hashrate, mining minimum batch")
+        if policy.min_ev <= 0:
+            return MiningDecision(True, policy.max_batch, ev=ev, reason=f"EV {ev:.8f} BTC/h")
+        ratio = ev / policy.min_ev
+        if ratio < 1:
+            return MiningDecision(False, delay=policy.pause, ev=ev,
+                                  reason=f"EV {ev:.8f} BTC/h below {policy.min_ev:g}")
+        # Close to the floor: small batches with a breather so a drop is noticed quickly
+        delay = policy.pause * max(0.0, 1.5 - ratio)
+        return MiningDecision(True, self._scaled_batch(ratio), delay, f"EV {ev:.8f} BTC/h", ev)
+
+class ReplayNode:
+    """Simulated node replaying recorded history for the adaptive scheduler.
+
+    A virtual clock walks through the records; each generate call advances it
+    by the expected time to find a block at our hashrate and current difficulty.
+    """
+    def __init__(self, records, hashrate, block_reward=SCHEDULE_BLOCK_REWARD):
+        self.records = records
+        self.hashrate = hashrate
+        self.block_reward = block_reward
+        self.start = records[0]["timestamp"]
+        self.clock = self.start
+        self.index = 0
+        self.block_count = 0
+        self.value = 0.0
+
+    @property
+    def finished(self):
+        return self.index >= len(self.records) - 1 and self.clock >= self.records[-1]["timestamp"]
+
+    @property
+    def transport(self):
+        return "replay"
+
+    def _advance(self, seconds):
+        self.clock += seconds
+        while self.index + 1 < len(self.records) and self.records[self.index + 1]["timestamp"] <= self.clock:
+            self.index += 1
+
+    def wait(self, seconds):
+        self._advance(seconds)
+
+    def network_snapshot(self):
+        record = self.records[self.index]
+        snapshot = NetworkSnapshot(
+            difficulty=record["difficulty"],
+            hashrate=record["hashrate"],
+            conpeers=record["conpeers"],
+            netpeers=record["netpeers"],
+            block_count=self.block_count,
+            timestamp=self.clock
+        )
+        snapshot.prices["price"] = record["price"]
+        return snapshot
+
+    def call(self, method, *params, cancel=None):
+        if method not in ("generate", "generatetoaddress"):
+            raise RPCError(f"{method} is not replayed")
+        if self.finished:
+            cancel.cancel()
+            raise RPCCancelled("Replay finished")
+        record = self.records[self.index]
+        self._advance(record["difficulty"] * 2**32 / self.hashrate)
+        self.block_count += 1
+        price = record["price"]
+        if price > 0:
+            self.value += self.block_reward * price
+        return [f"{self.block_count:064x}"]
+
+def replay_schedule(records, hashrate, policy=None):
+    """Run adaptive and blind mining over the same records and compare them.
+
+    Returns:
+        dict: blocks, value (BTC at the recorded price) and paused seconds for
+              "adaptive" and "blind" runs.
+    """
+    policy = policy or SchedulePolicy()
+    results = {}
+    for name in ("adaptive", "blind"):
+        node = ReplayNode(records, hashrate, policy.block_reward)
+        adaptive = AdaptiveScheduler(policy)
+        scheduler = MiningScheduler(node)
+        cancel = CancelToken()
+        paused = 0.0
+        while not cancel.cancelled and not node.finished:
+            decision = adaptive.decide(node.network_snapshot(), hashrate) if name == "adaptive" else MiningDecision(True, 1)
+            if not decision.mine:
+                node.wait(decision.delay)
+                paused += decision.delay
+                continue
+            scheduler.run(decision.batch, cancel)
+            if decision.delay:
+                node.wait(decision.delay)
+                paused += decision.delay
+        results[name] = {"blocks": node.block_count, "value": node.value, "paused": paused,
+                         "elapsed": node.clock - node.start}
+    return results
+
+def format_size(size):
+    """Short human readable byte count, e.g. 128M"""
+    for unit in ("B", "K", "M", "G"):
+        if size < 1024:
+            return f"{size:.0f}{unit}" if unit == "B" or size >= 10 else f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}T"
+
+def scan_directory(target=".", sort="name", reverse=False, details=False):
+    """List a directory, or the matches of a glob such as blocks/blk*.dat, in one scandir pass.
+
+    Returns (name, is_dir, size, mtime) tuples sorted by name, size or time;
+    size and mtime are only read when details or a size/time sort needs them.
+    A target that is a file lists as that one entry, named as given, like ls.
+    """
+    if os.path.isdir(target):
+        directory, pattern = target, None
+    elif os.path.lexists(target):
+        info = os.lstat(target)
+        return [(target, False, info.st_size, info.st_mtime)]
+    else:
+        directory, pattern = os.path.split(target)
+        directory = directory or "."
+        if not any(char in pattern for char in "*?["):
+            raise FileNotFoundError(f"No such file or directory: {target}")
+    need_stat = details or sort in ("size", "time")
+    entries = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            if pattern and not fnmatch.fnmatch(entry.name, pattern):
+                continue
+            try:
+                is_dir = entry.is_dir()
+                info = entry.stat() if need_stat else None
+            except OSError:
+                # Broken links and files removed mid-scan
+                is_dir, info = False, None
+            entries.append((entry.name, is_dir, info.st_size if info else 0, info.st_mtime if info else 0))
+    key = {"size": lambda e: e[2], "time": lambda e: e[3]}.get(sort, lambda e: e[0].lower())
+    # Sizes and times read largest/newest first, like ls
+    entries.sort(key=key, reverse=reverse != (sort in ("size", "time")))
+    return entries
+
+def format_listing(entries, details=False, width=LS_WIDTH):
+    """Format entries as packed columns, or one line each with size and time, in one string"""
+    names = [name + ("/" if is_dir else "") for name, is_dir, _, _ in entries]
+    if details:
+        return "".join(
+            f"{'-' if is_dir else format_size(size):>6}  {datetime.fromtimestamp(mtime):%Y-%m-%d %H:%M}  {name}\n"
+            for name, (_, is_dir, size, mtime) in zip(names, entries)
+        )
+    if not names:
+        return ""
+    column = max(map(len, names)) + 2
+    columns = max(width // column, 1)
+    rows = -(-len(names) // columns)
+    lines = []
+    for row in range(rows):
+        # Column-major like ls, so names read downwards
+        lines.append("".join(name.ljust(column) for name in names[row::rows]).rstrip())
+    return "\n".join(lines) + "\n"
+
+class PrefixTrie:
+    """Prefix tree of words for completion.
+
+    A lookup walks the prefix and then stops after limit results, so its cost
+    does not grow with the number of words stored.
+    """
+    def __init__(self, words=()):
+        # Each node maps a character to its child; the "" key marks a stored word
+        self.root = {}
+        self.size = 0
+        for word in words:
+            self.insert(word)
+
+    def __len__(self):
+        return self.size
+
+    def insert(self, word):
+        node = self.root
+        for char in word:
+            node = node.setdefault(char, {})
+        if "" not in node:
+            node[""] = True
+            self.size += 1
+
+    def complete(self, prefix, limit=COMPLETION_LIMIT):
+        """Up to limit stored words starting with prefix, in sorted order"""
+        node = self.root
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return []
+        results = []
+        stack = [(prefix, node)]
+        while stack and len(results) < limit:
+            text, node = stack.pop()
+            if "" in node:
+                results.append(text)
+            stack.extend((text + char, node[char]) for char in sorted((key for key in node if key), reverse=True))
+        return results
+
+class CommandHistory:
+    """Typed commands in an append-only file shared by every terminal window.
+
+    Nothing is read until the history is first used; after that each use only
+    reads the lines other windows appended since. A repeat of the previous
+    command is not stored. Reverse search checks only the lines containing the
+    query's rarest trigram; each trigram's line list is built the first time a
+    query uses it, so typing a search costs at most one scan per keystroke.
+    """
+    def __init__(self, path=COMMAND_HISTORY_FILE, limit=COMMAND_HISTORY_LIMIT):
+        self.path = os.path.abspath(path)
+        self.limit = limit
+        self.lines = None
+        self.offset = 0
+        self.file_lines = 0
+        self.lowered = []
+        self.index = {}
+        self.lock = threading.Lock()
+
+    def entries(self):
+        """All commands, oldest first; loads the file on first use"""
+        with self.lock:
+            self._catch_up()
+            return self.lines
+
+    def add(self, command):
+        command = command.strip()
+        if not command:
+            return
+        with self.lock:
+            if self.lines is None:
+                # Not loaded yet: compare with the file's last line only
+                if self._last_line() == command:
+                    return
+            else:
+                self._catch_up()
+                if self.lines and self.lines[-1] == command:
+                    return
+            with open(self.path, "ab") as f:
+                f.write(command.encode("utf-8") + b"\n")
+            if self.lines is not None:
+                self._catch_up()
+
+    def search(self, query, before=None):
+        """Newest (number, command) before entry number before containing query, ignoring case"""
+        with self.lock:
+            self._catch_up()
+            lines = self.lines
+            needle = query.lower()
+            before = len(lines) if before is None else before
+            if len(needle) >= 3:
+                postings = min((self._postings(needle[i:i + 3]) for i in range(len(needle) - 2)), key=len)
+                candidates = reversed(postings[:bisect.bisect_left(postings, before)])
+            else:
+                candidates = range(before - 1, -1, -1)
+            for number in candidates:
+                if needle in self.lowered[number]:
+                    return number, lines[number]
+        return None
+
+    def _postings(self, gram):
+        """Numbers of the lines containing gram, ascending"""
+        postings = self.index.get(gram)
+        if postings is None:
+            if len(self.index) >= COMMAND_HISTORY_GRAMS:
+                self.index.clear()
+            postings = self.index[gram] = [number for number, line in enumerate(self.lowered) if gram in line]
+        return postings
+
+    def _last_line(self):
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(max(os.fstat(f.fileno()).st_size - 4096, 0))
+                tail = f.read().rstrip(b"\n")
+        except FileNotFoundError:
+            return None
+        return tail.rsplit(b"\n", 1)[-1].decode("utf-8", "replace")
+
+    def _catch_up(self):
+        """Read lines appended since the last read, reloading if the file was compacted"""
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            size = 0
+        if self.lines is None or size < self.offset:
+            self.lines, self.lowered, self.offset, self.file_lines, self.index = [], [], 0, 0, {}
+        if size == self.offset:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+        # A line still being written is picked up next time
+        end = data.rfind(b"\n") + 1
+        self.offset += end
+        for line in data[:end].decode("utf-8", "replace").splitlines():
+            self.file_lines += 1
+            if line and (not self.lines or self.lines[-1] != line):
+                self.lines.append(line)
+                self.lowered.append(line.lower())
+                for gram, postings in self.index.items():
+                    if gram in self.lowered[-1]:
+                        postings.append(len(self.lines) - 1)
+        if self.file_lines > self.limit + self.limit // 4:
+            self._compact()
+
+    def _compact(self):
+        """Rewrite the file with the newest limit commands"""
+        temp = self.path + ".tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            f.writelines(line + "\n" for line in self.lines[-self.limit:])
+        os.replace(temp, self.path)
+        self.lines = None
+        self._catch_up()
+
+@dataclass
+class CommandArg:
+    """One positional argument in a command's schema.
+
+    kind converts (and so validates) the word; rest takes every remaining
+    word. Words are lower-cased unless keep_case, as addresses, txids and
+    paths need. complete names the completion source, e.g. "address".
+    """
+    name: str
+    kind: object = str
+    optional: bool = False
+    rest: bool = False
+    keep_case: bool = False
+    choices: tuple = ()
+    complete: str = None
+
+@dataclass
+class Command:
+    """A terminal command: its handler and argument schema.
+
+    The handler gets cmd_parts, the command name followed by the words the
+    schema accepted. With fallback set, a line that does not fit the schema
+    runs as a system command instead, as 'kill 1234' does.
+    """
+    name: str
+    handler: object
+    args: tuple = ()
+    aliases: tuple = ()
+    fallback: bool = False
+    help: str = ""
+
+    def usage(self):
+        parts = [self.name]
+        for arg in self.args:
+            label = "|".join(arg.choices) if arg.choices else arg.name + ("..." if arg.rest else "")
+            parts.append(f"[{label}]" if arg.optional else f"<{label}>")
+        return " ".join(parts)
+
+    def arg_at(self, index):
+        if index < len(self.args):
+            return self.args[index]
+        if self.args and self.args[-1].rest:
+            return self.args[-1]
+        return None
+
+    def parse(self, words):
+        """Check the words after the name against the schema and return cmd_parts"""
+        cmd_parts = [self.name]
+        index = 0
+        for arg in self.args:
+            if index >= len(words):
+                if arg.optional:
+                    break
+                raise ValueError(f"missing {arg.name}")
+            taken = words[index:] if arg.rest else [words[index]]
+            for word in taken:
+                word = word if arg.keep_case else word.lower()
+                if arg.choices and word not in arg.choices:
+                    raise ValueError(f"{arg.name} must be one of {', '.join(arg.choices)}")
+                try:
+                    arg.kind(word)
+                except ValueError:
+                    raise ValueError(f"invalid {arg.name}: {word}") from None
+                cmd_parts.append(word)
+            index += len(taken)
+        if index < len(words):
+            raise ValueError("too many arguments")
+        return cmd_parts
+
+def parse_job_spec(word):
+    """Validate a %n job reference"""
+    if not (word.startswith("%") and word[1:].isdigit()):
+        raise ValueError(f"not a job: {word}")
+    return int(word[1:])
+
+class CommandRegistry:
+    """Commands by name and alias for dispatch by dict lookup, plus lazy plugins.
+
+    A plugin is a module in the plugins folder named after its command that
+    defines register(registry, engine). Only file names are read at startup;
+    the module is imported the first time its command is run.
+    """
+    def __init__(self):
+        self.commands = {}
+        self.plugins = {}
+        self.names = PrefixTrie()
+
+    def register(self, command):
+        for name in (command.name, *command.aliases):
+            self.commands[name] = command
+            self.names.insert(name)
+        return command
+
+    def scan_plugins(self, directory=PLUGINS_DIR):
+        if not os.path.isdir(directory):
+            return
+        with os.scandir(directory) as it:
+            for entry in it:
+                name, extension = os.path.splitext(entry.name)
+                if extension == ".py" and not name.startswith("_") and name not in self.commands:
+                    self.plugins[name] = entry.path
+                    self.names.insert(name)
+
+    def lookup(self, name, engine):
+        """The command called name, importing its plugin if needed; None for system commands"""
+        command = self.commands.get(name)
+        if command is None and name in self.plugins:
+            path = self.plugins.pop(name)
+            spec = importlib.util.spec_from_file_location(f"strayacoin_plugin_{name}", path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            module.register(self, engine)
+            command = self.commands.get(name)
+        return command
+
+class TerminalEngine:
+    """Command processing, mining and node access without any GUI.
+
+    Output leaves through the write callable as (text, tag) chunks, so the Tk
+    window and the headless runner share every command. Further windows pass
+    the first engine's chain_events and subscribe to it, since only one
+    listener can bind the notification port.
+    """
+    def __init__(self, write, cli_path="Strayacoin-cli.exe", chain_events=None):
+        self.write = write
+        self.cli_path = cli_path
+        self.mining_repeating = False
+        self.mining_adaptive = False
+        self.mining_cancel = CancelToken()
+        self.adaptive = AdaptiveScheduler()
+        self.last_decision = None
+        self.metrics = Metrics()
+        self.exit_requested = threading.Event()
+        self.history = SnapshotStore(HISTORY_FILE)
+        self.wallet_jobs = WalletJobs(self.print_output)
+        self.shell_jobs = ShellJobs(self.print_output)
+        self.tx_index = TransactionIndex(TX_INDEX_FILE)
+
+        # Strayacoin configuration
+        self.node = NodeClient(self.cli_path, metrics=self.metrics)
+        self.ticker = MarketDataCache(TRADEOGRE_TICKER_URL)
+        self.fetcher = AsyncFetcher()
+        self.collector = StatsCollector(self.node, self.fetcher, self.ticker, self.metrics)
+        self.stats_poller = StatsPoller(self.collector.collect)
+        self.chain = ChainCache(self.node)
+        self.owns_chain_events = chain_events is None
+        self.chain_events = ChainEvents(self.node) if chain_events is None else chain_events
+        self.chain_events.listeners.append(self._on_chain_event)
+        self.last_tx_refresh = 0.0
+        self.exporter = None
+        self.nodes = {"local": self.node}
+        try:
+            self.nodes.update(load_node_endpoints(NODES_FILE, self.cli_path, self.metrics))
+        except (OSError, ValueError, KeyError) as e:
+            self.print_output(f"Error loading {NODES_FILE}: {str(e)}\n", "error")
+        self.orchestrator = MiningOrchestrator(self.nodes, self.print_output, self.metrics)
+        self.mining_active = False
+        self.mining_thread = None
+        if self.owns_chain_events:
+            self.chain_events.start()
+        self.commands = CommandRegistry()
+        self.register_commands()
+        self.commands.scan_plugins()
+        self.command_history = CommandHistory(COMMAND_HISTORY_FILE)
+        self.history_trie = None
+        self.address_trie = None
+
+    def _on_chain_event(self, topic, value):
+        """Refresh stats when the node reports a block, or a tx after a quiet spell"""
+        # While notifications arrive, polling is only a safety net for lost ones
+        self.stats_poller.interval = NOTIFY_FALLBACK_INTERVAL
+        if topic == "block":
+            self.chain.forget_tip()
+        elif time.monotonic() - self.last_tx_refresh < NOTIFY_TX_REFRESH:
+            return
+        self.last_tx_refresh = time.monotonic()
+        self.stats_poller.poke()
+
+    @property
+    def busy(self):
+        """True while this engine is mining on any node, has wallet calls pending or runs system commands"""
+        return (self.mining_active or bool(self.orchestrator.active) or bool(self.wallet_jobs.pending())
+                or bool(self.shell_jobs.running()))
+
+    def print_output(self, text, tag="output"):
+        """Hand text to the output sink; safe to call from any thread"""
+        self.write(text, tag)
+
+    def register_commands(self):
+        """Declare the built-in commands and their argument schemas"""
+        rest = CommandArg("options", optional=True, rest=True)
+        for command in (
+            Command("mine", self.handle_mining_command, (rest,)),
+            Command("wallet", self.handle_wallet_command, (
+                CommandArg("action", optional=True,
+                           choices=("balance", "send", "info", "tx", "payout", "jobs", "cancel")),
+                CommandArg("args", optional=True, rest=True, keep_case=True, complete="address")
+            )),
+            Command("nodes", lambda cmd_parts: self.print_nodes()),
+            Command("stats", self.handle_stats_command, (CommandArg("action", optional=True, choices=("reset",)),)),
+            Command("exporter", self.handle_exporter_command, (
+                CommandArg("action", optional=True, choices=("on", "off")),
+                CommandArg("port", int, optional=True)
+            )),
+            Command("history", self.handle_history_command, (rest,)),
+            Command("analyze", self.handle_analyze_command, (
+                CommandArg("span", optional=True), CommandArg("window", int, optional=True)
+            )),
+            Command("schedule", self.handle_schedule_command, (rest,)),
+            Command("block", self.handle_chain_command, (CommandArg("height|hash|cache", optional=True),)),
+            Command("tx", self.handle_chain_command, (CommandArg("txid"),)),
+            Command("events", lambda cmd_parts: self.show_chain_events()),
+            Command("jobs", self.handle_jobs_command, (CommandArg("action", optional=True, choices=("clear",)),)),
+            Command("kill", lambda cmd_parts: self.kill_shell_job(cmd_parts[1]),
+                    (CommandArg("%n", parse_job_spec),), fallback=True),
+            Command("help", lambda cmd_parts: self.print_help()),
+            Command("exit", lambda cmd_parts: self.exit_requested.set()),
+            Command("ls", lambda cmd_parts: self.list_directory(cmd_parts[1:]),
+                    (CommandArg("options", optional=True, rest=True, keep_case=True),), aliases=("dir",)),
+            Command("cd", lambda cmd_parts: self.change_directory(" ".join(cmd_parts[1:])),
+                    (CommandArg("directory", rest=True, keep_case=True),), fallback=True),
+            Command("pwd", lambda cmd_parts: self.print_working_directory()),
+            Command("date", lambda cmd_parts: self.print_date()),
+            Command("time", lambda cmd_parts: self.print_time()),
+        ):
+            self.commands.register(command)
+
+    def process_command(self, command):
+        """Run a command line through the registry; unknown commands go to the system shell"""
+        words = command.split()
+        if not words:
+            return
+        self.command_history.add(command)
+        if self.history_trie is not None:
+            self.history_trie.insert(command.strip())
+        name = words[0].lower()
+        try:
+            entry = self.commands.lookup(name, self)
+        except Exception as e:
+            self.print_output(f"Plugin {name} failed to load: {str(e)}\n", "error")
+            return
+        if entry is None:
+            self.execute_system_command(command)
+            return
+        try:
+            cmd_parts = entry.parse(words[1:])
+        except ValueError as e:
+            if entry.fallback:
+                self.execute_system_command(command)
+            else:
+                self.print_output(f"{str(e)}\nUsage: {entry.usage()}\n", "error")
+            return
+        entry.handler(cmd_parts)
+
+    def complete(self, line):
+        """Tab completions for a partly typed line, as (start, candidates).
+
+        The text from start on is replaced by the chosen candidate. The first
+        word completes to command names, address arguments to addresses seen
+        in the wallet, and anything else (or an address with no match) to
+        whole lines from the history.
+        """
+        words = line.split(" ")
+        if len(words) == 1:
+            start, candidates = 0, self.commands.names.complete(line.lower())
+        else:
+            entry = self.commands.commands.get(words[0].lower())
+            arg = entry.arg_at(len(words) - 2) if entry else None
+            candidates = []
+            if arg is not None and arg.complete == "address" and words[-1]:
+                start, candidates = len(line) - len(words[-1]), self.wallet_addresses().complete(words[-1])
+            if not candidates:
+                return 0, self.history_completions().complete(line)
+        # A single word is finished off so the next argument can be typed
+        return start, [candidates[0] + " "] if len(candidates) == 1 else candidates
+
+    def history_completions(self):
+        """Trie of the newest typed commands, built on first use"""
+        if self.history_trie is None:
+            self.history_trie = PrefixTrie(self.command_history.entries()[-COMPLETION_HISTORY:])
+        return self.history_trie
+
+    def wallet_addresses(self):
+        """Trie of addresses from the transaction index, read on first use"""
+        if self.address_trie is None:
+            self.address_trie = PrefixTrie()
+            try:
+                for address in self.tx_index.addresses():
+                    self.address_trie.insert(address)
+            except sqlite3.Error as e:
+                self.print_output(f"Addresses unavailable: {str(e)}\n", "warning")
+        return self.address_trie
+
+    def handle_mining_command(self, cmd_parts):
+        """Handle mining commands with optional -r flag for repeating"""
+        if "-n" in cmd_parts or (len(cmd_parts) > 1 and cmd_parts[1] == "stop"):
+            self.handle_node_mining_command(cmd_parts)
+            return
+
+        if self.mining_active:
+            self.print_output("Mining already in progress\n", "warning")
+            return
+        
+        try:
+            self.mining_adaptive = "-a" in cmd_parts
+            if self.mining_adaptive:
+                # Batch sizes come from the adaptive scheduler
+                blocks = self.adaptive.policy.min_batch
+                self.mining_repeating = True
+            elif "-r" in cmd_parts:
+                repeat_index = cmd_parts.index("-r")
+                blocks = int(cmd_parts[repeat_index + 1]) if len(cmd_parts) > repeat_index + 1 else 1
+                self.mining_repeating = True
+            else:
+                blocks = int(cmd_parts[1]) if len(cmd_parts) > 1 else 1
+                self.mining_repeating = False
+            
+            self.mining_cancel = CancelToken()
+            self.stats_poller.start()
+            self.mining_thread = threading.Thread(
+                target=self.mine_blocks,
+                args=(blocks,),
+                daemon=True
+            )
+            self.mining_thread.start()
+            
+            if self.mining_adaptive:
+                self.print_output(f"Starting adaptive mining in {self.adaptive.policy.mode} mode (Press Esc to stop)\n", "success")
+            elif self.mining_repeating:
+                self.print_output(f"Starting repeated mining of {blocks} blocks (Press Esc to stop)\n", "success")
+            else:
+                self.print_output(f"Started mining {blocks} blocks\n", "success")
+                
+        except (ValueError, IndexError):
+            self.print_output("Usage: mine [-r] <number_of_blocks> | mine -a\n", "error")
+
+    def handle_node_mining_command(self, cmd_parts):
+        """Handle 'mine -n <nodes> [-r] <blocks>' and 'mine stop [nodes]'"""
+        try:
+            if cmd_parts[1] == "stop":
+                names = self.orchestrator.resolve(cmd_parts[2]) if len(cmd_parts) > 2 else None
+                stopped = self.orchestrator.stop(names)
+                if stopped:
+                    self.print_output(f"Stopping mining on {', '.join(stopped)}...\n", "warning")
+                else:
+                    self.print_output("No active node mining\n", "output")
+                return
+
+            parts = list(cmd_parts[1:])
+            node_index = parts.index("-n")
+            names = self.orchestrator.resolve(parts[node_index + 1])
+            del parts[node_index:node_index + 2]
+            repeating = "-r" in parts
+            if repeating:
+                parts.remove("-r")
+            blocks = int(parts[0]) if parts else 1
+
+            started, busy = self.orchestrator.start(names, blocks, repeating)
+            if started:
+                mode = "repeated mining" if repeating else "mining"
+                self.print_output(f"Started {mode} of {blocks} blocks on {', '.join(started)}\n", "success")
+            if busy:
+                self.print_output(f"Already mining on {', '.join(busy)}\n", "warning")
+
+        except KeyError as e:
+            self.print_output(f"Unknown node: {e.args[0]} (see 'nodes')\n", "error")
+        except (ValueError, IndexError):
+            self.print_output("Usage: mine -n <node,node|all> [-r] <number_of_blocks> | mine stop [nodes]\n", "error")
+
+    def print_nodes(self):
+        """Show every configured node with its mining counters"""
+        self.print_output(self.orchestrator.summary(), "output")
+
+    def mine_blocks(self, blocks):
+        """Mine Strayacoin blocks with optimized performance metrics, clean output."""
+    
+        #previous_rms = None
+        #previous_emc_ratio = None
+    
+        def format_rms(rms):
+            return f"{rms:.4f}"
+    
+        def format_emc(emc, rms):
+            if rms > 0:
+                raw_ratio = emc / rms
+                compressed = math.sqrt(raw_ratio)
+    
+                if compressed < 0.01:
+                    display = f"{compressed:.4f}"
+                elif compressed < 1:
+                    display = f"{compressed:.3f}"
+                elif compressed < 100:
+                    display = f"{compressed:.2f}"
+                else:
+                    display = f"{compressed:.1f}"
+    
+                return compressed, display
+            return 0, "0.0000"
+    
+        def report_block(block_hash, progress):
+            with self.metrics.timer("report"):
+                _report_block(block_hash, progress)
+
+        def _report_block(block_hash, progress):
+            found.append(time.time())
+            stats = self._block_stats(found)
+            try:
+                self.history.append(stats)
+            except (OSError, ValueError) as e:
+                self.print_output(f"History not saved: {e}\n", "warning")
+
+            rms = stats.rms
+            emc = stats.emc
+            emc_ratio, emc_display = format_emc(emc, rms)
+
+            rms_str = format_rms(rms)
+            emc_str = emc_display
+
+            minedBlocks = progress.mined
+            
+            # Save for next round
+            #previous_rms = rms
+            #previous_emc_ratio = emc_ratio
+            
+            moneySupply = stats.money_supply
+            priceOnTradeOgre = stats.market.get("price", "N/A")
+            bidOnTradeOgre = stats.market.get("bid", "N/A")
+            askOnTradeOgre = stats.market.get("ask", "N/A")
+            
+            output = (
+                f"Mined Block {minedBlocks}/{progress.requested}\n"
+                f"├─ RMS: {rms_str}\n"
+                f"├─ EMC: {emc_str}\n"
+                f"├─ Connected Peers: {stats.conpeers}\n"
+                f"├────────────────────────────────────────\n"
+                f"├─ Block Height: {stats.block_count if stats.block_count is not None else 'N/A'}\n"
+                f"├─ Network Difficulty: {stats.difficulty:.6f}\n"
+                f"├─ Network Peers: {stats.netpeers}\n"
+                f"├─ Network Hashrate: {stats.hashrate/1000:,.2f} KH/s\n"
+                f"├─ Network Money Supply: {moneySupply}\n"
+                f"├────────────────────────────────────────\n"
+                f"├─ BTC Price (TradeOgre): {priceOnTradeOgre}\n"
+                f"├─ BTC Sell (TradeOgre): {bidOnTradeOgre}\n"
+                f"├─ BTC Buy (TradeOgre): {askOnTradeOgre}\n"
+                f"├─ Stats Age: {time.time() - stats.timestamp:.0f}s\n"
+                 "└────────────────────────────────────────\n"
+            )
+            self.print_output(output, "output")
+            if stats.errors:
+                failed = ", ".join(f"{name} ({error})" for name, error in stats.errors.items())
+                self.print_output(f"Stats unavailable: {failed}\n", "warning")
+            self.print_output(f"{block_hash}\n", "output")
+
+        cancel = self.mining_cancel
+        scheduler = MiningScheduler(self.node, metrics=self.metrics)
+        totals = MiningResult()
+        # When each of this run's blocks was found, to move cached heights on
+        found = []
+        self.mining_active = True
+        try:
+            while not cancel.cancelled:
+                decision = None
+                if self.mining_adaptive:
+                    decision = self._next_decision()
+                    if not decision.mine:
+                        if not self.chain_events.live:
+                            self.stats_poller.poke()
+                        cancel.event.wait(decision.delay)
+                        continue
+                    blocks = decision.batch
+                result = scheduler.run(blocks, cancel, on_block=report_block)
+                totals.add(result)
+                if not self.mining_repeating:
+                    break
+                if decision is not None and decision.delay:
+                    cancel.event.wait(decision.delay)
+    
+        except RPCError as e:
+            self.print_output(f"Mining error: {e}\n", "error")
+        finally:
+            self.mining_active = False
+            if self.exporter is None:
+                # The exporter keeps the poller running for its gauges
+                self.stats_poller.stop()
+            self.print_output(
+                f"Mining summary: {totals.attempted} attempted, {totals.mined} mined, "
+                f"{totals.cancelled} cancelled\n",
+                "output"
+            )
+            if totals.mined:
+                self.print_output(f"Performance: {self.metrics.status_line()}\n", "output")
+            if cancel.cancelled:
+                self.print_output("Mining stopped by user\n", "warning")
+
+    def _own_hashrate(self, stats):
+        """Estimate our hashes per second from recent generate timings"""
+        p50 = self.metrics.percentiles("generate")[0]
+        if stats is None or math.isnan(p50) or p50 <= 0 or not stats.difficulty > 0:
+            return float('nan')
+        return stats.difficulty * 2**32 / p50
+
+    def _block_stats(self, found):
+        """Stats for a block just found, without waiting on the network.
+
+        The latest published snapshot is used as is, except that its height
+        moves on by the blocks in found (times our generate calls returned)
+        that came after it was taken. The poller is poked to catch up in the
+        background.
+        """
+        self.stats_poller.poke()
+        cached = self.stats_poller.latest()
+        if cached is None:
+            return NetworkSnapshot(errors={"stats": "first poll still running"})
+        stats = replace(cached, errors=dict(cached.errors))
+        if stats.block_count is not None:
+            stats.block_count += sum(1 for found_at in found if found_at > cached.timestamp)
+        return stats
+
+    def _next_decision(self):
+        """Ask the adaptive scheduler about the cached stats, reporting changes of mind"""
+        stats = self.stats_poller.latest()
+        decision = self.adaptive.decide(stats, self._own_hashrate(stats))
+        previous = self.last_decision
+        self.last_decision = decision
+        if previous is None or previous.mine != decision.mine or previous.batch != decision.batch:
+            if decision.mine:
+                self.print_output(f"Scheduler: mining batches of {decision.batch} ({decision.reason})\n", "output")
+            else:
+                self.print_output(f"Scheduler: paused, {decision.reason}\n", "warning")
+        return decision
+
+    def stop_mining(self, event=None):
+        """Stop any active mining operation"""
+        stopped = self.orchestrator.stop()
+        if self.mining_active:
+            self.mining_cancel.cancel()
+            self.print_output("Stopping mining...\n", "warning")
+        elif stopped:
+            self.print_output(f"Stopping mining on {', '.join(stopped)}...\n", "warning")
+        else:
+            self.print_output("No active mining operation\n", "output")
+            
+    def handle_wallet_command(self, cmd_parts):
+        """Queue wallet calls on the worker pool; results are printed when they arrive.
+
+        Words after the action keep their case, for addresses and file paths.
+        """
+        if len(cmd_parts) < 2:
+            self.print_output("Wallet commands:\n"
+                           "  balance    - Show wallet balance\n"
+                           "  send <amount> <address>\n"
+                           "  info       - Show wallet info\n"
+                           "  tx [sync | txid | address | >amt | 7d | limit n] - Search the local transaction index\n"
+                           "  payout <file.csv> [batch_size|check] - Pay address,amount rows with sendmany\n"
+                           "  jobs       - Show pending wallet calls\n"
+                           "  cancel <id|all> - Cancel pending wallet calls\n", "output")
+            return
+        
+        try:
+            if cmd_parts[1] == "balance":
+                job = self.wallet_jobs.submit(
+                    "getbalance",
+                    lambda cancel: self.node.call("getbalance", cancel=cancel),
+                    lambda job, result: self.print_output(f"[{job.name}] Wallet balance: {format_rpc_result(result)}\n", "output")
+                )
+            
+            elif cmd_parts[1] == "send" and len(cmd_parts) == 4:
+                amount = float(cmd_parts[2])
+                address = cmd_parts[3]
+                self.wallet_addresses().insert(address)
+                job = self.wallet_jobs.submit(
+                    f"send {amount} to {address}",
+                    lambda cancel: self.node.call("sendtoaddress", address, amount, cancel=cancel),
+                    lambda job, result: self.print_output(f"[{job.name}] Transaction ID: {format_rpc_result(result)}\n", "success"),
+                    outcome_hint=(
+                        "The send may already have been broadcast; run 'wallet tx sync' and "
+                        f"'wallet tx {address}' to look for its txid before resending"
+                    )
+                )
+            
+            elif cmd_parts[1] == "info":
+                job = self.wallet_jobs.submit(
+                    "getwalletinfo",
+                    lambda cancel: self.node.call("getwalletinfo", cancel=cancel),
+                    lambda job, result: self.print_output(f"[{job.name}] {format_rpc_result(result)}\n", "output")
+                )
+            
+            elif cmd_parts[1] == "payout" and len(cmd_parts) in (3, 4):
+                path = cmd_parts[2]
+                check_only = len(cmd_parts) == 4 and cmd_parts[3].lower() == "check"
+                batch_size = int(cmd_parts[3]) if len(cmd_parts) == 4 and not check_only else PAYOUT_BATCH_SIZE
+                if batch_size < 1:
+                    raise ValueError("batch size must be at least 1")
+                payout = PayoutRun(self.node, path, self.print_output, batch_size)
+                job = self.wallet_jobs.submit(
+                    f"{'check' if check_only else 'payout'} {os.path.basename(path)}",
+                    lambda cancel: payout.run(cancel, check_only),
+                    lambda job, result: self.print_output(f"[{job.name}] {result}\n", "success"),
+                    timeout=0
+                )
+
+            elif cmd_parts[1] == "tx":
+                sync_only = [word.lower() for word in cmd_parts[2:3]] == ["sync"]
+                filters = {} if sync_only else parse_tx_filters(cmd_parts[2:])
+                job = self.wallet_jobs.submit(
+                    "transaction index " + (" ".join(cmd_parts[2:]) or "latest"),
+                    lambda cancel: self._query_transactions(filters, cancel, sync_only=sync_only),
+                    lambda job, result: self.print_output(result, "output"),
+                    timeout=0
+                )
+
+            elif cmd_parts[1] == "jobs":
+                self.print_wallet_jobs()
+                return
+
+            elif cmd_parts[1] == "cancel" and len(cmd_parts) == 3:
+                self.cancel_wallet_jobs(cmd_parts[2].lower())
+                return
+
+            else:
+                self.print_output("Invalid wallet command\n", "error")
+                return
+
+            self.print_output(f"[{job.name}] {job.description} pending\n", "output")
+        
+        except Exception as e:
+            self.print_output(f"Wallet error: {str(e)}\n", "error")
+
+    def _query_transactions(self, filters, cancel, sync_only=False):
+        """Catch the index up with the node, then run the query; runs on a wallet worker"""
+        started = time.perf_counter()
+        first_sync = self.tx_index.last_block is None
+        changed = self.tx_index.sync(self.node, cancel)
+        synced = time.perf_counter()
+        note = f"{'full sync' if first_sync else 'caught up'}: {changed} rows in {(synced - started) * 1000:.0f} ms"
+        if sync_only:
+            return f"Transaction index {note}, {self.tx_index.count()} rows total\n"
+        rows = self.tx_index.query(**filters)
+        elapsed = (time.perf_counter() - synced) * 1000
+        if not rows:
+            return f"No matching transactions ({note}, query {elapsed:.1f} ms)\n"
+        lines = [f"{'Time':<17}{'Category':<10}{'Amount':>16}{'Conf':>7}  {'Address':<36}Txid"]
+        for txid, category, address, amount, confirmations, stamp in rows:
+            when = datetime.fromtimestamp(stamp).strftime("%Y-%m-%d %H:%M") if stamp else "?"
+            lines.append(f"{when:<17}{category:<10}{amount:>16.8f}{confirmations or 0:>7}  {address:<36}{txid}")
+        lines.append(f"({note}, query {elapsed:.1f} ms)")
+        return "\n".join(lines) + "\n"
+
+    def print_wallet_jobs(self):
+        jobs = self.wallet_jobs.pending()
+        if not jobs:
+            self.print_output("No pending wallet calls\n", "output")
+            return
+        now = time.monotonic()
+        lines = [f"  {job.name:<6}{now - job.started:>6.1f}s  {job.description}" for job in jobs]
+        self.print_output("Pending wallet calls:\n" + "\n".join(lines) + "\n", "output")
+
+    def cancel_wallet_jobs(self, spec):
+        if spec == "all":
+            jobs = self.wallet_jobs.cancel()
+        else:
+            jobs = self.wallet_jobs.cancel(int(spec.lstrip("w")))
+        if not jobs:
+            self.print_output("No matching wallet call\n", "warning")
+
+    def handle_stats_command(self, cmd_parts):
+        """Show mining throughput and call timings, or reset them"""
+        if len(cmd_parts) == 1:
+            self.print_output(self.metrics.summary(), "output")
+            line = self.metrics.status_line()
+            if line:
+                self.print_output(f"{line}\n", "output")
+        elif cmd_parts[1] == "reset":
+            self.metrics.reset()
+            self.print_output("Metrics reset\n", "success")
+        else:
+            self.print_output("Usage: stats [reset]\n", "error")
+
+    def handle_exporter_command(self, cmd_parts):
+        """Start or stop the Prometheus metrics endpoint"""
+        if len(cmd_parts) == 1:
+            state = self.exporter.address if self.exporter else "off"
+            self.print_output(f"Metrics exporter: {state}\n", "output")
+        elif cmd_parts[1] == "on" and len(cmd_parts) <= 3:
+            if self.exporter:
+                self.print_output(f"Metrics exporter already serving {self.exporter.address}\n", "warning")
+                return
+            try:
+                port = int(cmd_parts[2]) if len(cmd_parts) == 3 else METRICS_PORT
+                self.exporter = MetricsExporter(self.metrics, port=port).start()
+            except (OSError, ValueError) as e:
+                self.print_output(f"Error: {str(e)}\n", "error")
+                return
+            self.collector.listeners.append(self.exporter.publish)
+            self.stats_poller.start()
+            self.print_output(f"Serving metrics on {self.exporter.address}\n", "success")
+        elif cmd_parts[1] == "off" and len(cmd_parts) == 2:
+            if self.exporter:
+                self.collector.listeners.remove(self.exporter.publish)
+                self.exporter.stop()
+                self.exporter = None
+                if not self.mining_active:
+                    self.stats_poller.stop()
+            self.print_output("Metrics exporter stopped\n", "success")
+        else:
+            self.print_output("Usage: exporter [on [port] | off]\n", "error")
+
+    def handle_history_command(self, cmd_parts):
+        """Summarise, list or aggregate the stored per-block snapshots"""
+        started = time.perf_counter()
+        try:
+            total = len(self.history)
+            if len(cmd_parts) == 1:
+                if not total:
+                    self.print_output(f"No history yet ({self.history.path})\n", "output")
+                    return
+                first = datetime.fromtimestamp(self.history.record_at(0)["timestamp"])
+                last = datetime.fromtimestamp(self.history.record_at(total - 1)["timestamp"])
+                self.print_output(
+                    f"{total} snapshots from {first:%Y-%m-%d %H:%M} to {last:%Y-%m-%d %H:%M} "
+                    f"in {self.history.path}\n", "output"
+                )
+            elif cmd_parts[1] == "last":
+                rows = int(cmd_parts[2]) if len(cmd_parts) > 2 else HISTORY_LAST_ROWS
+                lines = [f"{'Time':<20}{'Height':>9}{'Difficulty':>14}{'Hashrate KH/s':>15}{'RMS':>10}{'EMC':>12}{'Price BTC':>14}"]
+                for index in range(max(total - rows, 0), total):
+                    record = self.history.record_at(index)
+                    height = "N/A" if math.isnan(record["height"]) else f"{record['height']:.0f}"
+                    lines.append(
+                        f"{datetime.fromtimestamp(record['timestamp']):%Y-%m-%d %H:%M:%S} {height:>9}"
+                        f"{record['difficulty']:>14.6f}{record['hashrate'] / 1000:>15,.2f}"
+                        f"{record['rms']:>10.4f}{record['emc']:>12.4g}{record['price']:>14.8f}"
+                    )
+                self.print_output("\n".join(lines) + "\n", "output")
+            else:
+                since = None if cmd_parts[1] == "all" else time.time() - parse_duration(cmd_parts[1])
+                fields = cmd_parts[2:] or [name for name in HISTORY_FIELDS if name != "timestamp"]
+                unknown = [name for name in fields if name not in HISTORY_FIELDS]
+                if unknown:
+                    self.print_output(f"Unknown field: {', '.join(unknown)} (one of {', '.join(HISTORY_FIELDS)})\n", "error")
+                    return
+                start, stop = self.history.span(since)
+                lines = [f"{stop - start} snapshots", f"{'Field':<12}{'Min':>16}{'Mean':>16}{'Max':>16}{'Last':>16}"]
+                for name in fields:
+                    stats = self.history.aggregate(name, start, stop)
+                    lines.append(
+                        f"{name:<12}" + "".join(f"{stats[key]:>16.6g}" for key in ("min", "mean", "max", "last"))
+                    )
+                self.print_output("\n".join(lines) + "\n", "output")
+        except (OSError, ValueError, IndexError) as e:
+            self.print_output(f"History error: {str(e)}\n", "error")
+            self.print_output("Usage: history [last <n> | <span> [fields] | all [fields]], span like 24h or 7d\n", "error")
+            return
+        self.print_output(f"({(time.perf_counter() - started) * 1000:.1f} ms)\n", "output")
+
+    def handle_analyze_command(self, cmd_parts):
+        """Rolling mean, EWMA, volatility, trend and correlations over stored snapshots"""
+        try:
+            import numpy as np
+        except ImportError:
+            self.print_output("analyze needs NumPy: pip install numpy\n", "error")
+            return
+        started = time.perf_counter()
+        try:
+            span = cmd_parts[1] if len(cmd_parts) > 1 else "all"
+            window = int(cmd_parts[2]) if len(cmd_parts) > 2 else ANALYZE_WINDOW
+            if window < 1:
+                raise ValueError("window must be at least 1")
+            since = None if span == "all" else time.time() - parse_duration(span)
+            start, stop = self.history.span(since)
+            if stop - start < 2:
+                self.print_output("Not enough history to analyze yet\n", "warning")
+                return
+            table = np.frombuffer(self.history.rows(start, stop), dtype="<f8").reshape(-1, len(HISTORY_FIELDS))
+            report = analyze_history(table, window)
+        except (OSError, ValueError) as e:
+            self.print_output(f"Analyze error: {str(e)}\n", "error")
+            self.print_output("Usage: analyze [<span>|all] [window], span like 24h or 7d\n", "error")
+            return
+
+        lines = [
+            f"{report['samples']} snapshots, window {window}",
+            f"{'Field':<12}{'Last':>14}{'Mean':>14}{'EWMA':>14}{'Volatility':>12}{'Trend/day':>14}"
+        ]
+        for name, values in report["fields"].items():
+            lines.append(
+                f"{name:<12}{values['last']:>14.6g}{values['mean']:>14.6g}{values['ewma']:>14.6g}"
+                f"{values['volatility']:>12.4%}{values['trend']:>14.4g}"
+            )
+        lines.append("")
+        lines.append("Correlation " + "".join(f"{name:>12}" for name in ANALYZE_FIELDS))
+        for name, row in zip(ANALYZE_FIELDS, report["correlation"]):
+            lines.append(f"{name:<12}" + "".join(f"{value:>12.3f}" for value in row))
+        lines.append(f"({(time.perf_counter() - started) * 1000:.1f} ms)")
+        self.print_output("\n".join(lines) + "\n", "output")
+
+    def handle_schedule_command(self, cmd_parts):
+        """Show or change the adaptive mining policy"""
+        policy = self.adaptive.policy
+        if len(cmd_parts) == 1:
+            lines = [f"  {name:<15}{getattr(policy, name)}" for name in policy.__dataclass_fields__]
+            self.print_output("Adaptive mining policy:\n" + "\n".join(lines) + "\n", "output")
+            if self.last_decision:
+                decision = self.last_decision
+                state = f"mining batches of {decision.batch}" if decision.mine else "paused"
+                self.print_output(f"Last decision: {state} ({decision.reason})\n", "output")
+        elif len(cmd_parts) == 3:
+            try:
+                policy.set(cmd_parts[1], cmd_parts[2])
+                self.print_output(f"{cmd_parts[1]} set to {getattr(policy, cmd_parts[1])}\n", "success")
+            except KeyError:
+                self.print_output(f"Unknown setting: {cmd_parts[1]}\n", "error")
+            except ValueError as e:
+                self.print_output(f"Invalid value: {str(e)}\n", "error")
+        else:
+            self.print_output("Usage: schedule [<setting> <value>]\n", "error")
+
+    def show_chain_events(self):
+        """Report where block and tx notifications come from"""
+        events = self.chain_events
+        if not events.live:
+            reason = f" ({events.last_error})" if events.last_error else ""
+            self.print_output(f"Notifications: off{reason}, stats polled every {STATS_POLL_INTERVAL}s\n", "warning")
+            return
+        age = f", last {time.time() - events.last_event:.0f}s ago" if events.last_event else ""
+        self.print_output(
+            f"Notifications: {events.source} | {events.counts['block']} blocks, {events.counts['tx']} txs{age}\n",
+            "output"
+        )
+
+    def handle_chain_command(self, cmd_parts):
+        """Look up a block or transaction through the chain cache on the wallet worker pool"""
+        if cmd_parts[0] == "block" and cmd_parts[1:] == ["cache"]:
+            stats = self.chain.stats()
+            self.print_output(
+                f"Chain cache: {stats['memory']} in memory, {stats['disk']} on disk | "
+                f"{stats['hits']} hits, {stats['disk_hits']} disk hits, {stats['misses']} misses\n", "output"
+            )
+            return
+        if cmd_parts[0] == "tx" and len(cmd_parts) != 2:
+            self.print_output("Usage: tx <txid>\n", "error")
+            return
+        if len(cmd_parts) > 2:
+            self.print_output("Usage: block [height|hash|cache]\n", "error")
+            return
+        # A pool job, so it can be listed and cancelled and headless mode waits for it
+        self.wallet_jobs.submit(" ".join(cmd_parts), lambda cancel: self._lookup_chain(cmd_parts), lambda job, result: None)
+
+    def _lookup_chain(self, cmd_parts):
+        started = time.perf_counter()
+        try:
+            if cmd_parts[0] == "block":
+                ref = cmd_parts[1] if len(cmd_parts) > 1 else str(self.chain.tip_height())
+                block, cached = self.chain.block(ref)
+                text = (
+                    f"Block {block.get('height')}  {block.get('hash')}\n"
+                    f"├─ Confirmations: {block.get('confirmations')}\n"
+                    f"├─ Time: {datetime.fromtimestamp(block.get('time', 0)):%Y-%m-%d %H:%M:%S}\n"
+                    f"├─ Transactions: {len(block.get('tx', []))}\n"
+                    f"├─ Difficulty: {block.get('difficulty')}\n"
+                    f"├─ Size: {block.get('size')} bytes\n"
+                    f"└─ Previous: {block.get('previousblockhash', 'N/A')}\n"
+                )
+            else:
+                tx, cached = self.chain.transaction(cmd_parts[1])
+                outputs = [
+                    (out.get("scriptPubKey", {}).get("addresses") or [out.get("scriptPubKey", {}).get("address", "?")])[0]
+                    + f"  {out.get('value')}"
+                    for out in tx.get("vout", [])
+                ]
+                lines = [
+                    f"Transaction {tx.get('txid')}",
+                    f"├─ Confirmations: {tx.get('confirmations', 0)}",
+                    f"├─ Block: {tx.get('blockhash', 'mempool')}",
+                    f"├─ Inputs: {len(tx.get('vin', []))}  Outputs: {len(tx.get('vout', []))}"
+                ]
+                if "amount" in tx:
+                    lines.append(f"├─ Wallet amount: {tx['amount']}")
+                lines += [f"├─ {output}" for output in outputs[:TX_SHOW_OUTPUTS]]
+                if len(outputs) > TX_SHOW_OUTPUTS:
+                    lines.append(f"├─ ... {len(outputs) - TX_SHOW_OUTPUTS} more outputs")
+                lines.append("└────────────────────────────────────────")
+                text = "\n".join(lines) + "\n"
+        except (RPCError, OSError, ValueError) as e:
+            self.print_output(f"Lookup error: {str(e)}\n", "error")
+            return
+        source = "cache" if cached else "node"
+        self.print_output(text + f"({source}, {(time.perf_counter() - started) * 1000:.1f} ms)\n", "output")
+
+    def execute_system_command(self, command):
+        """Start a system command; its output streams in while other commands run"""
+        background = command.rstrip().endswith("&")
+        if background:
+            command = command.rstrip()[:-1]
+        try:
+            job = self.shell_jobs.run(command, background)
+        except Exception as e:
+            self.print_output(f"Error: {str(e)}\n", "error")
+            return
+        if background:
+            self.print_output(f"[{job.name}] {job.process.pid}\n", "output")
+
+    def handle_jobs_command(self, cmd_parts):
+        """List system commands, or delete the output files finished ones left"""
+        if cmd_parts[1:] == ["clear"]:
+            removed = self.shell_jobs.clear()
+            self.print_output(f"Removed {removed} saved output file{'s' if removed != 1 else ''}\n", "output")
+        else:
+            self.print_shell_jobs()
+
+    def print_shell_jobs(self):
+        """List running system commands and saved output of finished ones"""
+        jobs = self.shell_jobs.running()
+        kept = self.shell_jobs.kept()
+        if not jobs and not kept:
+            self.print_output("No running jobs\n", "output")
+            return
+        for job in jobs:
+            spilled = f", spilling to {job.spill_path}" if job.spill_path else ""
+            self.print_output(
+                f"[{job.name}] Running {time.monotonic() - job.started:.0f}s, "
+                f"{job.shown / 1024:.1f} KB shown{spilled}  {job.command}\n", "output"
+            )
+        for name, path in kept:
+            self.print_output(f"[{name}] Done, output saved in {path} ('jobs clear' deletes it)\n", "output")
+
+    def kill_shell_job(self, spec):
+        """Stop the job named %n"""
+        job = next((job for job in self.shell_jobs.running() if spec == job.name), None)
+        if job is None:
+            self.print_output(f"No such job: {spec}\n", "error")
+            return
+        try:
+            self.shell_jobs.kill(job)
+        except OSError as e:
+            self.print_output(f"Error: {str(e)}\n", "error")
+
+    def interrupt_foreground(self, event=None):
+        """Interrupt the newest system command not started with &, like Ctrl+C in a shell"""
+        job = self.shell_jobs.foreground()
+        if job is None:
+            return False
+        try:
+            self.shell_jobs.interrupt(job)
+        except OSError as e:
+            self.print_output(f"Error: {str(e)}\n", "error")
+        return True
+
+    def print_help(self, extra_commands=""):
+        """Show enhanced help information, with any front-end specific commands"""
+        help_text = f"""
+Strayacoin Terminal Commands:
+  mine <blocks>       - Mine specified number of blocks once then stop
+  mine -r <blocks>    - Mine specified number of blocks repeatidly until stopped with esc
+  mine -n <nodes> [-r] <blocks> - Mine on several nodes at once (comma list or all)
+  mine stop [nodes]   - Stop mining on some or all nodes
+  mine -a             - Mine adaptively, pausing and sizing batches from cached stats
+  schedule [key val]  - Show or change the adaptive mining policy
+  nodes               - Show configured nodes and their mining progress
+  wallet [command]    - Interact with Strayacoin wallet
+  stats [reset]       - Show mining throughput and call latency percentiles
+  exporter on [port]  - Serve Prometheus metrics on /metrics (off to stop)
+  block [height|hash] - Show a block, cached once it is deep enough (block cache: stats)
+  tx <txid>           - Show a transaction through the same cache
+  events              - Show the block/tx notification source
+  history [last <n>]  - Show stored per-block snapshots
+  history <7d|all> [fields] - Min/mean/max of stored snapshots over a span
+  analyze [7d|all] [window] - Rolling mean, EWMA, volatility and correlations (NumPy)
+{extra_commands}  help                - Show this help
+  exit                - Exit the application
+
+System Commands:
+  ls/dir [-l] [-S|-t] [-r] [dir|glob] [page <n>] - List directory contents
+  cd <directory>      - Change directory
+  pwd                 - Print working directory
+  date                - Show current date
+  time                - Show current time
+  <any command>       - Execute system command, output streams in (append & to run in background)
+  jobs [clear]        - List system commands, or delete their saved output
+  kill %<n>           - Stop system command n
+"""
+        plugins = sorted(
+            {command.name: command.help for command in self.commands.commands.values() if command.help}.items()
+        ) + [(name, "Plugin, loaded on first use") for name in sorted(self.commands.plugins)]
+        if plugins:
+            help_text += "\nPlugin Commands:\n" + "".join(f"  {name:<19} - {text}\n" for name, text in plugins)
+        self.print_output(help_text, "output")
+
+    def list_directory(self, args=()):
+        """List directory contents: ls [-l] [-S|-t] [-r] [dir|glob] [page <n>]"""
+        args = list(args)
+        flags = "".join(arg[1:] for arg in args if arg.startswith("-"))
+        args = [arg for arg in args if not arg.startswith("-")]
+        try:
+            page = 1
+            if len(args) >= 2 and args[-2].lower() == "page":
+                page = int(args[-1])
+                del args[-2:]
+            if len(args) > 1 or page < 1:
+                raise ValueError("too many arguments")
+            details = "l" in flags
+            sort = "size" if "S" in flags else "time" if "t" in flags else "name"
+            entries = scan_directory(args[0] if args else ".", sort, "r" in flags, details)
+        except ValueError:
+            self.print_output("Usage: ls [-l] [-S|-t] [-r] [dir|glob] [page <n>]\n", "error")
+            return
+        except OSError as e:
+            self.print_output(f"Error: {str(e)}\n", "error")
+            return
+        if not entries:
+            self.print_output("No entries\n", "output")
+            return
+        start = (page - 1) * LS_PAGE_SIZE
+        text = format_listing(entries[start:start + LS_PAGE_SIZE], details)
+        if details:
+            total = sum(size for _, is_dir, size, _ in entries if not is_dir)
+            text += f"{len(entries)} entries, {format_size(total)}\n"
+        if len(entries) > LS_PAGE_SIZE or page > 1:
+            pages = -(-len(entries) // LS_PAGE_SIZE)
+            shown = f"{start + 1}-{min(start + LS_PAGE_SIZE, len(entries))}" if start < len(entries) else "none"
+            more = f", 'ls ... page {page + 1}' for more" if page < pages else ""
+            text += f"Page {page} of {pages} ({shown} of {len(entries)}){more}\n"
+        self.print_output(text, "output")
+
+    def change_directory(self, directory):
+        """Change working directory"""
+        try:
+            os.chdir(directory)
+            self.print_output(f"Changed directory to: {os.getcwd()}\n", "output")
+        except Exception as e:
+            self.print_output(f"Error: {str(e)}\n", "error")
+
+    def print_working_directory(self):
+        """Print current working directory"""
+        self.print_output(f"{os.getcwd()}\n", "output")
+
+    def print_date(self):
+        """Print current date"""
+        self.print_output(f"{datetime.now().strftime('%Y-%m-%d')}\n", "output")
+
+    def print_time(self):
+        """Print current time"""
+        self.print_output(f"{datetime.now().strftime('%H:%M:%S')}\n", "output")
+
+    def close(self):
+        """Stop mining, polling and the exporter and release node connections"""
+        self.mining_cancel.cancel()
+        self.orchestrator.stop()
+        self.stats_poller.stop()
+        self.fetcher.close()
+        if self.owns_chain_events:
+            self.chain_events.stop()
+        elif self._on_chain_event in self.chain_events.listeners:
+            self.chain_events.listeners.remove(self._on_chain_event)
+        if self.exporter:
+            self.exporter.stop()
+            self.exporter = None
+        self.wallet_jobs.shutdown()
+        self.shell_jobs.shutdown()
+        for node in self.nodes.values():
+            node.close()
+        self.history.close()
+        self.tx_index.close()
+        self.chain.close()
+
+# Help lines for commands only the Tk window has
+GUI_HELP = """  theme [name]        - Change color theme
+  scrollback [lines]  - Show or set how many lines the terminal keeps
+  scrollback log on   - Also save all output to scrollback.log (off to stop)
+  scrollback search <text> - Search the saved output log
+  clear               - Clear the terminal
+"""
 
 class StrayacoinTerminal:
-    def __init__(self, root):
+    def __init__(self, root, parent=None):
         self.root = root
+        # Windows opened from this one; they close with it
+        self.parent = parent
+        self.windows = []
         self.root.title("Strayacoin Terminal")
-        self.themes: dict[str, dict[str, str]] = {}
+        self.themes: dict[str, dict] = {}
         self.current_theme = None
         self.load_themes()
-        self.mining_repeating = False
-        self.mining_stop_event = threading.Event()
+        self.output_queue = OutputQueue()
+        self.scrollback_limit = SCROLLBACK_LINES
+        self.scrollback_log = ScrollbackLog(SCROLLBACK_LOG)
+        self.output_lines = 0
         self.output: scrolledtext.ScrolledText
         self.terminal_frame: ttk.Frame
         
@@ -87,20 +4437,28 @@ class StrayacoinTerminal:
         self.root.geometry("960x525")
         self.root.minsize(800, 500)
         
-        # Strayacoin configuration
-        self.cli_path = "Strayacoin-cli.exe"
-        self.mining_active = False
-        self.mining_thread = None
+        # Commands, mining and node access
+        self.engine = TerminalEngine(
+            self.print_output, chain_events=parent.engine.chain_events if parent else None
+        )
+        self.register_commands()
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
         
-        # Initialize UI with default theme
+        # Build the UI once with the default theme; switching only recolours it
         self.style = ThemedStyle(self.root, self.themes["Dark"])
+        self.create_menu()
+        self.create_terminal()
+        self.create_status_bar()
         self.load_theme("Dark")
         
-        # Initialize command system
-        self.command_history = []
-        self.history_index = -1
+        # Position while stepping through the history with Up/Down, and the
+        # Ctrl+R search state ({"match": (number, command) or None})
+        self.history_index = None
+        self.search = None
         self.print_welcome()
         self.bind_shortcuts()
+        self.root.after(OUTPUT_FLUSH_MS, self._flush_output)
+        self.root.after(STATUS_REFRESH_MS, self._refresh_status)
 
     def load_themes(self):
         """Load all themes from themes directory"""
@@ -134,119 +4492,75 @@ class StrayacoinTerminal:
                 with open(os.path.join(themes_dir, f"{name}.json"), "w") as f:
                     json.dump({"name": name, "colors": colors}, f, indent=4)
         
-        for theme_file in os.listdir(themes_dir):
-            if theme_file.endswith(".json"):
-                try:
-                    with open(os.path.join(themes_dir, theme_file), "r", encoding='utf-8') as f:
-                        theme = json.load(f)
-                        self.themes[theme["name"]] = theme["colors"]
-                except Exception as e:
-                    print(f"Error loading theme {theme_file}: {str(e)}")
+        themes, errors = load_theme_registry(themes_dir)
+        self.themes.update(themes)
+        for error in errors:
+            print(error)
 
     def load_theme(self, theme_name):
-        """Apply a theme to the entire interface"""
+        """Recolour the existing widgets and tags in place, keeping scrollback"""
         if theme_name in self.themes:
             self.current_theme = theme_name
-            colors = self.themes[theme_name]
+            theme = self.themes[theme_name]
+            colors = theme["colors"]
             
-            # Configure root window
             self.root.config(bg=colors["background"])
-            
-            # Recreate UI elements with new theme
-            self.create_menu(colors)
-            self.create_terminal(colors)
-            self.create_status_bar(colors)
-            
-            # Update all tags
-            if hasattr(self, 'output'):
-                self.output.tag_config("error", foreground=colors["error"])
-                self.output.tag_config("warning", foreground=colors["warning"])
-                self.output.tag_config("success", foreground=colors["success"])
-                self.output.tag_config("output", foreground=colors["output"])
-
-    def create_menu(self, colors):
-        """Create the menu bar with theme support"""
-        menubar = tk.Menu(self.root, 
-                         bg=colors["background"],
-                         fg=colors["foreground"],
-                         activebackground=colors["statusbar"],
-                         activeforeground=colors["foreground"],
-                         relief='flat')
+            self.style.configure_theme(theme)
+            for menu in self.menus:
+                menu.config(**theme["menu"])
+            self.output.config(**theme["text"])
+            for tag, color in theme["tags"].items():
+                self.output.tag_config(tag, foreground=color)
+            self.prompt.config(foreground=colors["prompt"])
+
+    def create_menu(self):
+        """Create the menu bar; load_theme colours it"""
+        menubar = tk.Menu(self.root, relief='flat')
         
         # File menu
-        file_menu = tk.Menu(menubar, 
-                           tearoff=0,
-                           bg=colors["background"],
-                           fg=colors["foreground"],
-                           activebackground=colors["statusbar"],
-                           activeforeground=colors["foreground"])
+        file_menu = tk.Menu(menubar, tearoff=0)
         file_menu.add_command(label="New Terminal", command=self.new_terminal)
-        file_menu.add_command(label="Exit", command=self.root.quit)
+        file_menu.add_command(label="Exit", command=self.exit_app)
         menubar.add_cascade(label="File", menu=file_menu)
         
         # Edit menu
-        edit_menu = tk.Menu(menubar, 
-                           tearoff=0,
-                           bg=colors["background"],
-                           fg=colors["foreground"],
-                           activebackground=colors["statusbar"],
-                           activeforeground=colors["foreground"])
+        edit_menu = tk.Menu(menubar, tearoff=0)
         edit_menu.add_command(label="Copy", command=self.copy_text)
         edit_menu.add_command(label="Paste", command=self.paste_text)
         edit_menu.add_command(label="Clear", command=self.clear_terminal)
         menubar.add_cascade(label="Edit", menu=edit_menu)
         
         # View menu (themes)
-        view_menu = tk.Menu(menubar, 
-                           tearoff=0,
-                           bg=colors["background"],
-                           fg=colors["foreground"],
-                           activebackground=colors["statusbar"],
-                           activeforeground=colors["foreground"])
-        
-
-        # themes added dynamically based on what is in the themes folder
-        for theme_name in sorted(self.themes.keys()):
-            view_menu.add_command(
-                label=theme_name,
-                command=lambda name=theme_name: self.load_theme(name)
-            )
-        menubar.add_cascade(label="View", menu=view_menu)
-
-        
-
+        self.view_menu = tk.Menu(menubar, tearoff=0)
+        self.fill_theme_menu()
+        menubar.add_cascade(label="View", menu=self.view_menu)
         
         # Help menu
-        help_menu = tk.Menu(menubar, 
-                           tearoff=0,
-                           bg=colors["background"],
-                           fg=colors["foreground"],
-                           activebackground=colors["statusbar"],
-                           activeforeground=colors["foreground"])
+        help_menu = tk.Menu(menubar, tearoff=0)
         help_menu.add_command(label="About", command=self.show_about)
         menubar.add_cascade(label="Help", menu=help_menu)
         
+        self.menus = [menubar, file_menu, edit_menu, self.view_menu, help_menu]
         self.root.config(menu=menubar)
 
-    def create_terminal(self, colors):
-        """Create the terminal-like interface with theme support"""
-        # Main frame
-        if hasattr(self, 'terminal_frame'):
-            self.terminal_frame.destroy()
-        
+    def fill_theme_menu(self):
+        """List the themes in the View menu, based on what is in the themes folder"""
+        self.view_menu.delete(0, tk.END)
+        for theme_name in sorted(self.themes.keys()):
+            self.view_menu.add_command(
+                label=theme_name,
+                command=lambda name=theme_name: self.load_theme(name)
+            )
+
+    def create_terminal(self):
+        """Create the terminal-like interface; load_theme colours it"""
         self.terminal_frame = ttk.Frame(self.root)
         self.terminal_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         
         # Terminal output area
-        if hasattr(self, 'output'):
-            self.output.destroy()
-        
         self.output = scrolledtext.ScrolledText(
             self.terminal_frame,
             wrap=tk.WORD,
-            bg=colors["background"],
-            fg=colors["foreground"],
-            insertbackground=colors["foreground"],
             font=('Consolas', 12),
             state='disabled',
             relief='flat',
@@ -254,51 +4568,40 @@ class StrayacoinTerminal:
             highlightthickness=0
         )
         self.output.pack(fill=tk.BOTH, expand=True)
-        
-        # Configure tags for colored output
-        self.output.tag_config("error", foreground=colors["error"])
-        self.output.tag_config("warning", foreground=colors["warning"])
-        self.output.tag_config("success", foreground=colors["success"])
-        self.output.tag_config("output", foreground=colors["output"])
+        self.output_lines = 0
         
         # Input frame
-        if hasattr(self, 'input_frame'):
-            self.input_frame.destroy()
-        
         self.input_frame = ttk.Frame(self.terminal_frame)
         self.input_frame.pack(fill=tk.X, pady=(5, 0))
         
         # Prompt label
-        if hasattr(self, 'prompt'):
-            self.prompt.destroy()
-        
         self.prompt = ttk.Label(
             self.input_frame,
             text=">>>",
-            foreground=colors["prompt"],
             font=('Consolas', 12)
         )
         self.prompt.pack(side=tk.LEFT)
         
         # Command entry
-        if hasattr(self, 'command_entry'):
-            self.command_entry.destroy()
-        
+        self.command_text = tk.StringVar(self.root)
         self.command_entry = ttk.Entry(
             self.input_frame,
+            textvariable=self.command_text,
             font=('Consolas', 12)
         )
         self.command_entry.pack(fill=tk.X, expand=True, padx=5)
         self.command_entry.bind("<Return>", self.execute_command)
         self.command_entry.bind("<Up>", self.prev_command)
         self.command_entry.bind("<Down>", self.next_command)
+        self.command_entry.bind("<Tab>", self.complete_command)
+        self.command_entry.bind("<Control-r>", self.reverse_search)
+        self.command_entry.bind("<Escape>", self.cancel_search)
+        # Typing during a reverse search narrows it
+        self.command_text.trace_add("write", self.show_search)
         self.command_entry.focus()
 
-    def create_status_bar(self, colors):
-        """Create the status bar at the bottom with theme support"""
-        if hasattr(self, 'status'):
-            self.status.destroy()
-        
+    def create_status_bar(self):
+        """Create the status bar at the bottom; its colours come from the ttk style"""
         self.status = ttk.Label(
             self.root,
             text="Ready",
@@ -311,11 +4614,11 @@ class StrayacoinTerminal:
 
     def bind_shortcuts(self):
         """Bind keyboard shortcuts including Esc to stop mining"""
-        self.root.bind("<Control-c>", lambda e: self.copy_text())
+        self.root.bind("<Control-c>", self.copy_or_interrupt)
         self.root.bind("<Control-v>", lambda e: self.paste_text())
         self.root.bind("<Control-l>", lambda e: self.clear_terminal())
         self.root.bind("<Control-n>", lambda e: self.new_terminal())
-        self.root.bind("<Escape>", self.stop_mining)
+        self.root.bind("<Escape>", self.engine.stop_mining)
 
     def print_welcome(self):
         """Print welcome message"""
@@ -328,11 +4631,39 @@ Type "help" for available commands.
         self.print_prompt()
 
     def print_output(self, text, tag="output"):
-        """Print text to the output area"""
-        self.output.config(state='normal')
-        self.output.insert(tk.END, text, tag)
-        self.output.see(tk.END)
-        self.output.config(state='disabled')
+        """Queue text for the output area; safe to call from any thread"""
+        self.output_queue.put(text, tag)
+
+    def _flush_output(self):
+        """Write queued output to the widget in one insert per frame"""
+        try:
+            chunks = self.output_queue.drain()
+            if chunks:
+                args = []
+                for text, tag in chunks:
+                    args += [text, tag]
+                text = "".join(args[::2])
+                self.output_lines += text.count("\n")
+                self.scrollback_log.write(text)
+                self.output.config(state='normal')
+                self.output.insert(tk.END, *args)
+                self._trim_scrollback()
+                self.output.see(tk.END)
+                self.output.config(state='disabled')
+                self.scrollback_log.flush()
+            self.root.after(OUTPUT_FLUSH_MS, self._flush_output)
+        except tk.TclError:
+            # Window was closed
+            pass
+
+    def _trim_scrollback(self):
+        """Drop the oldest lines once the widget grows past its limit plus some slack"""
+        slack = max(self.scrollback_limit // 10, 100)
+        if self.output_lines <= self.scrollback_limit + slack:
+            return
+        excess = self.output_lines - self.scrollback_limit
+        self.output.delete("1.0", f"{excess + 1}.0")
+        self.output_lines -= excess
 
     def print_prompt(self):
         """Print the prompt"""
@@ -340,15 +4671,16 @@ Type "help" for available commands.
 
     def execute_command(self, event=None):
         """Execute the entered command"""
+        if self.search is not None:
+            self.accept_search()
         command = self.command_entry.get().strip()
         self.command_entry.delete(0, tk.END)
         
         if not command:
             return
         
-        # Add command to history
-        self.command_history.append(command)
-        self.history_index = len(self.command_history)
+        # The engine stores the command in the shared history
+        self.history_index = None
         
         # Print the command in output
         self.print_output(f"{command}\n", "output")
@@ -362,435 +4694,99 @@ Type "help" for available commands.
         # Update status
         self.update_status()
 
+    def register_commands(self):
+        """Add the window commands to the engine's registry, replacing its help and exit"""
+        for command in (
+            Command("theme", self.handle_theme_command,
+                    (CommandArg("name", optional=True, rest=True, keep_case=True),)),
+            Command("scrollback", self.handle_scrollback_command, (CommandArg("options", optional=True, rest=True),)),
+            Command("help", lambda cmd_parts: self.engine.print_help(GUI_HELP)),
+            Command("clear", lambda cmd_parts: self.clear_terminal()),
+            Command("exit", lambda cmd_parts: self.close()),
+        ):
+            self.engine.commands.register(command)
+
     def process_command(self, command):
-        """Process entered commands with mining support"""
-        cmd_parts = command.lower().split()
-        
-        if not cmd_parts:
-            return
-        
-        if cmd_parts[0] == "mine":
-            self.handle_mining_command(cmd_parts)
-        elif cmd_parts[0] == "theme":
-            self.handle_theme_command(cmd_parts)
-        elif cmd_parts[0] == "wallet":
-            self.handle_wallet_command(cmd_parts)
-        elif cmd_parts[0] == "help":
-            self.print_help()
-        elif cmd_parts[0] == "clear":
-            self.clear_terminal()
-        elif cmd_parts[0] == "exit":
-            self.root.quit()
-        elif cmd_parts[0] in ["ls", "dir"]:
-            self.list_directory()
-        elif cmd_parts[0] == "cd" and len(cmd_parts) > 1:
-            self.change_directory(cmd_parts[1])
-        elif cmd_parts[0] == "pwd":
-            self.print_working_directory()
-        elif cmd_parts[0] == "date":
-            self.print_date()
-        elif cmd_parts[0] == "time":
-            self.print_time()
-        else:
-            self.execute_system_command(command)
+        """Run a command through the engine's registry, which holds the window commands too"""
+        self.engine.process_command(command)
 
-    def handle_mining_command(self, cmd_parts):
-        """Handle mining commands with optional -r flag for repeating"""
-        if self.mining_active:
-            self.print_output("Mining already in progress\n", "warning")
-            return
-        
-        try:
-            if "-r" in cmd_parts:
-                repeat_index = cmd_parts.index("-r")
-                blocks = int(cmd_parts[repeat_index + 1]) if len(cmd_parts) > repeat_index + 1 else 1
-                self.mining_repeating = True
-                self.mining_stop_event.clear()
-            else:
-                blocks = int(cmd_parts[1]) if len(cmd_parts) > 1 else 1
-                self.mining_repeating = False
-            
-            self.mining_thread = threading.Thread(
-                target=self.mine_blocks,
-                args=(blocks,),
-                daemon=True
-            )
-            self.mining_thread.start()
-            
-            if self.mining_repeating:
-                self.print_output(f"Starting repeated mining of {blocks} blocks (Press Esc to stop)\n", "success")
-            else:
-                self.print_output(f"Started mining {blocks} blocks\n", "success")
-                
-        except (ValueError, IndexError):
-            self.print_output("Usage: mine [-r] <number_of_blocks>\n", "error")
+    def complete_command(self, event=None):
+        """Tab: complete the command, an address or a line from history"""
+        line = self.command_entry.get()
+        start, candidates = self.engine.complete(line)
+        if candidates:
+            if len(candidates) > 1:
+                self.print_output("  ".join(candidates) + "\n", "output")
+            self.command_entry.delete(start, tk.END)
+            self.command_entry.insert(start, os.path.commonprefix(candidates))
+        return "break"
 
     def toggle_output_mode(self):
         self.output_mode_multiline = not self.output_mode_multiline
 
-    def mine_blocks(self, blocks):
-        """Mine Strayacoin blocks with optimized performance metrics, clean output."""
-    
-        #previous_rms = None
-        #previous_emc_ratio = None
-    
-        def format_rms(rms):
-            return f"{rms:.4f}"
-    
-        def format_emc(emc, rms):
-            if rms > 0:
-                raw_ratio = emc / rms
-                compressed = math.sqrt(raw_ratio)
-    
-                if compressed < 0.01:
-                    display = f"{compressed:.4f}"
-                elif compressed < 1:
-                    display = f"{compressed:.3f}"
-                elif compressed < 100:
-                    display = f"{compressed:.2f}"
-                else:
-                    display = f"{compressed:.1f}"
-    
-                return compressed, display
-            return 0, "0.0000"
-    
-        self.mining_active = True
-        try:
-            while not self.mining_stop_event.is_set():
-                for block in range(1, blocks + 1):
-                    if self.mining_stop_event.is_set():
-                        break
-    
-                    # Mine block
-                    result = subprocess.run(
-                        [self.cli_path, "generate", str(block)],
-                        capture_output=True,
-                        text=True,
-                        check=True
-                    )
-    
-                    # Get network stats once and reuse
-                    stats = self._get_network_stats()
-    
-                    rms = stats["rms"]
-                    emc = stats["emc"]
-                    emc_ratio, emc_display = format_emc(emc, rms)
-    
-                    rms_str = format_rms(rms)
-                    emc_str = emc_display
-    
-                    minedBlocks = 1
-                    
-                    # Save for next round
-                    #previous_rms = rms
-                    #previous_emc_ratio = emc_ratio
-                    
-                    #connectedPeers = self._get_connected_peer_count()
-                    moneySupply = self._get_Money_Supply()
-                    priceOnTradeOgre = self._get_Tradeogre_Ticker(field="price")
-                    bidOnTradeOgre = self._get_Tradeogre_Ticker(field="bid")
-                    askOnTradeOgre = self._get_Tradeogre_Ticker(field="ask")
-                    
-                    output = (
-                        f"Mined Block {minedBlocks}\n"
-                        f"├─ RMS: {rms_str}\n"
-                        f"├─ EMC: {emc_str}\n"
-                        f"├─ Connected Peers: {stats['conpeers']}\n"
-                        f"├────────────────────────────────────────\n"
-                        f"├─ Network Difficulty: {stats['difficulty']:.6f}\n"
-                        f"├─ Network Peers: {stats['netpeers']}\n"
-                        f"├─ Network Hashrate: {stats['hashrate']/1000:,.2f} KH/s\n"
-                        f"├─ Network Money Supply: {moneySupply}\n"
-                        f"├────────────────────────────────────────\n"
-                        f"├─ BTC Price (TradeOgre): {priceOnTradeOgre}\n"
-                        f"├─ BTC Sell (TradeOgre): {bidOnTradeOgre}\n"
-                        f"├─ BTC Buy (TradeOgre): {askOnTradeOgre}\n"
-                         "└────────────────────────────────────────\n"
-                    )
-                    self.print_output(output, "output")
-                    
-                    #add one to the number of mined blocks
-                    minedBlocks + 1
-                    #output = (
-                    #    f"Mined Block {minedBlocks} | Difficulty: {stats['difficulty']:.6f} | RMS: {rms_str} | EMC: {emc_str} | Peers: {stats['peers']} | Net Hashrate: {stats['hashrate']/1000:,.2f} KH/s\n"
-                    #    f"Mined Block {block}/{blocks} | Difficulty: {stats['difficulty']:.6f} | RMS: {rms_str} | EMC: {emc_str} | Peers: {stats['peers']} | Net Hashrate: {stats['hashrate']/1000:,.2f} KH/s\n"
-                    #)
-                    #self.print_output(output, "output")
-    
-                    if result.stdout.strip():
-                        self.print_output(result.stdout + "\n", "output")
-    
-                if not self.mining_repeating:
-                    break
-    
-        except subprocess.CalledProcessError as e:
-            self.print_output(f"Mining error: {e.stderr}\n", "error")
-        finally:
-            self.mining_active = False
-            if self.mining_stop_event.is_set():
-                self.print_output("Mining stopped by user\n", "warning")
-
-    def _get_network_stats(self):
-        """Get all network statistics in one optimized call"""
-        stats = {
-            'difficulty': float('nan'),
-            'netpeers': float('nan'),
-            'conpeers': float('nan'),
-            'hashrate': float('nan'),
-            'rms': float('nan'),
-            'emc': float('nan')
-        }
-
-        try:
-            # Get difficulty and peers first since we need them for hashrate fallback
-            stats['difficulty'] = self._get_network_difficulty()
-            stats['netpeers'] = self._get_network_peer_count()
-            stats['conpeers'] = self._get_connected_peer_count()
-
-            # Get hashrate with optimized fallback
-            stats['hashrate'] = self._get_network_hashrate(stats['difficulty'])
-
-            # Calculate metrics
-            if not math.isnan(stats['difficulty']) and not math.isnan(stats['netpeers']):
-                if stats['netpeers'] > 0 and stats['difficulty'] > 0:
-                    stats['rms'] = 1 / (stats['difficulty'] * stats['conpeers'])
-                    if not math.isnan(stats['hashrate']):
-                        stats['emc'] = stats['hashrate'] / (stats['difficulty'] * stats['netpeers'])
-
-        except Exception as e:
-            self.print_output(f"Network stats error: {str(e)}\n", "error")
-
-        return stats
-
-    def _get_network_difficulty(self):
-            """Get current network difficulty"""
-            try:
-                result = subprocess.run(
-                    [self.cli_path, "getdifficulty"],
-                    capture_output=True,
-                    text=True,
-                    check=True
-                )
-                return float(result.stdout.strip())
-            except:
-                return float('nan')
-
-    def _get_network_hashrate(self, current_difficulty=None):
-        """Optimized hashrate getter with difficulty fallback"""
-        try:
-            result = subprocess.run(
-                [self.cli_path, "getnetworkhashps"],
-                capture_output=True,
-                text=True,
-                encoding='utf-8',
-                check=True
-            )
-            hashrate = float(result.stdout.strip())
-
-            if hashrate <= 0 and current_difficulty is not None:
-                # Use difficulty-based estimation if standard hashrate is 0
-                inversion_factor = 2.5  
-                return current_difficulty * (2**32) / (60 * inversion_factor)
-            return hashrate
-        except:
-            if current_difficulty is not None:
-                return current_difficulty * (2**32) / 60
-            return float('nan')
-
-    def _get_network_peer_count(self):
-        """Get number of network peers from explorer API"""
-        try:
-            response = requests.get("https://explorer.strayacoin.com/api/getconnectioncount", timeout=5)
-            if response.status_code == 200:
-                return int(response.text)
-            return float('nan')
-        except:
-            return float('nan')
-
-    def _get_Money_Supply(self):
-        """Get money supply and format it as an integer with commas."""
-        try:
-            response = requests.get("https://explorer.strayacoin.com/ext/getmoneysupply", timeout=5)
-            if response.status_code == 200:
-                supply = float(response.text)  # Convert response to float first
-                return "{:,.0f}".format(supply)  # Format with commas, no decimals
-            return "N/A"
-        except:
-            return "N/A"
-
-   
-    def _get_Tradeogre_Ticker(self, field="price"):
-        """Get NAH-BTC market data from TradeOgre and return a specific field.
-        
-        Args:
-            field (str): Which field to return (e.g., "price", "bid", "ask", "high", "low").
-                        Defaults to "price".
-    
-        Returns:
-            str: Formatted value (e.g., "0.00000003 BTC") or "N/A" if error.
-        """
-        try:
-            response = requests.get("https://tradeogre.com/api/v1/ticker/NAH-BTC", timeout=5)
-            if response.status_code == 200:
-                data = response.json()
-                value = float(data.get(field, 0))  # Get the field (default 0 if missing)
-                return f"{value:.8f} BTC"  # Format to 8 decimal places
-            return "N/A"
-        except:
-            return "N/A"
-
-    def _get_connected_peer_count(self):
-        """Get number of connected peers"""
-        try:
-            result = subprocess.run(
-                [self.cli_path, "getpeerinfo"],
-                capture_output=True,
-                text=True,
-                check=True
-            )
-            peers = json.loads(result.stdout)
-            return len(peers)
-        except:
-            return float('nan')
-
-
-    def stop_mining(self, event=None):
-        """Stop any active mining operation"""
-        if self.mining_active:
-            self.mining_stop_event.set()
-            self.print_output("Stopping mining...\n", "warning")
-        else:
-            self.print_output("No active mining operation\n", "output")
-            
     def handle_theme_command(self, cmd_parts):
         """Handle theme changing commands"""
         if len(cmd_parts) == 1:
             themes = "\n".join(sorted(self.themes.keys()))
             self.print_output(f"Available themes:\n{themes}\n", "output")
-        elif len(cmd_parts) == 2:
-            new_theme = cmd_parts[1].capitalize()
+        else:
+            new_theme = " ".join(cmd_parts[1:])
+            if new_theme.lower() not in {name.lower() for name in self.themes}:
+                # Pick up theme files added since startup; unchanged ones come from the cache
+                self.load_themes()
+                self.fill_theme_menu()
+            new_theme = next((name for name in self.themes if name.lower() == new_theme.lower()), new_theme)
             if new_theme in self.themes:
                 self.load_theme(new_theme)
                 self.print_output(f"Theme changed to {new_theme}\n", "success")
             else:
                 self.print_output(f"Theme {new_theme} not found\n", "error")
 
-    def handle_wallet_command(self, cmd_parts):
-        """Handle wallet-related commands"""
-        if len(cmd_parts) < 2:
-            self.print_output("Wallet commands:\n"
-                           "  balance    - Show wallet balance\n"
-                           "  send <amount> <address>\n"
-                           "  info       - Show wallet info\n", "output")
-            return
-        
-        try:
-            if cmd_parts[1] == "balance":
-                result = subprocess.run(
-                    [self.cli_path, "getbalance"],
-                    capture_output=True,
-                    text=True
-                )
-                self.print_output(f"Wallet balance: {result.stdout}\n", "output")
-            
-            elif cmd_parts[1] == "send" and len(cmd_parts) == 4:
-                amount = cmd_parts[2]
-                address = cmd_parts[3]
-                result = subprocess.run(
-                    [self.cli_path, "sendtoaddress", address, amount],
-                    capture_output=True,
-                    text=True
-                )
-                self.print_output(f"Transaction ID: {result.stdout}\n", "success")
-            
-            elif cmd_parts[1] == "info":
-                result = subprocess.run(
-                    [self.cli_path, "getwalletinfo"],
-                    capture_output=True,
-                    text=True
-                )
-                self.print_output(result.stdout + "\n", "output")
-            
-            else:
-                self.print_output("Invalid wallet command\n", "error")
-        
-        except Exception as e:
-            self.print_output(f"Wallet error: {str(e)}\n", "error")
-
-    def execute_system_command(self, command):
-        """Execute system commands"""
-        try:
-            result = subprocess.run(
-                command,
-                shell=True,
-                capture_output=True,
-                text=True,
-                cwd=os.getcwd()
-            )
-            if result.stdout:
-                self.print_output(result.stdout + "\n", "output")
-            if result.stderr:
-                self.print_output(result.stderr + "\n", "error")
-        except Exception as e:
-            self.print_output(f"Error: {str(e)}\n", "error")
-
-    def print_help(self):
-        """Show enhanced help information"""
-        help_text = """
-Strayacoin Terminal Commands:
-  mine <blocks>       - Mine specified number of blocks once then stop
-  mine -r <blocks>    - Mine specified number of blocks repeatidly until stopped with esc
-  theme [name]        - Change color theme
-  wallet [command]    - Interact with Strayacoin wallet
-  help                - Show this help
-  clear               - Clear the terminal
-  exit                - Exit the application
-
-System Commands:
-  ls/dir              - List directory contents
-  cd <directory>      - Change directory
-  pwd                 - Print working directory
-  date                - Show current date
-  time                - Show current time
-  <any command>       - Execute system command
-"""
-        self.print_output(help_text, "output")
-
-    def list_directory(self):
-        """List directory contents"""
-        try:
-            files = os.listdir()
-            for f in files:
-                self.print_output(f"{f}\n", "output")
-        except Exception as e:
-            self.print_output(f"Error: {str(e)}\n", "error")
+    def handle_scrollback_command(self, cmd_parts):
+        """Show or set the scrollback limit, toggle the history log, or search it"""
+        if len(cmd_parts) == 1:
+            log_state = self.scrollback_log.path if self.scrollback_log.enabled else "off"
+            self.print_output(f"Scrollback: {self.scrollback_limit} lines | Log: {log_state}\n", "output")
+        elif cmd_parts[1] == "log" and len(cmd_parts) == 3 and cmd_parts[2] in ("on", "off"):
+            try:
+                if cmd_parts[2] == "on":
+                    self.scrollback_log.enable()
+                    self.print_output(f"Logging output to {self.scrollback_log.path}\n", "success")
+                else:
+                    self.scrollback_log.disable()
+                    self.print_output("Output logging stopped\n", "success")
+            except OSError as e:
+                self.print_output(f"Error: {str(e)}\n", "error")
+        elif cmd_parts[1] == "search" and len(cmd_parts) > 2:
+            pattern = " ".join(cmd_parts[2:])
+            threading.Thread(target=self._search_scrollback, args=(pattern,), daemon=True).start()
+        elif cmd_parts[1].isdigit() and int(cmd_parts[1]) > 0:
+            self.scrollback_limit = int(cmd_parts[1])
+            self.print_output(f"Scrollback limit set to {self.scrollback_limit} lines\n", "success")
+        else:
+            self.print_output("Usage: scrollback [lines | log on|off | search <text>]\n", "error")
 
-    def change_directory(self, directory):
-        """Change working directory"""
+    def _search_scrollback(self, pattern):
+        """Search the history log off the Tk thread and print matches"""
         try:
-            os.chdir(directory)
-            self.print_output(f"Changed directory to: {os.getcwd()}\n", "output")
-            self.update_status()
-        except Exception as e:
+            matches = [f"{number:>8}: {line}\n" for number, line in self.scrollback_log.search(pattern)]
+        except OSError as e:
             self.print_output(f"Error: {str(e)}\n", "error")
-
-    def print_working_directory(self):
-        """Print current working directory"""
-        self.print_output(f"{os.getcwd()}\n", "output")
-
-    def print_date(self):
-        """Print current date"""
-        self.print_output(f"{datetime.now().strftime('%Y-%m-%d')}\n", "output")
-
-    def print_time(self):
-        """Print current time"""
-        self.print_output(f"{datetime.now().strftime('%H:%M:%S')}\n", "output")
+            return
+        if not matches:
+            self.print_output(f"No matches for '{pattern}'\n", "warning")
+            return
+        self.print_output("".join(matches), "output")
+        if len(matches) >= SCROLLBACK_SEARCH_LIMIT:
+            self.print_output(f"Showing first {SCROLLBACK_SEARCH_LIMIT} matches\n", "warning")
 
     def clear_terminal(self, event=None):
         """Clear the terminal"""
+        self.output_queue.clear()
         self.output.config(state='normal')
         self.output.delete(1.0, tk.END)
         self.output.config(state='disabled')
+        self.output_lines = 0
         self.print_prompt()
 
     def copy_text(self, event=None):
@@ -802,6 +4798,13 @@ System Commands:
         except tk.TclError:
             pass
 
+    def copy_or_interrupt(self, event=None):
+        """Ctrl+C copies a selection, otherwise it interrupts the foreground system command"""
+        if self.output.tag_ranges(tk.SEL):
+            self.copy_text()
+        elif self.engine.interrupt_foreground():
+            self.print_output("^C\n", "warning")
+
     def paste_text(self, event=None):
         """Paste text from clipboard"""
         try:
@@ -811,9 +4814,23 @@ System Commands:
             pass
 
     def new_terminal(self):
-        """Open a new terminal window"""
-        new_window = tk.Toplevel(self.root)
-        StrayacoinTerminal(new_window)
+        """Open a new terminal window sharing the first window's block notifications"""
+        main = self.parent or self
+        main.windows.append(StrayacoinTerminal(tk.Toplevel(main.root), parent=main))
+
+    def close(self):
+        """Close this window and release its engine; the first window takes the others with it"""
+        for window in list(self.windows):
+            window.close()
+        if self.parent is not None and self in self.parent.windows:
+            self.parent.windows.remove(self)
+        self.engine.close()
+        self.scrollback_log.disable()
+        self.root.destroy()
+
+    def exit_app(self):
+        """Close every window and end the main loop"""
+        (self.parent or self).close()
 
     def show_about(self):
         """Show about information"""
@@ -826,26 +4843,299 @@ A custom terminal for Strayacoin mining and wallet management
 
     def prev_command(self, event):
         """Navigate to previous command in history"""
-        if self.command_history and self.history_index > 0:
-            self.history_index -= 1
+        history = self.engine.command_history.entries()
+        index = len(history) if self.history_index is None else self.history_index
+        if index > 0:
+            self.history_index = index - 1
             self.command_entry.delete(0, tk.END)
-            self.command_entry.insert(0, self.command_history[self.history_index])
+            self.command_entry.insert(0, history[self.history_index])
 
     def next_command(self, event):
         """Navigate to next command in history"""
-        if self.command_history and self.history_index < len(self.command_history) - 1:
-            self.history_index += 1
-            self.command_entry.delete(0, tk.END)
-            self.command_entry.insert(0, self.command_history[self.history_index])
-        elif self.command_history and self.history_index == len(self.command_history) - 1:
-            self.history_index += 1
+        if self.history_index is None:
+            return
+        history = self.engine.command_history.entries()
+        self.history_index += 1
+        self.command_entry.delete(0, tk.END)
+        if self.history_index < len(history):
+            self.command_entry.insert(0, history[self.history_index])
+        else:
+            self.history_index = None
+
+    def reverse_search(self, event=None):
+        """Ctrl+R: find the newest command containing the typed text; again for older ones"""
+        if self.search is None:
+            self.search = {"match": None}
+            self.show_search()
+        elif self.search["match"]:
+            self.show_search(before=self.search["match"][0])
+        return "break"
+
+    def show_search(self, *args, before=None):
+        """Search again for the entry text and show the match in the prompt"""
+        if self.search is None:
+            return
+        query = self.command_entry.get()
+        match = self.engine.command_history.search(query, before)
+        if match is not None or before is None:
+            self.search["match"] = match
+        failing = "failing " if match is None else ""
+        shown = self.search["match"][1] if self.search["match"] else ""
+        self.prompt.config(text=f"({failing}reverse-i-search)'{query}': {shown}")
+
+    def accept_search(self):
+        """Leave search mode with the match in the entry"""
+        match = self.search["match"]
+        self.search = None
+        self.prompt.config(text=">>>")
+        if match:
             self.command_entry.delete(0, tk.END)
+            self.command_entry.insert(0, match[1])
+
+    def cancel_search(self, event=None):
+        """Esc leaves search mode keeping the typed text, otherwise it stops mining"""
+        if self.search is None:
+            return None
+        self.search = None
+        self.prompt.config(text=">>>")
+        return "break"
 
     def update_status(self):
         """Update the status bar"""
-        self.status.config(text=f"Current directory: {os.getcwd()} | Strayacoin CLI: {os.path.exists(self.cli_path)}")
+        engine = self.engine
+        text = f"Current directory: {os.getcwd()} | Strayacoin CLI: {os.path.exists(engine.cli_path)} | Node: {engine.node.transport.upper()}"
+        metrics = engine.metrics.status_line()
+        if metrics:
+            text += f" | {metrics}"
+        pending = len(engine.wallet_jobs.pending())
+        if pending:
+            text += f" | Wallet: {pending} pending"
+        running = len(engine.shell_jobs.running())
+        if running:
+            text += f" | Jobs: {running}"
+        self.status.config(text=text)
+
+    def _refresh_status(self):
+        """Keep the live metrics in the status bar current"""
+        try:
+            self.update_status()
+            self.root.after(STATUS_REFRESH_MS, self._refresh_status)
+        except tk.TclError:
+            # Window was closed
+            pass
+
+def run_output_benchmark(lines=200000):
+    """Flood the terminal from a worker thread and report UI frame latency"""
+    load_tk()
+    root = tk.Tk()
+    app = StrayacoinTerminal(root)
+    frame_ms = 16
+    delays = []
+    state = {"last": time.perf_counter(), "done": False}
+
+    def flood():
+        line = "├─ Network Hashrate: 17,476.27 KH/s\n"
+        for i in range(lines):
+            app.print_output(line, "output" if i % 15 else "success")
+        state["done"] = True
+
+    def tick():
+        now = time.perf_counter()
+        delays.append((now - state["last"]) * 1000 - frame_ms)
+        state["last"] = now
+        if state["done"] and app.output_queue.queue.empty():
+            root.quit()
+        else:
+            root.after(frame_ms, tick)
+
+    start = time.perf_counter()
+    threading.Thread(target=flood, daemon=True).start()
+    root.after(frame_ms, tick)
+    root.mainloop()
+    elapsed = time.perf_counter() - start
+    delays.sort()
+    pick = lambda q: delays[min(len(delays) - 1, int(q * len(delays)))]
+    print(f"{lines} lines in {elapsed:.2f}s, {len(delays)} frames")
+    print(f"frame delay p50 {pick(0.50):.1f}ms  p95 {pick(0.95):.1f}ms  p99 {pick(0.99):.1f}ms  max {delays[-1]:.1f}ms")
+    app.close()
+
+class StreamOutput:
+    """Output sink writing (text, tag) chunks to a stream and an optional log"""
+    def __init__(self, stream=None, log_path=None):
+        self.stream = stream
+        self.log = ScrollbackLog(log_path) if log_path else None
+        self.lock = threading.Lock()
+        if self.log:
+            self.log.enable()
+
+    def write(self, text, tag="output"):
+        with self.lock:
+            if self.stream is not None:
+                self.stream.write(text)
+                self.stream.flush()
+            if self.log:
+                self.log.write(text)
+                self.log.flush()
+
+    def close(self):
+        if self.log:
+            self.log.disable()
+
+def run_headless(commands=(), log_path=None, quiet=False):
+    """Run the terminal without Tk, reading commands from the list and then stdin.
+
+    Output streams to stdout unless quiet, and to log_path when given. At the end
+    of input the runner waits for mining, wallet calls and system commands to
+    finish; Ctrl+C stops them.
+    """
+    output = StreamOutput(None if quiet else sys.stdout, log_path)
+    engine = TerminalEngine(output.write)
+    interactive = sys.stdin.isatty() and not commands
+    try:
+        for command in commands:
+            output.write(f">>> {command}\n")
+            engine.process_command(command)
+        if not commands:
+            while not engine.exit_requested.is_set():
+                if interactive:
+                    output.write(">>> ")
+                line = sys.stdin.readline()
+                if not line:
+                    break
+                engine.process_command(line.strip())
+        while engine.busy and not engine.exit_requested.is_set():
+            time.sleep(0.2)
+    except KeyboardInterrupt:
+        engine.stop_mining()
+        engine.shell_jobs.shutdown()
+        for worker in engine.orchestrator.workers.values():
+            if worker.thread:
+                worker.thread.join(RPC_TIMEOUT)
+        if engine.mining_thread:
+            engine.mining_thread.join(RPC_TIMEOUT)
+    finally:
+        engine.close()
+        output.close()
+
+def run_analyze_benchmark(samples=2000000, window=ANALYZE_WINDOW):
+    """Time analyze_history on synthetic records and report the result"""
+    import numpy as np
+    rng = np.random.default_rng(1)
+    table = np.empty((samples, len(HISTORY_FIELDS)))
+    table[:, HISTORY_FIELDS.index("timestamp")] = time.time() - 60 * samples + 60 * np.arange(samples)
+    table[:, HISTORY_FIELDS.index("height")] = np.arange(samples)
+    table[:, HISTORY_FIELDS.index("difficulty")] = np.exp(np.cumsum(rng.normal(0, 0.01, samples))) * 0.0002
+    table[:, HISTORY_FIELDS.index("hashrate")] = np.exp(np.cumsum(rng.normal(0, 0.01, samples))) * 17000
+    table[:, HISTORY_FIELDS.index("conpeers")] = rng.integers(1, 9, samples)
+    table[:, HISTORY_FIELDS.index("netpeers")] = rng.integers(8, 40, samples)
+    table[:, HISTORY_FIELDS.index("rms")] = 1 / (table[:, 2] * table[:, 4])
+    table[:, HISTORY_FIELDS.index("emc")] = table[:, 3] / (table[:, 2] * table[:, 5])
+    price = np.exp(np.cumsum(rng.normal(0, 0.02, samples))) * 3e-8
+    price[rng.random(samples) < 0.01] = np.nan
+    table[:, HISTORY_FIELDS.index("price")] = price
+
+    start = time.perf_counter()
+    analyze_history(table, window)
+    elapsed = time.perf_counter() - start
+    print(f"analyze: {samples:,} samples x {len(ANALYZE_FIELDS)} fields in {elapsed * 1000:.0f} ms")
+
+def run_schedule_replay(path=HISTORY_FILE, hashrate=None, policy=None):
+    """Replay stored history through the adaptive scheduler and compare with blind mining"""
+    store = SnapshotStore(path)
+    records = [store.record_at(index) for index in range(len(store))]
+    if len(records) < 2:
+        print(f"Not enough history in {store.path} to replay")
+        return
+    if hashrate is None:
+        # Default to a miner with 5% of the mean recorded network hashrate
+        hashrates = [record["hashrate"] for record in records if record["hashrate"] > 0]
+        hashrate = 0.05 * sum(hashrates) / len(hashrates) if hashrates else 1e6
+    results = replay_schedule(records, hashrate, policy)
+    print(f"Replayed {len(records)} records at {hashrate:,.0f} H/s")
+    for name, result in results.items():
+        share = result["paused"] / result["elapsed"] if result["elapsed"] > 0 else 0.0
+        print(f"{name:<9} {result['blocks']:>8} blocks  {result['value']:.8f} BTC  paused {share:.1%}")
+
+def run_exporter(port=METRICS_PORT, host=METRICS_HOST):
+    """Poll network stats and serve them as Prometheus metrics without a display"""
+    metrics = Metrics()
+    node = NodeClient("Strayacoin-cli.exe", metrics=metrics)
+    collector = StatsCollector(node, AsyncFetcher(), MarketDataCache(TRADEOGRE_TICKER_URL), metrics)
+    exporter = MetricsExporter(metrics, host, port)
+    collector.listeners.append(exporter.publish)
+    poller = StatsPoller(collector.collect)
+    events = ChainEvents(node)
+
+    def refresh(topic, value):
+        poller.interval = NOTIFY_FALLBACK_INTERVAL
+        if topic == "block":
+            poller.poke()
+
+    events.listeners.append(refresh)
+    events.start()
+    poller.start()
+    print(f"Serving metrics on {exporter.address} (node via {node.transport.upper()})")
+    try:
+        exporter.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        events.stop()
+        poller.stop()
+        exporter.server.server_close()
+        node.close()
 
 if __name__ == "__main__":
+    if "--bench-output" in sys.argv:
+        run_output_benchmark()
+        sys.exit(0)
+    if "--bench-analyze" in sys.argv:
+        index = sys.argv.index("--bench-analyze")
+        run_analyze_benchmark(int(sys.argv[index + 1]) if len(sys.argv) > index + 1 else 2000000)
+        sys.exit(0)
+    if "--replay-schedule" in sys.argv:
+        # --replay-schedule [history file] [hashrate] [setting=value ...]
+        args = sys.argv[sys.argv.index("--replay-schedule") + 1:]
+        policy = SchedulePolicy()
+        for arg in [arg for arg in args if "=" in arg]:
+            policy.set(*arg.split("=", 1))
+        args = [arg for arg in args if "=" not in arg]
+        run_schedule_replay(
+            args[0] if args else HISTORY_FILE,
+            float(args[1]) if len(args) > 1 else None,
+            policy
+        )
+        sys.exit(0)
+    if "--exporter" in sys.argv:
+        index = sys.argv.index("--exporter")
+        port = int(sys.argv[index + 1]) if len(sys.argv) > index + 1 else METRICS_PORT
+        run_exporter(port)
+        sys.exit(0)
+    if "--stub-daemon" in sys.argv:
+        # Serve a fake node on the RPC port so the terminal can be exercised offline
+        stub = StubRPCDaemon(port=DEFAULT_RPC_PORT, notify_port=NOTIFY_PORT)
+        print(f"Stub daemon listening on 127.0.0.1:{stub.port} (rpcuser=stub rpcpassword=stub)")
+        stub.server.serve_forever()
+        sys.exit(0)
+    if "--notify" in sys.argv:
+        # --notify <block|tx> <hash> [port], for blocknotify=... --notify block %s
+        args = sys.argv[sys.argv.index("--notify") + 1:]
+        send_notification(args[0], args[1], int(args[2]) if len(args) > 2 else NOTIFY_PORT)
+        sys.exit(0)
+    if "--headless" in sys.argv:
+        # --headless [--log file] [--quiet] [command ...], otherwise commands come from stdin
+        args = sys.argv[sys.argv.index("--headless") + 1:]
+        log_path = None
+        if "--log" in args:
+            index = args.index("--log")
+            log_path = args[index + 1]
+            del args[index:index + 2]
+        quiet = "--quiet" in args
+        if quiet:
+            args.remove("--quiet")
+        run_headless(args, log_path, quiet)
+        sys.exit(0)
+    load_tk()
     root = tk.Tk()
     app = StrayacoinTerminal(root)
     root.mainloop()
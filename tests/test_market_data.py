@@ -0,0 +1,149 @@
+"""MarketDataCache against a local HTTP server that honours conditional GETs"""
+import http.server
+import json
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Strayacoin_Terminal import AsyncFetcher, FetchRequest, MarketDataCache
+
+
+class TickerHandler(http.server.BaseHTTPRequestHandler):
+    """Serves server.document with server.etag, answering 304 on a matching If-None-Match"""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.seen.append(dict(self.headers))
+        self.server.clients.append(self.client_address)
+        if self.server.drop_next:
+            # Hang up without a reply, like a server whose keep-alive ran out
+            self.server.drop_next = False
+            self.close_connection = True
+            return
+        if self.server.status != 200:
+            self.send_response(self.server.status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.headers.get("If-None-Match") == self.server.etag:
+            self.send_response(304)
+            self.send_header("ETag", self.server.etag)
+            self.end_headers()
+            return
+        body = json.dumps(self.server.document).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", self.server.etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MarketDataCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), TickerHandler)
+        self.server.daemon_threads = True
+        self.server.seen = []
+        self.server.clients = []
+        self.server.drop_next = False
+        self.server.status = 200
+        self.server.etag = '"v1"'
+        self.server.document = {"price": "0.00000003", "bid": "0.00000002", "ask": "0.00000004"}
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        url = f"http://127.0.0.1:{self.server.server_address[1]}/api/v1/ticker/NAH-BTC"
+        self.cache = MarketDataCache(url, ttl=60, timeout=5)
+        self.fetcher = AsyncFetcher()
+        self.addCleanup(self.fetcher.close)
+
+    def refresh(self):
+        """Fetch the way StatsCollector does and hand the response to the cache"""
+        request = FetchRequest(self.cache.url, headers=self.cache.conditional_headers(), timeout=self.cache.timeout)
+        result = self.fetcher.fetch_all_sync({"ticker": request})["ticker"]
+        self.assertIsNone(result.error)
+        self.cache.accept(result.status, result.body, result.headers)
+        return result
+
+    def test_first_fetch_stores_document_and_etag(self):
+        self.assertTrue(self.cache.expired)
+        result = self.refresh()
+
+        self.assertEqual(result.status, 200)
+        self.assertNotIn("If-None-Match", self.server.seen[0])
+        self.assertEqual(self.cache.etag, '"v1"')
+        self.assertFalse(self.cache.expired)
+        self.assertEqual(self.cache.field("price"), "0.00000003 BTC")
+
+    def test_revalidation_sends_etag_and_keeps_document_on_304(self):
+        self.refresh()
+        self.cache.fetched_at -= 120
+        self.assertTrue(self.cache.expired)
+        self.assertIn("(stale", self.cache.field("price"))
+
+        result = self.refresh()
+
+        self.assertEqual(result.status, 304)
+        self.assertEqual(self.server.seen[1].get("If-None-Match"), '"v1"')
+        self.assertFalse(self.cache.expired)
+        self.assertIsNone(self.cache.last_error)
+        self.assertEqual(self.cache.field("bid"), "0.00000002 BTC")
+
+    def test_changed_etag_replaces_document(self):
+        self.refresh()
+        self.server.etag = '"v2"'
+        self.server.document = {"price": "0.00000005"}
+
+        result = self.refresh()
+
+        self.assertEqual(result.status, 200)
+        self.assertEqual(self.cache.etag, '"v2"')
+        self.assertEqual(self.cache.field("price"), "0.00000005 BTC")
+
+    def test_error_status_keeps_last_document(self):
+        self.refresh()
+        self.cache.fetched_at -= 120
+        self.server.status = 503
+
+        self.refresh()
+
+        self.assertEqual(self.cache.last_error, "HTTP 503")
+        self.assertTrue(self.cache.expired)
+        self.assertIn("0.00000003 BTC (stale", self.cache.field("price"))
+
+    def test_connection_is_kept_alive_between_fetches(self):
+        self.refresh()
+        self.cache.fetched_at -= 120
+        self.refresh()
+        self.server.etag = '"v2"'
+        self.refresh()
+
+        self.assertEqual(len(self.server.clients), 3)
+        self.assertEqual(len(set(self.server.clients)), 1)
+
+    def test_request_on_dropped_connection_is_sent_again(self):
+        self.refresh()
+        self.cache.fetched_at -= 120
+        self.server.drop_next = True
+
+        result = self.refresh()
+
+        self.assertEqual(result.status, 304)
+        self.assertEqual(len(self.server.clients), 3)
+        self.assertEqual(len(set(self.server.clients)), 2)
+
+    def test_304_without_cached_document_is_an_error(self):
+        self.cache.accept(304, b"", {})
+        self.assertEqual(self.cache.last_error, "HTTP 304")
+        self.assertEqual(self.cache.field("price"), "N/A")
+
+
+if __name__ == "__main__":
+    unittest.main()
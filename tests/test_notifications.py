@@ -0,0 +1,145 @@
+"""ChainEvents delivery over the UDP notify port and from ZMQ publishers"""
+import hashlib
+import os
+import socket
+import sys
+import time
+import types
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Strayacoin_Terminal import ChainEvents, NodeClient, RPCBackend, StubRPCDaemon, send_notification
+
+
+def free_udp_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(condition, timeout=3):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+class FakeSubscriber:
+    """Replays queued multipart messages like a connected zmq SUB socket"""
+
+    def __init__(self, messages):
+        self.messages = messages
+        self.connected = []
+        self.closed = False
+
+    def connect(self, address):
+        self.connected.append(address)
+
+    def setsockopt(self, option, value):
+        pass
+
+    def poll(self, timeout):
+        if self.messages:
+            return 1
+        time.sleep(timeout / 1000)
+        return 0
+
+    def recv_multipart(self):
+        return self.messages.pop(0)
+
+    def close(self, linger=None):
+        self.closed = True
+
+
+def fake_zmq(subscriber):
+    context = types.SimpleNamespace(socket=lambda kind: subscriber)
+    return types.SimpleNamespace(
+        SUB=2, SUBSCRIBE=6,
+        Context=types.SimpleNamespace(instance=lambda: context),
+    )
+
+
+class ChainEventsTestCase(unittest.TestCase):
+    def start_daemon(self, **kwargs):
+        daemon = StubRPCDaemon(port=0, **kwargs).start()
+        self.addCleanup(daemon.server.server_close)
+        self.addCleanup(daemon.server.shutdown)
+        rpc = RPCBackend(**daemon.credentials)
+        self.addCleanup(rpc.close)
+        return daemon, NodeClient("Strayacoin-cli", rpc=rpc)
+
+    def start_events(self, node, port):
+        self.received = []
+        events = ChainEvents(node, port=port)
+        events.listeners.append(lambda topic, value: self.received.append((topic, value)))
+        events.start()
+        self.addCleanup(events.thread.join, 2)
+        self.addCleanup(events.stop)
+        self.assertTrue(wait_for(lambda: events.live))
+        return events
+
+
+class UDPTest(ChainEventsTestCase):
+    def test_notifications_reach_listeners(self):
+        port = free_udp_port()
+        daemon, node = self.start_daemon()
+        events = self.start_events(node, port)
+
+        send_notification("block", "ab" * 32, port)
+        send_notification("tx", "cd" * 32, port)
+        send_notification("other", "ef" * 32, port)
+
+        self.assertTrue(wait_for(lambda: len(self.received) == 2))
+        self.assertEqual(self.received, [("block", "ab" * 32), ("tx", "cd" * 32)])
+        self.assertEqual(events.counts, {"block": 1, "tx": 1})
+        self.assertEqual(events.source, f"udp 127.0.0.1:{port}")
+
+    def test_generate_on_stub_daemon_notifies(self):
+        port = free_udp_port()
+        daemon, node = self.start_daemon(notify_port=port)
+        events = self.start_events(node, port)
+
+        hashes = node.call("generate", 2)
+
+        self.assertTrue(wait_for(lambda: events.counts["block"] == 2))
+        self.assertEqual([value for topic, value in self.received], hashes)
+
+    def test_udp_used_when_zmq_is_not_installed(self):
+        port = free_udp_port()
+        daemon, node = self.start_daemon(handlers={
+            "getzmqnotifications": lambda: [{"type": "pubhashblock", "address": "tcp://127.0.0.1:28332"}],
+        })
+        with mock.patch.dict(sys.modules, {"zmq": None}):
+            events = self.start_events(node, port)
+
+        self.assertEqual(events.source, f"udp 127.0.0.1:{port}")
+
+
+class ZMQTest(ChainEventsTestCase):
+    def test_published_block_and_tx_reach_listeners(self):
+        raw_tx = bytes.fromhex("0100000000000000000000")
+        subscriber = FakeSubscriber([[b"hashblock", bytes.fromhex("12" * 32), b"\x00"], [b"rawtx", raw_tx, b"\x01"]])
+        daemon, node = self.start_daemon(handlers={
+            "getzmqnotifications": lambda: [
+                {"type": "pubhashblock", "address": "tcp://127.0.0.1:28332"},
+                {"type": "pubrawtx", "address": "tcp://127.0.0.1:28332"},
+            ],
+        })
+        with mock.patch.dict(sys.modules, {"zmq": fake_zmq(subscriber)}):
+            events = self.start_events(node, free_udp_port())
+            self.assertTrue(wait_for(lambda: len(self.received) == 2))
+            events.stop()
+            events.thread.join(2)
+
+        txid = hashlib.sha256(hashlib.sha256(raw_tx).digest()).digest()[::-1].hex()
+        self.assertEqual(self.received, [("block", "12" * 32), ("tx", txid)])
+        self.assertEqual(subscriber.connected, ["tcp://127.0.0.1:28332", "tcp://127.0.0.1:28332"])
+        self.assertTrue(subscriber.closed)
+
+
+if __name__ == "__main__":
+    unittest.main()
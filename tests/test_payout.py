@@ -0,0 +1,150 @@
+"""PayoutRun against the stub daemon: journal resume, recovery and lost sendmany replies"""
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Strayacoin_Terminal import (
+    CancelToken, NodeClient, PayoutRun, RPCBackend, RPCOutcomeUnknown, StubRPCDaemon
+)
+
+ADDRESSES = ["S" + letter * 33 for letter in "abcdefgh"]
+
+
+class PayoutTestCase(unittest.TestCase):
+    def setUp(self):
+        self.sends = []
+        self.wallet = []
+        self.send_delay = 0
+        self.daemon = StubRPCDaemon(port=0, handlers={
+            "sendmany": self.sendmany,
+            "listtransactions": lambda account="*", count=10: self.wallet,
+        }).start()
+        self.addCleanup(self.daemon.server.server_close)
+        self.addCleanup(self.daemon.server.shutdown)
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = os.path.join(self.dir.name, "payouts.csv")
+        self.reports = []
+
+    def sendmany(self, account, amounts, minconf=1, comment=""):
+        txid = f"{len(self.sends) + 1:064x}"
+        self.sends.append((amounts, comment))
+        self.wallet.append({"category": "send", "comment": comment, "txid": txid})
+        time.sleep(self.send_delay)
+        return txid
+
+    def write_rows(self, rows):
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write("address,amount\n")
+            for address, amount in rows:
+                f.write(f"{address},{amount}\n")
+
+    def payout(self, timeout=5, batch_size=2):
+        rpc = RPCBackend(**self.daemon.credentials, timeout=timeout)
+        self.addCleanup(rpc.close)
+        node = NodeClient("Strayacoin-cli", rpc=rpc)
+        return PayoutRun(node, self.path, lambda text, tag: self.reports.append((text, tag)), batch_size)
+
+    def journal(self):
+        with open(self.path + ".journal", "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+
+class ResumeTest(PayoutTestCase):
+    def test_rerun_skips_sent_batches(self):
+        self.write_rows([(address, 1) for address in ADDRESSES[:4]])
+        self.payout().run(CancelToken())
+
+        summary = self.payout().run(CancelToken())
+
+        self.assertEqual(len(self.sends), 2)
+        self.assertIn("0 batches sent, 2 already paid", summary)
+
+    def test_batch_left_sending_is_recovered_from_wallet(self):
+        self.write_rows([(address, 1) for address in ADDRESSES[:4]])
+        run = self.payout()
+        run.run(CancelToken())
+        # As if the run stopped after writing batch 2 as sending
+        run.journal.record({"batch": 2, "state": "sending", "lines": [4, 5]})
+
+        summary = self.payout().run(CancelToken())
+
+        self.assertEqual(len(self.sends), 2)
+        self.assertIn("2 already paid", summary)
+        self.assertEqual(self.journal()[-1], {"batch": 2, "state": "sent", "txid": f"{2:064x}", "recovered": True})
+
+    def test_batch_left_sending_without_wallet_send_is_resent(self):
+        self.write_rows([(address, 1) for address in ADDRESSES[:2]])
+        run = self.payout()
+        run.journal.record({"type": "start", "sha256": run.file_digest(), "batch_size": 2, "rows": 2, "total": "2"})
+        run.journal.record({"batch": 1, "state": "sending", "lines": [2, 3]})
+
+        summary = self.payout().run(CancelToken())
+
+        self.assertEqual(len(self.sends), 1)
+        self.assertIn("1 batches sent", summary)
+
+    def test_changed_file_is_refused(self):
+        self.write_rows([(address, 1) for address in ADDRESSES[:2]])
+        self.payout().run(CancelToken())
+        self.write_rows([(address, 2) for address in ADDRESSES[:2]])
+
+        with self.assertRaises(ValueError):
+            self.payout().run(CancelToken())
+        self.assertEqual(len(self.sends), 1)
+
+
+class UnknownOutcomeTest(PayoutTestCase):
+    def lose_reply(self):
+        self.write_rows([(address, 1) for address in ADDRESSES[:4]])
+        self.send_delay = 1.0
+        with self.assertRaises(RPCOutcomeUnknown):
+            self.payout(timeout=0.3).run(CancelToken())
+        time.sleep(1.0)
+        self.send_delay = 0
+
+    def test_lost_reply_is_journalled_unknown_and_not_resent(self):
+        self.lose_reply()
+
+        self.assertEqual(len(self.sends), 1)
+        self.assertEqual(self.journal()[-1]["state"], "unknown")
+        self.assertEqual(self.journal()[-1]["batch"], 1)
+
+    def test_rerun_refuses_unknown_batch_missing_from_wallet(self):
+        self.lose_reply()
+        self.wallet.clear()
+
+        with self.assertRaises(ValueError):
+            self.payout().run(CancelToken())
+        self.assertEqual(len(self.sends), 1)
+
+    def test_rerun_marks_unknown_batch_sent_once_wallet_lists_it(self):
+        self.lose_reply()
+
+        summary = self.payout().run(CancelToken())
+
+        self.assertEqual(len(self.sends), 2)
+        self.assertIn("1 batches sent, 1 already paid", summary)
+        self.assertTrue(self.sends[1][1].endswith("batch 2"))
+
+
+class ValidateTest(PayoutTestCase):
+    def test_non_finite_amounts_are_errors(self):
+        self.write_rows([(ADDRESSES[0], "Infinity"), (ADDRESSES[1], "NaN"), (ADDRESSES[2], 1)])
+
+        with self.assertRaises(ValueError):
+            self.payout().run(CancelToken())
+
+        errors = [text for text, tag in self.reports if tag == "error"]
+        self.assertEqual(len(errors), 2)
+        self.assertTrue(all("not a finite number" in text for text in errors))
+        self.assertEqual(self.sends, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
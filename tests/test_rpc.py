@@ -0,0 +1,133 @@
+"""RPCBackend and NodeClient against the stub daemon: what is sent once, retried or handed to the CLI"""
+import os
+import socket
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Strayacoin_Terminal import (
+    NodeClient, RPCBackend, RPCError, RPCOutcomeUnknown, RPCUnreachable, StubRPCDaemon
+)
+
+
+class RecordingCLI:
+    """Stands in for CLIBackend and records every call handed to it"""
+
+    def __init__(self):
+        self.calls = []
+
+    def call(self, method, *params, cancel=None):
+        self.calls.append((method,) + params)
+        return "cli"
+
+    def batch(self, calls):
+        self.calls.extend(calls)
+        return [("cli", None) for _ in calls]
+
+    def close(self):
+        pass
+
+
+def closed_port():
+    """A local port nothing listens on"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class RPCTestCase(unittest.TestCase):
+    def start_daemon(self, **kwargs):
+        self.sends = []
+        handlers = {"sendtoaddress": self.record_send}
+        handlers.update(kwargs.pop("handlers", {}))
+        daemon = StubRPCDaemon(port=0, handlers=handlers, **kwargs).start()
+        self.addCleanup(daemon.server.server_close)
+        self.addCleanup(daemon.server.shutdown)
+        return daemon
+
+    def record_send(self, address, amount):
+        self.sends.append((address, amount))
+        return "ab" * 32
+
+    def node(self, daemon, **kwargs):
+        rpc = RPCBackend(**daemon.credentials, **kwargs)
+        self.addCleanup(rpc.close)
+        node = NodeClient("Strayacoin-cli", rpc=rpc)
+        node.cli = RecordingCLI()
+        return node
+
+
+class OutcomeTest(RPCTestCase):
+    def test_lost_reply_to_send_is_outcome_unknown_and_not_resent(self):
+        def slow_send(address, amount):
+            self.record_send(address, amount)
+            time.sleep(1.5)
+            return "ab" * 32
+
+        daemon = self.start_daemon(handlers={"sendtoaddress": slow_send})
+        node = self.node(daemon, timeout=0.5)
+
+        with self.assertRaises(RPCOutcomeUnknown):
+            node.call("sendtoaddress", "SAddr", 1.0)
+        time.sleep(1.5)
+
+        self.assertEqual(self.sends, [("SAddr", 1.0)])
+        self.assertEqual(node.cli.calls, [])
+
+    def test_send_after_idle_spell_uses_fresh_connection(self):
+        daemon = self.start_daemon(server_timeout=0.2)
+        node = self.node(daemon)
+        node.call("getbalance")
+        time.sleep(0.6)
+
+        self.assertEqual(node.call("sendtoaddress", "SAddr", 2.0), "ab" * 32)
+        self.assertEqual(self.sends, [("SAddr", 2.0)])
+        self.assertEqual(node.cli.calls, [])
+
+    def test_read_on_stale_pooled_connection_is_retried(self):
+        daemon = self.start_daemon(server_timeout=0.2)
+        node = self.node(daemon)
+        node.call("getbalance")
+        node.call("getblockcount")
+        time.sleep(0.6)
+
+        self.assertEqual(node.call("getbalance"), 0.0)
+        self.assertEqual(node.cli.calls, [])
+
+    def test_daemon_error_is_raised_without_fallback(self):
+        daemon = self.start_daemon()
+        node = self.node(daemon)
+
+        with self.assertRaises(RPCError) as caught:
+            node.call("nosuchmethod")
+        self.assertNotIsInstance(caught.exception, (RPCUnreachable, RPCOutcomeUnknown))
+        self.assertEqual(node.cli.calls, [])
+
+
+class FallbackTest(RPCTestCase):
+    def unreachable_node(self):
+        rpc = RPCBackend("127.0.0.1", closed_port(), "stub", "stub")
+        node = NodeClient("Strayacoin-cli", rpc=rpc)
+        node.cli = RecordingCLI()
+        return node
+
+    def test_unreachable_daemon_raises_rpc_unreachable(self):
+        rpc = RPCBackend("127.0.0.1", closed_port(), "stub", "stub")
+        with self.assertRaises(RPCUnreachable):
+            rpc.call("sendtoaddress", "SAddr", 1.0)
+
+    def test_call_falls_back_to_cli_only_when_unreachable(self):
+        node = self.unreachable_node()
+        self.assertEqual(node.call("sendtoaddress", "SAddr", 1.0), "cli")
+        self.assertEqual(node.cli.calls, [("sendtoaddress", "SAddr", 1.0)])
+
+    def test_batch_falls_back_to_cli_when_unreachable(self):
+        node = self.unreachable_node()
+        self.assertEqual(node.batch([("getbalance",), ("getblockcount",)]), [("cli", None), ("cli", None)])
+        self.assertEqual(node.cli.calls, [("getbalance",), ("getblockcount",)])
+
+
+if __name__ == "__main__":
+    unittest.main()
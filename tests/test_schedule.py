@@ -0,0 +1,97 @@
+"""AdaptiveScheduler decisions, checked directly and replayed through ReplayNode"""
+import math
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Strayacoin_Terminal import AdaptiveScheduler, NetworkSnapshot, ReplayNode, SchedulePolicy, replay_schedule
+
+HASHRATE = 20000.0
+GOOD_PRICE = 3e-8
+BAD_PRICE = 1e-10
+
+
+def records(prices, difficulty=0.001):
+    """One record a minute at a steady difficulty and network hashrate"""
+    return [
+        {"timestamp": 1000 + 60 * i, "height": i, "difficulty": difficulty, "hashrate": HASHRATE,
+         "conpeers": 4, "netpeers": 10, "price": price}
+        for i, price in enumerate(prices)
+    ]
+
+
+class DecideTest(unittest.TestCase):
+    def snapshot(self, price, difficulty=0.001):
+        return ReplayNode(records([price], difficulty), HASHRATE).network_snapshot()
+
+    def test_no_stats_mines_minimum_batch(self):
+        decision = AdaptiveScheduler(SchedulePolicy(min_batch=2)).decide(None)
+        self.assertTrue(decision.mine)
+        self.assertEqual(decision.batch, 2)
+
+    def test_no_price_mines_minimum_batch(self):
+        decision = AdaptiveScheduler(SchedulePolicy(min_ev=1e-7)).decide(NetworkSnapshot(difficulty=0.001), HASHRATE)
+        self.assertTrue(decision.mine)
+        self.assertEqual(decision.batch, 1)
+        self.assertTrue(math.isnan(decision.ev))
+
+    def test_ev_mode_pauses_below_floor_and_mines_above(self):
+        scheduler = AdaptiveScheduler(SchedulePolicy(min_ev=1e-7))
+
+        low = scheduler.decide(self.snapshot(BAD_PRICE), HASHRATE)
+        self.assertFalse(low.mine)
+        self.assertEqual(low.delay, scheduler.policy.pause)
+
+        high = scheduler.decide(self.snapshot(GOOD_PRICE), HASHRATE)
+        self.assertTrue(high.mine)
+        self.assertEqual(high.batch, scheduler.policy.max_batch)
+
+    def test_threshold_mode_pauses_above_max_difficulty(self):
+        scheduler = AdaptiveScheduler(SchedulePolicy(mode="threshold", max_difficulty=0.01))
+        self.assertFalse(scheduler.decide(self.snapshot(GOOD_PRICE, difficulty=0.02), HASHRATE).mine)
+        self.assertTrue(scheduler.decide(self.snapshot(GOOD_PRICE, difficulty=0.001), HASHRATE).mine)
+
+
+class ReplayTest(unittest.TestCase):
+    def test_adaptive_run_pauses_while_mining_is_unprofitable(self):
+        history = records([GOOD_PRICE] * 60 + [BAD_PRICE] * 60)
+        results = replay_schedule(history, HASHRATE, SchedulePolicy(min_ev=1e-7))
+        adaptive, blind = results["adaptive"], results["blind"]
+
+        self.assertEqual(blind["paused"], 0)
+        self.assertGreater(adaptive["paused"], 0)
+        self.assertLess(adaptive["blocks"], blind["blocks"])
+        # Blocks skipped in the cheap half were worth next to nothing
+        self.assertGreater(adaptive["value"], 0.99 * blind["value"])
+
+    def test_replay_without_floor_matches_blind_mining(self):
+        history = records([GOOD_PRICE] * 30)
+        results = replay_schedule(history, HASHRATE, SchedulePolicy(min_ev=0.0))
+        self.assertEqual(results["adaptive"]["paused"], 0)
+        self.assertGreater(results["adaptive"]["blocks"], 0)
+
+
+class PolicySetTest(unittest.TestCase):
+    def test_values_are_converted_to_field_types(self):
+        policy = SchedulePolicy()
+        policy.set("min_ev", "0.0000001")
+        policy.set("max_batch", "25")
+        self.assertEqual(policy.min_ev, 1e-7)
+        self.assertEqual(policy.max_batch, 25)
+
+    def test_invalid_values_leave_policy_unchanged(self):
+        policy = SchedulePolicy()
+        for name, value in (("min_batch", "0"), ("max_batch", "0"), ("pause", "-1"), ("mode", "greedy")):
+            with self.assertRaises(ValueError):
+                policy.set(name, value)
+        self.assertEqual(policy, SchedulePolicy())
+
+    def test_unknown_field_is_rejected(self):
+        with self.assertRaises(KeyError):
+            SchedulePolicy().set("speed", "1")
+
+
+if __name__ == "__main__":
+    unittest.main()